@@ -1,39 +1,36 @@
-import os, csv
+import os, sys
 import pandas as pd
 
-COST_MATRIX = pd.read_csv('aws/data_transfer_cost_matrix.csv', index_col=0)
-EXP_REGIONS = ['eu-west-1','eu-west-2','us-west-1','us-west-2','us-east-1','us-east-2','ap-norteast-1','ap-norteast-2']
+# The byte accounting and the prices are shared with the extraction of the results in plots/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plots'))
+import byte_accounting
+import cost_model
+
+COST_MATRIX = cost_model.load_data_transfer_costs()
+EXP_REGIONS = cost_model.AWS_REGIONS
 
 DEFAULT_AWS_REGION = 'eu-west-2'
 
 def count_bytes_and_cost(input_file, start, end):
     # Contains: Time,From,To,FromBytes,ToBytes
-    net_data = pd.read_csv(input_file, index_col=0)
+    net_data = pd.read_csv(input_file)
     if '_' in input_file and input_file != 'aws/iftop_eg.csv':
         src_aws_region = input_file.split('_')[1]
     else:
         src_aws_region = DEFAULT_AWS_REGION
     print(f"Input region is: {src_aws_region}")
 
-    # Filter for timesteps at relevant data points
-    net_data = net_data.loc[net_data.index >= start]
-    net_data = net_data.loc[net_data.index <= end]
-
-    # Step 1: Calculate total bytes for each destination region
-    start_bytes_per_destination = {}
-    final_bytes_per_destination = {}
+    # Step 1: Calculate total bytes for each destination region. The counters of iftop are cumulative, so the
+    # bytes of a destination are the increases of its counter during the experiment
+    transfers = byte_accounting.parse_iftop(net_data, bytes_column='ToBytes')
+    sent = byte_accounting.window_bytes(transfers, start * 1000000, end * 1000000)
+    final_bytes_per_destination = sent.groupby(level='dst').sum().to_dict()
     total_bytes = 0
-    for row in net_data.iterrows():
-        dest = row[1]['To']
-        if dest in start_bytes_per_destination.keys():
-            final_bytes_per_destination[dest] = row[1]['ToBytes'] - start_bytes_per_destination[dest]
-        else:
-            start_bytes_per_destination[dest] = row[1]['ToBytes']
     for key in final_bytes_per_destination.keys():
         for region in EXP_REGIONS:
             if region in key:
                 total_bytes += final_bytes_per_destination[key]
-    print(f'Total bytes transfered: {total_bytes}')
+    print(f'Total bytes transfered: {round(total_bytes)}')
 
     # Step 2: Calculate cost
     cur_region_cost = COST_MATRIX.loc[src_aws_region]
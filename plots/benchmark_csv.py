@@ -0,0 +1,191 @@
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+'''
+Shared reader for the CSVs written by the benchmark (see 'ResultWriters' in service/benchmark.cpp).
+The files are read in chunks with explicit dtypes, only the requested columns are kept and rows outside
+of an optional time window are dropped chunk by chunk, so the memory is bounded by what is actually used.
+When a CSV has been converted by tools/columnar.py, the Parquet file next to it is read instead.
+'''
+
+# Number of rows read at a time when streaming through a CSV
+CHUNK_SIZE = 1_000_000
+# Extension of the files written by tools/columnar.py
+COLUMNAR_SUFFIX = ".parquet"
+
+# Same order as kTxnColumns, kEventsColumns and kSummaryColumns in service/benchmark.cpp
+TXN_COLUMNS = ["txn_id", "coordinator", "regions", "partitions", "generator", "restarts", "global_log_pos", "sent_at", "received_at"]
+EVENTS_COLUMNS = ["txn_id", "event", "time", "machine", "home"]
+SUMMARY_COLUMNS = ["committed", "aborted", "not_started", "restarted", "single_home", "foreign_single_home", "multi_home",
+                   "single_partition", "multi_partition", "remaster", "elapsed_time"]
+
+# Names of the TransactionEvent enum in proto/transaction.proto, in the order of their values.
+# The category code of an event is therefore the same as its enum value.
+TRANSACTION_EVENTS = [
+    "ALL",
+    "ENTER_SERVER",
+    "EXIT_SERVER_TO_FORWARDER",
+    "ENTER_FORWARDER",
+    "EXIT_FORWARDER_TO_SEQUENCER",
+    "EXIT_FORWARDER_TO_MULTI_HOME_ORDERER",
+    "ENTER_MULTI_HOME_ORDERER",
+    "ENTER_MULTI_HOME_ORDERER_IN_BATCH",
+    "EXIT_MULTI_HOME_ORDERER_IN_BATCH",
+    "EXIT_MULTI_HOME_ORDERER",
+    "ENTER_SEQUENCER",
+    "EXPECTED_WAIT_TIME_UNTIL_ENTER_LOCAL_BATCH",
+    "ENTER_LOCAL_BATCH",
+    "ENTER_SEQUENCER_IN_BATCH",
+    "EXIT_SEQUENCER_IN_BATCH",
+    "ENTER_LOG_MANAGER_IN_BATCH",
+    "ENTER_LOG_MANAGER_ORDER",
+    "EXIT_LOG_MANAGER",
+    "ENTER_SCHEDULER",
+    "ENTER_SCHEDULER_LO",
+    "ENTER_LOCK_MANAGER",
+    "DEADLOCK_DETECTED",
+    "DISPATCHED",
+    "DISPATCHED_FAST",
+    "DISPATCHED_SLOW",
+    "DISPATCHED_SLOW_DEADLOCKED",
+    "ENTER_WORKER",
+    "GOT_REMOTE_READS",
+    "GOT_REMOTE_READS_DEADLOCKED",
+    "EXIT_WORKER",
+    "RETURN_TO_SERVER",
+    "EXIT_SERVER_TO_CLIENT",
+]
+EVENT_DTYPE = pd.CategoricalDtype(TRANSACTION_EVENTS)
+
+TXN_DTYPES = {
+    "txn_id": "int64",
+    "coordinator": "int64",
+    "regions": "string",
+    "partitions": "string",
+    "generator": "int64",
+    "restarts": "int64",
+    "global_log_pos": "string",
+    "sent_at": "int64",
+    "received_at": "int64",
+}
+EVENTS_DTYPES = {
+    "txn_id": "int64",
+    "event": "string",  # Converted to EVENT_DTYPE after parsing each chunk
+    "time": "int64",
+    "machine": "int64",
+    "home": "int64",
+}
+SUMMARY_DTYPES = {column: "int64" for column in SUMMARY_COLUMNS}
+
+def columnar_path(path):
+    return os.path.splitext(path)[0] + COLUMNAR_SUFFIX
+
+def _source(path):
+    """
+    Returns the Parquet version of a CSV if it exists (and can be read), otherwise the CSV itself.
+    A CSV written again after its conversion (e.g. grown by a resumed fetch) is newer than its
+    Parquet version, which is then out of date and ignored.
+    """
+    parquet_path = columnar_path(path)
+    if not os.path.exists(parquet_path):
+        return path
+    if not os.path.exists(path):
+        return parquet_path
+    if pq is not None and os.path.getmtime(parquet_path) >= os.path.getmtime(path):
+        return parquet_path
+    return path
+
+def _raw_chunks(path, dtypes, usecols, chunksize):
+    source = _source(path)
+    if not source.endswith(COLUMNAR_SUFFIX):
+        yield from pd.read_csv(source, usecols=usecols, dtype={c: dtypes[c] for c in usecols}, chunksize=chunksize)
+        return
+    if pq is None:
+        raise ImportError(f"pyarrow is required to read {source}")
+    # The events are already dictionary-encoded, they are converted to EVENT_DTYPE by the caller
+    casts = {c: dtypes[c] for c in usecols if c != "event"}
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize, columns=usecols):
+        yield batch.to_pandas().astype(casts)
+
+def _read_chunks(path, dtypes, columns, chunksize, window):
+    """
+    Yields typed chunks of a CSV with only the given columns, dropping the rows outside of the window.
+
+    :param window: A list of (column, min value, max value) predicates. A bound of None is ignored.
+    """
+    columns = list(dtypes.keys()) if columns is None else list(columns)
+    window = [(column, lo, hi) for column, lo, hi in window if lo is not None or hi is not None]
+    usecols = columns + [column for column, _, _ in window if column not in columns]
+    for chunk in _raw_chunks(path, dtypes, usecols, chunksize):
+        if window:
+            mask = pd.Series(True, index=chunk.index)
+            for column, lo, hi in window:
+                if lo is not None:
+                    mask &= chunk[column] >= lo
+                if hi is not None:
+                    mask &= chunk[column] <= hi
+            chunk = chunk[mask]
+        if "event" in chunk.columns:
+            events = chunk["event"].astype(EVENT_DTYPE)
+            unknown = chunk["event"].notna() & events.isna()
+            if unknown.any():
+                raise ValueError(f"Unknown transaction event(s) in {path}: {sorted(chunk['event'][unknown].unique())}")
+            chunk = chunk.assign(event=events)
+        yield chunk[columns].reset_index(drop=True)
+
+def _concat(chunks, dtypes, columns):
+    chunks = list(chunks)
+    if not chunks:
+        columns = list(dtypes.keys()) if columns is None else list(columns)
+        return pd.DataFrame({c: pd.Series(dtype=EVENT_DTYPE if c == "event" else dtypes[c]) for c in columns})
+    return pd.concat(chunks, ignore_index=True)
+
+def iter_transactions(path, columns=None, start=None, end=None, chunksize=CHUNK_SIZE):
+    """
+    Yields chunks of a 'transactions.csv' file.
+
+    :param columns: Columns to keep (all of them by default).
+    :param start: If set, only keep the txns sent at or after this time (ns since epoch).
+    :param end: If set, only keep the txns received at or before this time (ns since epoch).
+    """
+    return _read_chunks(path, TXN_DTYPES, columns, chunksize, [("sent_at", start, None), ("received_at", None, end)])
+
+def iter_events(path, columns=None, start=None, end=None, chunksize=CHUNK_SIZE):
+    """
+    Yields chunks of a 'txn_events.csv' file. The 'event' column is a categorical of TRANSACTION_EVENTS.
+
+    :param start: If set, only keep the events that happened at or after this time (ns since epoch).
+    :param end: If set, only keep the events that happened at or before this time (ns since epoch).
+    """
+    return _read_chunks(path, EVENTS_DTYPES, columns, chunksize, [("time", start, end)])
+
+def read_transactions(path, columns=None, start=None, end=None, chunksize=CHUNK_SIZE):
+    """
+    Same as 'iter_transactions', but returns all the kept rows in one DataFrame.
+    """
+    return _concat(iter_transactions(path, columns, start, end, chunksize), TXN_DTYPES, columns)
+
+def read_events(path, columns=None, start=None, end=None, chunksize=CHUNK_SIZE):
+    """
+    Same as 'iter_events', but returns all the kept rows in one DataFrame.
+    """
+    return _concat(iter_events(path, columns, start, end, chunksize), EVENTS_DTYPES, columns)
+
+def read_summary(path, columns=None):
+    """
+    Reads a 'summary.csv' file (one row per generator thread).
+    """
+    columns = SUMMARY_COLUMNS if columns is None else list(columns)
+    dtypes = {c: SUMMARY_DTYPES[c] for c in columns}
+    source = _source(path)
+    if source.endswith(COLUMNAR_SUFFIX):
+        if pq is None:
+            raise ImportError(f"pyarrow is required to read {source}")
+        return pd.read_parquet(source, columns=columns).astype(dtypes)[columns]
+    return pd.read_csv(source, usecols=columns, dtype=dtypes)[columns]
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+'''
+Byte accounting of the network monitors of the machines.
+The monitors either report the bytes sent since their previous sample ('delta' counters: the 'net_traffic' and
+'egress_traffic' logs of the servers) or running totals ('cumulative' counters: the iftop logs of 'aws/').
+Both are turned into the same table of transfers, one row per source, destination and sampling interval:
+    src, dst, start_ns, end_ns, bytes
+The bytes of a run are then those of the intervals overlapping it, prorated at its exact start and end, and
+summed into a (src region x dst region) matrix.
+'''
+
+TRANSFER_COLUMNS = ['src', 'dst', 'start_ns', 'end_ns', 'bytes']
+# Destination of the bytes counted by the monitors that only know the total sent by a machine
+UNKNOWN_DST = ''
+# Sampling interval of a source with a single sample
+DEFAULT_INTERVAL_NS = 1000000000
+
+def from_deltas(time_ns, src, dst, num_bytes):
+    """
+    Transfers of delta counters, where every sample holds the bytes sent since the previous sample of its source.
+    The samples without traffic may be left out, so the interval of a source is its smallest gap between samples.
+
+    :param time_ns: Times of the samples (ns since epoch). The other parameters are the matching sources,
+                    destinations and byte counts, or a single value for all samples.
+    """
+    df = pd.DataFrame({'src': src, 'dst': dst, 'end_ns': np.asarray(time_ns, dtype=np.int64),
+                       'bytes': np.asarray(num_bytes, dtype=np.int64)})
+    times = df[['src', 'end_ns']].drop_duplicates().sort_values(['src', 'end_ns'])
+    gaps = times.groupby('src')['end_ns'].diff()
+    intervals = gaps[gaps > 0].groupby(times['src']).min()
+    df['start_ns'] = df['end_ns'] - df['src'].map(intervals).fillna(DEFAULT_INTERVAL_NS).astype(np.int64)
+    return df[TRANSFER_COLUMNS]
+
+def from_cumulative(time_ns, src, dst, counters):
+    """
+    Transfers of cumulative counters, one running total per (src, dst). A total smaller than the previous one
+    means that the counter was reset in between, so all of it was sent since. The first sample of a pair only
+    gives the starting point of its counter.
+    """
+    df = pd.DataFrame({'src': src, 'dst': dst, 'end_ns': np.asarray(time_ns, dtype=np.int64),
+                       'counter': np.asarray(counters, dtype=np.int64)})
+    df = df.sort_values(['src', 'dst', 'end_ns'], kind='stable')
+    grouped = df.groupby(['src', 'dst'], sort=False)
+    df['start_ns'] = grouped['end_ns'].shift()
+    delta = df['counter'] - grouped['counter'].shift()
+    df['bytes'] = delta.where(delta >= 0, df['counter'])
+    df = df[df['start_ns'].notna()]
+    return df.astype({'start_ns': np.int64, 'bytes': np.int64})[TRANSFER_COLUMNS].reset_index(drop=True)
+
+def parse_egress_traffic(log, src):
+    """
+    Transfers of a per-destination traffic log ('timestamp_ms,dst,bytes_sent', see 'tools/egress_monitor.py').
+    """
+    return from_deltas(log['timestamp_ms'].to_numpy(dtype=np.int64) * 1000000, src, log['dst'].to_numpy(), log['bytes_sent'])
+
+def parse_net_traffic(log, src):
+    """
+    Transfers of a total traffic log ('timestamp_ms,bytes_sent'), whose destination is unknown.
+    """
+    return from_deltas(log['timestamp_ms'].to_numpy(dtype=np.int64) * 1000000, src, UNKNOWN_DST, log['bytes_sent'])
+
+def parse_iftop(log, bytes_column='FromBytes'):
+    """
+    Transfers of an iftop log ('Time,From,To,FromBytes,ToBytes', with the time in ms), which holds the
+    cumulative counters of every pair of hosts.
+
+    :param bytes_column: The column of the counters to use, 'FromBytes' or 'ToBytes'.
+    """
+    return from_cumulative(log['Time'].to_numpy(dtype=np.int64) * 1000000, log['From'].to_numpy(),
+                           log['To'].to_numpy(), log[bytes_column])
+
+def window_bytes(transfers, start_ns, end_ns):
+    """
+    Bytes sent by every (src, dst) between start_ns and end_ns. The bytes of an interval overlapping the start
+    or the end are prorated, assuming that they were sent at a constant rate over the interval.
+
+    :return: A Series indexed by (src, dst).
+    """
+    start = transfers['start_ns'].to_numpy()
+    end = transfers['end_ns'].to_numpy()
+    overlap = np.clip(np.minimum(end, end_ns) - np.maximum(start, start_ns), 0, None)
+    sent = transfers['bytes'].to_numpy() * overlap / np.maximum(end - start, 1)
+    return pd.Series(sent, index=pd.MultiIndex.from_frame(transfers[['src', 'dst']])).groupby(level=[0, 1]).sum()
+
+def byte_matrix(transfers, start_ns, end_ns, region_of, regions):
+    """
+    Computes the (src region x dst region) matrix of the bytes sent between start_ns and end_ns.
+    The bytes with an unknown destination are spread evenly over the other regions. The bytes from or to
+    machines outside of the regions (e.g. the SSH connection of the experimenter) are left out.
+
+    :param region_of: Function giving the region of a machine (as named in the transfers), or None.
+    :param regions: All the regions, in the order of the rows and columns.
+    :return: A DataFrame with the sources as rows and the destinations as columns.
+    """
+    sent = window_bytes(transfers, start_ns, end_ns).reset_index(name='bytes')
+    sent['src_region'] = sent['src'].map(region_of)
+    sent['dst_region'] = sent['dst'].map(region_of)
+    sent = sent[sent['src_region'].notna()]
+
+    known = sent[sent['dst_region'].notna()]
+    matrix = known.pivot_table(index='src_region', columns='dst_region', values='bytes', aggfunc='sum')
+    matrix = matrix.reindex(index=regions, columns=regions, fill_value=0).fillna(0)
+
+    unknown = sent[sent['dst'] == UNKNOWN_DST].groupby('src_region')['bytes'].sum().reindex(regions, fill_value=0)
+    if len(regions) > 1:
+        spread = np.outer(unknown.to_numpy(), np.ones(len(regions))) / (len(regions) - 1)
+        np.fill_diagonal(spread, 0)
+        matrix += spread
+    return matrix
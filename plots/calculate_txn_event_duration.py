@@ -1,57 +1,82 @@
+import numpy as np
 import pandas as pd
 import os
 import argparse
 
+import benchmark_csv
+
 # Constants
 NANO_TO_MS = 1e-6  # Convert nanoseconds to milliseconds
+DELTA_DECIMALS = 3
+# Events that are normally followed by a long wait (e.g. for the next batch)
+DEFAULT_EXCLUDED_PREV_EVENTS = ['ENTER_LOG_MANAGER_IN_BATCH', 'EXIT_SEQUENCER_IN_BATCH']
+DEFAULT_HISTOGRAM_BINS = [-100, -50, -10, 0, 1, 5, 10, 25, 50, 100, 250, 500, 1000]
 
 # Argument parser
 parser = argparse.ArgumentParser(description="Calculate the duration of individual txn phases.")
 parser.add_argument('-if', '--input_file', default='plots/raw_data/ycsb/lat_breakdown/slog/client/0-0/txn_events.csv', help='Path to file with raw txn event data')
 parser.add_argument('-of', '--output_file', default='plots/raw_data/txn_events_duration.csv', help='Path to file where to store the calculated txn event durations')
+parser.add_argument('-st', '--start_time', type=int, default=None, help='Only consider events at or after this time (ns since epoch)')
+parser.add_argument('-et', '--end_time', type=int, default=None, help='Only consider events at or before this time (ns since epoch)')
+parser.add_argument('-min', '--min_delta', type=float, default=-50, help='Deltas below this one (in ms) are considered suspicious (default: -50)')
+parser.add_argument('-max', '--max_delta', type=float, default=100, help='Deltas above this one (in ms) are considered suspicious (default: 100)')
+parser.add_argument('-xp', '--exclude_prev_events', nargs='*', default=DEFAULT_EXCLUDED_PREV_EVENTS, help='Ignore the deltas starting at these events')
+parser.add_argument('-xc', '--exclude_curr_events', nargs='*', default=[], help='Ignore the deltas ending at these events')
+parser.add_argument('-hf', '--histogram_file', default='plots/raw_data/txn_events_delta_histogram.csv', help='Path to file where to store the histograms of the deltas of each pair of consecutive events')
+parser.add_argument('-hb', '--histogram_bins', type=float, nargs='+', default=DEFAULT_HISTOGRAM_BINS, help='Edges of the histogram bins (in ms), the first and last bins are unbounded')
 
 args = parser.parse_args()
 input_file = args.input_file
 output_file = args.output_file
 
-# Load data
-df = pd.read_csv(input_file)
-df = df.sort_values(by=["txn_id", "time"])  # Sort for consistent deltas
-
-#df = df.tail(10000)
-
-# Prepare list to hold deltas
-rows = []
-
-# Group by txn_id and compute deltas
-for txn_id, group in df.groupby("txn_id"):
-    sorted_group = group.sort_values("time")
-    prev_row = None
-    for _, row in sorted_group.iterrows():
-        if prev_row is not None:
-            delta_ns = row["time"] - prev_row["time"]
-            delta_ms = delta_ns * NANO_TO_MS
-            rows.append({
-                "txn_id": txn_id,
-                "prev_event": prev_row["event"],
-                "prev_time": prev_row["time"],
-                "curr_event": row["event"],
-                "curr_time": row["time"],
-                "delta_ms": round(delta_ms, 3)
-            })
-        prev_row = row
-
-# Create a DataFrame of deltas
-delta_df = pd.DataFrame(rows)
-
-# Filter: keep only suspicious deltas
-filtered_df = delta_df[(delta_df["delta_ms"] < -50) | (delta_df["delta_ms"] > 100)]
-filtered_df = filtered_df[(filtered_df["prev_event"] != 'ENTER_LOG_MANAGER_IN_BATCH')]
-filtered_df = filtered_df[(filtered_df["prev_event"] != 'EXIT_SEQUENCER_IN_BATCH')]
+unknown_events = set(args.exclude_prev_events + args.exclude_curr_events) - set(benchmark_csv.TRANSACTION_EVENTS)
+if unknown_events:
+    parser.error(f"Unknown transaction event(s): {sorted(unknown_events)}")
+
+# Load data (only the columns and time window we need)
+df = benchmark_csv.read_events(input_file, ["txn_id", "event", "time"], start=args.start_time, end=args.end_time)
+df = df.sort_values(by=["txn_id", "time"], kind="stable", ignore_index=True)  # Sort for consistent deltas
+
+# Pair every event with the previous event of the same txn
+txn_ids = df["txn_id"].to_numpy()
+curr = np.flatnonzero(txn_ids[1:] == txn_ids[:-1]) + 1
+prev = curr - 1
+delta_df = pd.DataFrame({
+    "txn_id": txn_ids[curr],
+    "prev_event": df["event"].iloc[prev].to_numpy(),
+    "prev_time": df["time"].to_numpy()[prev],
+    "curr_event": df["event"].iloc[curr].to_numpy(),
+    "curr_time": df["time"].to_numpy()[curr],
+})
+delta_ms = ((delta_df["curr_time"] - delta_df["prev_time"]) * NANO_TO_MS).to_numpy()
+
+# Histogram of the deltas of each (prev_event, curr_event) pair
+edges = np.concatenate(([-np.inf], sorted(args.histogram_bins), [np.inf]))
+bins = np.searchsorted(edges, delta_ms, side="right") - 1
+histogram_df = (
+    delta_df[["prev_event", "curr_event"]]
+    .assign(bin=bins)
+    .groupby(["prev_event", "curr_event", "bin"], observed=True)
+    .size()
+    .rename("count")
+    .reset_index()
+)
+histogram_df.insert(2, "min_delta_ms", edges[histogram_df["bin"]])
+histogram_df.insert(3, "max_delta_ms", edges[histogram_df["bin"] + 1])
+histogram_df = histogram_df.drop(columns="bin")
+histogram_df.to_csv(args.histogram_file, index=False)
+
+# Filter: keep only suspicious deltas. The bounds are compared to the rounded deltas, so only the deltas that are
+# within rounding distance of the bounds need to be rounded before filtering.
+margin = 10 ** -DELTA_DECIMALS
+candidates = (delta_ms < args.min_delta + margin) | (delta_ms > args.max_delta - margin)
+candidates &= ~delta_df["prev_event"].isin(args.exclude_prev_events).to_numpy()
+candidates &= ~delta_df["curr_event"].isin(args.exclude_curr_events).to_numpy()
+filtered_df = delta_df[candidates].assign(delta_ms=[round(delta, DELTA_DECIMALS) for delta in delta_ms[candidates].tolist()])
+filtered_df = filtered_df[(filtered_df["delta_ms"] < args.min_delta) | (filtered_df["delta_ms"] > args.max_delta)]
 
 # Save to CSV
 filtered_df.to_csv(output_file, index=False)
 
-#print(f"Saved filtered delta events to {output_path}")
-
-print("Done")
\ No newline at end of file
+print(f"Found {len(filtered_df)} suspicious deltas out of {len(delta_df)}")
+print("Done")
@@ -1,11 +1,28 @@
+import argparse
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
+import cost_model
+
+parser = argparse.ArgumentParser(description="Plot the hourly cost of every system on different VM types.")
+parser.add_argument("-c", "--costs_csv", default='plots/data/costs.csv', help="CSV with one row per VM type and one column per system")
+parser.add_argument("-b", "--bytes_csv", default=None, help="Re-price the runs of a '<scenario>_bytes.csv' written by 'extract_exp_results.py' (and save the costs to the costs CSV) instead of reading the costs CSV")
+parser.add_argument("-e", "--environment", default='aws', choices=['local', 'st', 'aws'], help="What type of machine the runs were run on.")
+parser.add_argument("-vt", "--vm_types", default=cost_model.DEFAULT_VM_TYPE, help=f"The VM types to price the runs with, separated by ';' (see '{cost_model.VM_COSTS_PATH}')")
+parser.add_argument("-r", "--regions", default=None, help="The AWS regions to price the regions of the runs as, separated by ';' (default: the regions of the deployment)")
+parser.add_argument("-x", "--x_val", type=float, default=None, help="The x value of the runs to price (default: the average over all x values)")
+args = parser.parse_args()
+
 # Read the data from the provided CSV file
-csv_path = 'plots/data/costs.csv'
-data = pd.read_csv(csv_path, index_col=0)
+csv_path = args.costs_csv
+if args.bytes_csv:
+    regions = args.regions.split(';') if args.regions else None
+    data = cost_model.what_if_costs(pd.read_csv(args.bytes_csv), args.environment, args.vm_types.split(';'), regions, args.x_val)
+    data.to_csv(csv_path)
+else:
+    data = pd.read_csv(csv_path, index_col=0)
 data.columns = [name[:4] for name in data.columns]
 
 # Plot the heatmap with adjustments
@@ -0,0 +1,122 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+'''
+Hourly cost of the runs, priced with tables loaded from files:
+- the hourly price of a VM, one row per VM type and one column per AWS region ('aws/vm_costs.csv'),
+- the price of sending 1GB out of a region (the row) to another one (the column) ('aws/data_transfer_cost_matrix.csv').
+The cost of a run is that of renting its servers for an hour plus that of an hour of its data transfers:
+    vm_cost + (sum over (src, dst) of bytes * price / 1e9) / duration * 3600
+The runs of a whole sweep are priced at once as a (runs x src x dst) array of bytes. The inputs of every run are saved
+by the extraction into '<scenario>_bytes.csv' (see 'run_metrics.extract_runs'), so the runs can be re-priced later
+(e.g. with other VM types or regions) without parsing them again.
+'''
+
+VM_COSTS_PATH = 'aws/vm_costs.csv'
+DATA_TRANSFER_COSTS_PATH = 'aws/data_transfer_cost_matrix.csv'
+DEFAULT_VM_TYPE = 'm4.2xlarge'
+# AWS regions of the deployment, in the order of the regions of the '.conf' files
+AWS_REGIONS = ['eu-west-1', 'eu-west-2', 'us-west-1', 'us-west-2', 'us-east-1', 'us-east-2', 'ap-northeast-1', 'ap-northeast-2']
+
+# Outside of AWS, every server ('st') or the whole deployment ('local', a single computer) costs as much as an
+# average AWS VM, and we pretend that the data transfers between regions cost a flat price per GB
+FLAT_DATA_TRANSFER_COSTS = {
+    'local': 0,
+    'st': 0.02,
+}
+
+# Columns of the inputs of the model, one row per run and (src_region, dst_region)
+INPUT_COLUMNS = ['system', 'x_val', 'duration', 'src_region', 'src_servers', 'dst_region', 'bytes', 'measured']
+
+def load_vm_costs(path=VM_COSTS_PATH):
+    """
+    Reads the hourly price of the VMs, as a DataFrame indexed by VM type with one column per region.
+    """
+    return pd.read_csv(path, index_col=0)
+
+def load_data_transfer_costs(path=DATA_TRANSFER_COSTS_PATH):
+    """
+    Reads the price of 1GB sent between regions, as a DataFrame with the sources as rows and the destinations as columns.
+    """
+    return pd.read_csv(path, index_col=0)
+
+def prices_fingerprint(paths=(VM_COSTS_PATH, DATA_TRANSFER_COSTS_PATH)):
+    """
+    Fingerprints the content of the price tables, so that the costs computed with older prices can be told apart.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def region_prices(env, num_regions, vm_type=DEFAULT_VM_TYPE, regions=None, vm_costs=None, data_transfer_costs=None):
+    """
+    Looks up the prices of the regions of the runs of an environment.
+
+    :param regions: The AWS regions that the regions of the runs are priced as, in order (default: AWS_REGIONS).
+                    Outside of AWS, the VMs cost the average of their price over these regions.
+    :param vm_costs: The table of 'load_vm_costs', read from its file if not given.
+    :param data_transfer_costs: The table of 'load_data_transfer_costs', read from its file if not given.
+    :return: The hourly price of a server in each of the num_regions regions and the (src x dst) price of 1GB.
+    """
+    vm_costs = load_vm_costs() if vm_costs is None else vm_costs
+    regions = AWS_REGIONS if regions is None else list(regions)
+    if vm_type not in vm_costs.index:
+        raise ValueError(f"No price for VM type '{vm_type}', known types: {list(vm_costs.index)}")
+    vm_type_costs = vm_costs.loc[vm_type, regions].to_numpy(dtype=float)
+    if env != 'aws':
+        transfer_costs = np.full((num_regions, num_regions), float(FLAT_DATA_TRANSFER_COSTS[env]))
+        np.fill_diagonal(transfer_costs, 0)
+        return np.full(num_regions, vm_type_costs.mean()), transfer_costs
+    if num_regions > len(regions):
+        raise ValueError(f"The runs have {num_regions} regions but only {len(regions)} are priced")
+    data_transfer_costs = load_data_transfer_costs() if data_transfer_costs is None else data_transfer_costs
+    regions = regions[:num_regions]
+    return vm_type_costs[:num_regions], data_transfer_costs.loc[regions, regions].to_numpy(dtype=float)
+
+def hourly_costs(inputs, env, vm_type=DEFAULT_VM_TYPE, regions=None, vm_costs=None, data_transfer_costs=None):
+    """
+    Prices all the given runs at once. Traffic within a region is neither paid for nor counted.
+
+    :param inputs: A DataFrame with the INPUT_COLUMNS, e.g. as returned by 'run_metrics.extract_runs'.
+    :return: A DataFrame indexed by (system, x_val) with the 'bytes' sent between regions and the hourly 'cost' of every run.
+    """
+    keys = pd.MultiIndex.from_frame(inputs[['system', 'x_val']].drop_duplicates())
+    run_index = keys.get_indexer(pd.MultiIndex.from_frame(inputs[['system', 'x_val']]))
+    src = inputs['src_region'].to_numpy(dtype=int)
+    dst = inputs['dst_region'].to_numpy(dtype=int)
+    num_regions = max(src.max(), dst.max()) + 1 if len(inputs) else 0
+
+    sent = np.zeros((len(keys), num_regions, num_regions))
+    np.add.at(sent, (run_index, src, dst), inputs['bytes'].to_numpy(dtype=float))
+    sent *= 1 - np.eye(num_regions)
+    # Every row of a source region repeats its number of servers
+    servers = np.zeros((len(keys), num_regions))
+    servers[run_index, src] = inputs['src_servers'].to_numpy(dtype=float)
+    durations = np.zeros(len(keys))
+    durations[run_index] = inputs['duration'].to_numpy(dtype=float)
+
+    server_costs, transfer_costs = region_prices(env, num_regions, vm_type, regions, vm_costs, data_transfer_costs)
+    vm_cost = np.full(len(keys), server_costs.mean()) if env == 'local' else servers @ server_costs
+    transfer_cost = np.einsum('rij,ij->r', sent, transfer_costs) / 1_000_000_000
+    return pd.DataFrame({'bytes': sent.sum(axis=(1, 2)), 'cost': vm_cost + transfer_cost / durations * 3600}, index=keys)
+
+def what_if_costs(inputs, env, vm_types, regions=None, x_val=None):
+    """
+    Re-prices the runs of a sweep with every given VM type, e.g. for 'cost_heatmap.py'.
+
+    :param x_val: The x value of the runs to price, or None for the average cost over all the x values.
+    :return: A DataFrame with one row per VM type and one column per system.
+    """
+    if x_val is not None:
+        inputs = inputs[inputs['x_val'] == x_val]
+    vm_costs = load_vm_costs()
+    data_transfer_costs = load_data_transfer_costs() if env == 'aws' else None
+    rows = {}
+    for vm_type in vm_types:
+        costs = hourly_costs(inputs, env, vm_type, regions, vm_costs, data_transfer_costs)['cost']
+        rows[vm_type] = costs.groupby(level='system', sort=False).mean()
+    return pd.DataFrame.from_dict(rows, orient='index')
@@ -8,6 +8,10 @@ import argparse
 # Extracted data will contain p50, p90, p95, p99. For the plots we will use p50 p95 p99
 LATENCY_PERCENTILE = 'p95'
 
+DATABASES = ['Calvin', 'SLOG', 'Detock', 'Janus']
+LINE_STYLES = ['-', '--', '-.', ':']
+COLORS = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red']
+
 def darken_color(color, factor):
     """Darkens a color toward black. Factor ∈ [0, 1], where 1 = original color, 0 = black."""
     rgb = mcolors.to_rgb(color)
@@ -71,9 +75,9 @@ def make_plot(plot='baseline', workload='ycsb', latency_percentiles=[50, 95, 99]
         ]
         subplot_titles = ['Throughput', 'Latency', 'Bytes', 'Cost']
     
-    databases = ['Calvin', 'SLOG', 'Detock', 'Janus']
-    line_styles = ['-', '--', '-.', ':']
-    colors = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red']
+    databases = DATABASES
+    line_styles = LINE_STYLES
+    colors = COLORS
 
     # Configure Matplotlib global font size
     plt.rcParams.update({
@@ -154,16 +158,56 @@ def make_plot(plot='baseline', workload='ycsb', latency_percentiles=[50, 95, 99]
     plt.savefig(pdf_path, bbox_inches='tight')
     plt.show()
 
+def make_throughput_over_time_plot(plot='baseline', workload='ycsb'):
+    """
+    Plots the commit throughput of every system over the duration of the runs, one subplot per x value.
+    The warm-up and cool-down seconds, excluded from the steady-state throughput, are drawn lighter.
+    """
+    csv_path = f'plots/data/final/{workload}/{plot}_throughput.csv'
+    data = pd.read_csv(csv_path)
+    if data.empty:
+        print(f"No throughput over time in {csv_path}")
+        return
+    x_vals = sorted(data['x_val'].unique())
+
+    fig, axes = plt.subplots(1, len(x_vals), figsize=(3 * len(x_vals), 3), sharey=True, squeeze=False)
+    for ax, x_val in zip(axes[0], x_vals):
+        for db, color, style in zip(DATABASES, COLORS, LINE_STYLES):
+            runs = data[(data['x_val'] == x_val) & (data['system'] == db)]
+            if runs.empty:
+                continue
+            ax.plot(runs['second'], runs['commit_tps'], color=lighten_color(color=color, factor=0.4), linestyle=style)
+            steady = runs['commit_tps'].where(runs['steady'])
+            ax.plot(runs['second'], steady, label=db, color=color, linestyle=style)
+        ax.set_title(f'x = {x_val}')
+        ax.set_xlabel('Time (s)')
+        ax.grid(True)
+        ax.set_ylim(bottom=0)
+    axes[0][0].set_ylabel('Throughput (txn/s)')
+
+    handles, labels = axes[0][-1].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='upper center', ncol=len(DATABASES), bbox_to_anchor=(0.5, 1.1))
+    plt.tight_layout(rect=[0, 0, 1, 1])
+
+    output_path = f'plots/output/{workload}/{plot}_throughput'
+    os.makedirs('/'.join(output_path.split('/')[:-1]), exist_ok=True)
+    plt.savefig(output_path + '.png', dpi=300, bbox_inches='tight')
+    plt.savefig(output_path + '.pdf', bbox_inches='tight')
+    plt.show()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="System Evaluation Script")
     parser.add_argument("-p",  "--plot", default="baseline", choices=["baseline", "skew", "scalability", "network", "packet_loss", "sunflower", "example"], help="The name of the experiment we want to plot.")
     parser.add_argument("-w",  "--workload", default="ycsb", choices=["ycsb", "tpcc", "movr"], help="The workload that was evaluated.")
     parser.add_argument("-sa", "--skip_aborts", default=False, help="Whether or not to plot the aborts (since many workloads don't have any).")
     parser.add_argument("-lp", "--latency_percentiles", default="50;95;99", help="The latency percentiles to plot")
+    parser.add_argument("-tt", "--throughput_over_time", action="store_true", help="Also plot the throughput of the runs over time.")
     args = parser.parse_args()
 
     latencies = [int(latency) for latency in args.latency_percentiles.split(';')]
 
     make_plot(plot=args.plot, workload=args.workload, latency_percentiles=latencies, skip_aborts=args.skip_aborts)
+    if args.throughput_over_time:
+        make_throughput_over_time_plot(plot=args.plot, workload=args.workload)
 
     print("Done")
\ No newline at end of file
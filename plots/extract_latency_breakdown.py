@@ -13,12 +13,17 @@ from matplotlib.colors import LogNorm, Normalize
 from matplotlib.ticker import MaxNLocator
 import seaborn as sns
 
+import benchmark_csv
+import latency_components
+import run_store
+
 '''
 Script for decomposing the transactional latency into individual components and making a heatmap.
 '''
 
-# Conversion factor: nanoseconds to milliseconds
-NANO_TO_MS = 1e-6
+# Columns of the client CSVs needed for the breakdown
+TXN_COLUMNS = ["txn_id", "regions", "partitions", "sent_at", "received_at"]
+EVENT_COLUMNS = ["txn_id", "event", "time"]
 
 VALID_SCENARIOS = ['baseline', 'skew', 'scalability', 'network', 'packet_loss', 'sunflower', 'example']
 VALID_WORKLOADS = ['ycsb', 'tpcc', 'movr'] # TODO: Add your own benchmark to this list
@@ -35,13 +40,18 @@ parser = argparse.ArgumentParser(description="Decompose the latency of transacti
 parser.add_argument('-df', '--data_folder', default='plots/raw_data/ycsb/lat_breakdown', help='Path to folder with raw data')
 parser.add_argument('-w',  '--workload', default='ycsb', choices=VALID_WORKLOADS, help='Workload evaluated (default: ycsb)')
 parser.add_argument('-o',  '--output_folder', default='plots/data/final/ycsb/latency_breakdown', help='Folder where to store the processed data')
+parser.add_argument('-st', '--store', action='store_true', help="Read the data from the store packed with 'plots/run_store.py' instead of the client CSVs")
 
 args = parser.parse_args()
 data_folder = args.data_folder
 workload = args.workload
 output_folder = args.output_folder
 
-system_dirs = os.listdir(data_folder)
+if args.store:
+    store_runs = run_store.find_runs(join(data_folder, run_store.STORE_FILE))
+    system_dirs = list(store_runs['system'].unique())
+else:
+    system_dirs = os.listdir(data_folder)
 # This is just to order the DBs in the chronological order used in the rest of the paper
 ordered_system_dirs = []
 if 'calvin' in system_dirs:
@@ -65,146 +75,19 @@ ordered_system_dirs = [system for system in ordered_system_dirs if '.' not in sy
 ordered_system_dirs = [system for system in ordered_system_dirs if 'ddr_only' not in system]
 summary_combined = pd.DataFrame(columns=['System'])
 
-def extract_component_times(cur_events):
-    NANO_TO_MS = 1e-6
-    # Define state variables
-    current_stage = None
-    stage_start_time = None
-    # Duration accumulators
-    stage_durations = {
-        "server": 0.0,
-        "forwarder": 0.0,
-        "mh_orderer": 0.0,
-        "sequencer": 0.0,
-        "log_manager": 0.0,
-        "scheduler": 0.0,
-        "lck_man": 0.0,
-        "worker": 0.0,
-        "idle": 0.0
-    }
-    # Define mapping of ENTER/EXIT events to stages
-    stage_enter = {
-        "ENTER_SERVER": "server",
-        "RETURN_TO_SERVER": "server",
-        "EXIT_SERVER_TO_FORWARDER": "forwarder", # Special case for Janus
-        "ENTER_FORWARDER": "forwarder",
-        "ENTER_MULTI_HOME_ORDERER": "mh_orderer",
-        "ENTER_MULTI_HOME_ORDERER_IN_BATCH": "mh_orderer",
-        "ENTER_SEQUENCER": "sequencer",
-        "ENTER_SEQUENCER_IN_BATCH": "sequencer",
-        "EXIT_SEQUENCER_IN_BATCH": "idle",
-        "ENTER_LOG_MANAGER_IN_BATCH": "log_manager",
-        "ENTER_LOG_MANAGER_ORDER": "log_manager",
-        "ENTER_SCHEDULER": "scheduler",
-        "ENTER_SCHEDULER_LO": "scheduler",
-        "ENTER_LOCK_MANAGER": "lck_man",
-        "ENTER_WORKER": "worker",
-    }
-    stage_exit = {
-        "EXIT_SERVER_TO_CLIENT": "server",
-        "EXIT_SERVER_TO_FORWARDER": "server",
-        "EXIT_FORWARDER_TO_SEQUENCER": "forwarder",
-        "ENTER_WORKER": "forwarder", # Special case for Janus
-        "EXIT_FORWARDER_TO_MULTI_HOME_ORDERER": "forwarder",
-        "EXIT_MULTI_HOME_ORDERER_IN_BATCH": "mh_orderer",
-        "EXIT_MULTI_HOME_ORDERER": "mh_orderer",
-        "EXIT_SEQUENCER_IN_BATCH": "sequencer",
-        "ENTER_LOG_MANAGER_IN_BATCH": "idle",
-        "EXIT_LOG_MANAGER": "log_manager",
-        "DISPATCHED": "scheduler",
-        "DISPATCHED_FAST": "scheduler",
-        "DISPATCHED_SLOW": "scheduler",
-        "ENTER_LOCK_MANAGER": "scheduler",
-        "EXIT_WORKER": "worker",
-    }
-    for _, event_row in cur_events.iterrows():
-        event = event_row["event"]
-        time = event_row["time"]
-        # Special case for the lock manager
-        if current_stage == "lck_man":
-            duration = (time - stage_start_time) * NANO_TO_MS
-            stage_durations[current_stage] += duration
-            current_stage = None
-            stage_start_time = None
-        # If we're currently in a stage and this event marks its exit
-        if current_stage and event in stage_exit and stage_exit[event] == current_stage:
-            duration = (time - stage_start_time) * NANO_TO_MS
-            stage_durations[current_stage] += duration
-            current_stage = None
-            stage_start_time = None
-        # If this event marks entering a stage (and no other stage is active)
-        if event in stage_enter:
-            if current_stage is None:
-                current_stage = stage_enter[event]
-                stage_start_time = time
-        elif event == "RETURN_TO_SERVER" and current_stage is None:
-            current_stage = "idle"
-            stage_start_time = time
-    return (
-        stage_durations["server"],
-        stage_durations["forwarder"],
-        stage_durations["mh_orderer"],
-        stage_durations["sequencer"],
-        stage_durations["log_manager"],
-        stage_durations["scheduler"],
-        stage_durations["lck_man"],
-        stage_durations["worker"],
-        stage_durations["idle"],
-    )
-
 for system in ordered_system_dirs:
-    clients = [item for item in os.listdir(join(data_folder, system, "client")) if os.path.isdir(join(data_folder, system, "client", item))]
-    txns_csvs = [join(data_folder, system, "client", client, "transactions.csv") for client in clients]
-    events_csvs = [join(data_folder, system, "client", client, "txn_events.csv") for client in clients]
-    # Merge the CSVs together
-    txns_csv = pd.DataFrame(columns=["txn_id","coordinator","regions","partitions","generator","restarts","global_log_pos","sent_at","received_at"])
-    events_csv = pd.DataFrame(columns=["txn_id","event","time","machine","home"])
-    for i in range(len(clients)):
-        cur_txns_csv = pd.read_csv(txns_csvs[i])
-        txns_csv = pd.concat([txns_csv, cur_txns_csv], ignore_index=True)
-        cur_events_csv = pd.read_csv(events_csvs[i])
-        events_csv = pd.concat([events_csv, cur_events_csv], ignore_index=True)
-    # Group events by txn_id for fast access
-    event_groups = events_csv.groupby("txn_id")
-    # Prepare list to collect results
-    results = []
-    txns_csv = txns_csv.tail(100) # For debugging purposes only, use the first 100 txns to speed up the script
-    for _, txn in txns_csv.iterrows():
-        txn_id = txn["txn_id"]
-        sent_at = txn["sent_at"]
-        received_at = txn["received_at"]
-        duration_ms = (received_at - sent_at) * NANO_TO_MS
-        is_mp = ';' in str(txn['partitions'])
-        is_mh = ';' in str(txn['regions'])
-        # Get event rows for this txn, if any
-        if txn_id in event_groups.groups:
-            txn_events = event_groups.get_group(txn_id).sort_values("time")
-            server_ms, forwarder_ms, mh_orderer_ms, sequencer_ms, log_manager_ms, scheduler_ms, lck_man_ms, worker_ms, idle_ms = extract_component_times(txn_events)
-            if system == 'janus':
-                lck_man_ms += forwarder_ms
-                forwarder_ms = 0.0
-        other_duration = round(max(0, duration_ms - server_ms - forwarder_ms - mh_orderer_ms - sequencer_ms - log_manager_ms - scheduler_ms - lck_man_ms - worker_ms - idle_ms), 5)
-        if other_duration > 100:
-            print("Warning: Lots of unattributed latency!")
-        results.append({
-            "Txn_ID": txn_id,
-            "Is MP": is_mp,
-            "Is MH": is_mh,
-            "Start time": sent_at,
-            "End time": received_at,
-            "Duration (ms)": round(duration_ms, 5),
-            "Server (ms)": round(server_ms, 5),
-            "Fwd (ms)": round(forwarder_ms, 5),
-            "MH orderer (ms)": round(mh_orderer_ms, 5),
-            "Seq (ms)": round(sequencer_ms, 5),
-            "Log man (ms)": round(log_manager_ms, 5),
-            "Sched (ms)": round(scheduler_ms, 5),
-            "Lck man (ms)": round(lck_man_ms, 5),
-            "Worker (ms)": round(worker_ms, 5),
-            "Wait (ms)": round(idle_ms, 5),
-            "Other (ms)": other_duration,
-        })
-    latency_breakdown_df = pd.DataFrame(results)
+    if args.store:
+        system_runs = store_runs[store_runs['system'] == system]
+        txns_csv = run_store.load_transactions(system_runs, TXN_COLUMNS)[TXN_COLUMNS]
+        events_csv = run_store.load_events(system_runs, EVENT_COLUMNS)[EVENT_COLUMNS]
+    else:
+        clients = [item for item in os.listdir(join(data_folder, system, "client")) if os.path.isdir(join(data_folder, system, "client", item))]
+        txns_csvs = [join(data_folder, system, "client", client, "transactions.csv") for client in clients]
+        events_csvs = [join(data_folder, system, "client", client, "txn_events.csv") for client in clients]
+        # Merge the CSVs together (only reading the columns used below)
+        txns_csv = pd.concat([benchmark_csv.read_transactions(path, TXN_COLUMNS) for path in txns_csvs], ignore_index=True)
+        events_csv = pd.concat([benchmark_csv.read_events(path, EVENT_COLUMNS) for path in events_csvs], ignore_index=True)
+    latency_breakdown_df = latency_components.latency_breakdown(txns_csv, events_csv, system)
     os.makedirs(output_folder, exist_ok=True)
     latency_breakdown_df.to_csv(os.path.join(output_folder, f"latency_breakdown_{system}.csv"), index=False)
     # Define txn subcategories
@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+import benchmark_csv
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+'''
+Attribution of the latency of each transaction to the components it went through, computed from
+the 'txn_events.csv' files of the clients. The stage state machine runs over flat arrays of all the
+events, either in a kernel compiled with Numba (if it is installed) or side by side for all the
+transactions with NumPy.
+'''
+
+# Conversion factor: nanoseconds to milliseconds
+NANO_TO_MS = 1e-6
+
+# Stages a transaction can be in, in the order of the columns of the duration matrix
+STAGES = ["server", "forwarder", "mh_orderer", "sequencer", "log_manager", "scheduler", "lck_man", "worker", "idle"]
+STAGE_COLUMNS = {
+    "server": "Server (ms)",
+    "forwarder": "Fwd (ms)",
+    "mh_orderer": "MH orderer (ms)",
+    "sequencer": "Seq (ms)",
+    "log_manager": "Log man (ms)",
+    "scheduler": "Sched (ms)",
+    "lck_man": "Lck man (ms)",
+    "worker": "Worker (ms)",
+    "idle": "Wait (ms)",
+}
+NO_STAGE = -1
+
+# Events entering a stage (only taken into account when no other stage is active)
+STAGE_ENTER = {
+    "ENTER_SERVER": "server",
+    "RETURN_TO_SERVER": "server",
+    "EXIT_SERVER_TO_FORWARDER": "forwarder", # Special case for Janus
+    "ENTER_FORWARDER": "forwarder",
+    "ENTER_MULTI_HOME_ORDERER": "mh_orderer",
+    "ENTER_MULTI_HOME_ORDERER_IN_BATCH": "mh_orderer",
+    "ENTER_SEQUENCER": "sequencer",
+    "ENTER_SEQUENCER_IN_BATCH": "sequencer",
+    "EXIT_SEQUENCER_IN_BATCH": "idle",
+    "ENTER_LOG_MANAGER_IN_BATCH": "log_manager",
+    "ENTER_LOG_MANAGER_ORDER": "log_manager",
+    "ENTER_SCHEDULER": "scheduler",
+    "ENTER_SCHEDULER_LO": "scheduler",
+    "ENTER_LOCK_MANAGER": "lck_man",
+    "ENTER_WORKER": "worker",
+}
+# Events exiting a stage (only taken into account when that stage is the active one).
+# The lock manager is special: it is exited by whatever event comes after entering it.
+STAGE_EXIT = {
+    "EXIT_SERVER_TO_CLIENT": "server",
+    "EXIT_SERVER_TO_FORWARDER": "server",
+    "EXIT_FORWARDER_TO_SEQUENCER": "forwarder",
+    "ENTER_WORKER": "forwarder", # Special case for Janus
+    "EXIT_FORWARDER_TO_MULTI_HOME_ORDERER": "forwarder",
+    "EXIT_MULTI_HOME_ORDERER_IN_BATCH": "mh_orderer",
+    "EXIT_MULTI_HOME_ORDERER": "mh_orderer",
+    "EXIT_SEQUENCER_IN_BATCH": "sequencer",
+    "ENTER_LOG_MANAGER_IN_BATCH": "idle",
+    "EXIT_LOG_MANAGER": "log_manager",
+    "DISPATCHED": "scheduler",
+    "DISPATCHED_FAST": "scheduler",
+    "DISPATCHED_SLOW": "scheduler",
+    "ENTER_LOCK_MANAGER": "scheduler",
+    "EXIT_WORKER": "worker",
+}
+
+def _stage_lookup(mapping):
+    """
+    Array mapping the code of each event (see benchmark_csv.EVENT_DTYPE) to the index of its stage in STAGES.
+    """
+    lookup = np.full(len(benchmark_csv.TRANSACTION_EVENTS), NO_STAGE, dtype=np.int8)
+    for event, stage in mapping.items():
+        lookup[benchmark_csv.TRANSACTION_EVENTS.index(event)] = STAGES.index(stage)
+    return lookup
+
+ENTER_STAGE = _stage_lookup(STAGE_ENTER)
+EXIT_STAGE = _stage_lookup(STAGE_EXIT)
+LCK_MAN = STAGES.index("lck_man")
+
+# Time attributed to a stage that some systems count in another one, as (from, to) stages
+STAGE_FOLDS = {
+    # Janus does not have a forwarder, the time between the server and the worker is spent waiting on the locks
+    'janus': [("forwarder", "lck_man")],
+}
+
+def _sort_events(events):
+    """
+    Returns the txn ids, event codes and times of the events, sorted by txn id and then by time.
+    """
+    txn_ids = events["txn_id"].to_numpy(dtype=np.int64)
+    codes = events["event"].astype(benchmark_csv.EVENT_DTYPE).cat.codes.to_numpy()
+    times = events["time"].to_numpy(dtype=np.int64)
+    if (codes < 0).any():
+        raise ValueError("Events without a name can't be attributed to a stage")
+    order = np.lexsort((times, txn_ids))
+    return txn_ids[order], codes[order], times[order]
+
+def _active_stages(starts, lengths, codes):
+    """
+    Runs the stage state machine of all the txns side by side: step k handles the k-th event of every txn
+    that has more than k events. Returns the stage that is active right before each event and whether
+    each event enters a new stage.
+    """
+    active_before = np.empty(len(codes), dtype=np.int8)
+    enters = np.zeros(len(codes), dtype=bool)
+    # Txns sorted by decreasing number of events, so the txns still running at step k are a prefix
+    by_length = np.argsort(-lengths, kind="stable")
+    remaining = np.searchsorted(-lengths[by_length], -np.arange(lengths.max(initial=0)), side="left")
+    current = np.full(len(starts), NO_STAGE, dtype=np.int8)
+    for step, count in enumerate(remaining):
+        txns = by_length[:count]
+        idx = starts[txns] + step
+        stage = current[txns]
+        event = codes[idx]
+        active_before[idx] = stage
+        exits = (stage == LCK_MAN) | ((stage != NO_STAGE) & (EXIT_STAGE[event] == stage))
+        stage = np.where(exits, NO_STAGE, stage)
+        entering = (stage == NO_STAGE) & (ENTER_STAGE[event] != NO_STAGE)
+        current[txns] = np.where(entering, ENTER_STAGE[event], stage)
+        enters[idx] = entering
+    return active_before, enters
+
+def _stage_matrix_numpy(starts, codes, times):
+    lengths = np.diff(np.append(starts, len(codes)))
+    txn_index = np.repeat(np.arange(len(starts)), lengths)
+    active_before, enters = _active_stages(starts, lengths, codes)
+    exits = (active_before == LCK_MAN) | ((active_before != NO_STAGE) & (EXIT_STAGE[codes] == active_before))
+    # The active stage was entered by the last entering event before the exiting one (always in the same txn)
+    last_enter = np.maximum.accumulate(np.where(enters, np.arange(len(codes)), -1))
+    entered_at = np.concatenate(([-1], last_enter[:-1]))[exits]
+    durations = (times[exits] - times[entered_at]) * NANO_TO_MS
+    # Same accumulation order as iterating over the events of each txn
+    cells = txn_index[exits] * len(STAGES) + active_before[exits]
+    matrix = np.bincount(cells, weights=durations, minlength=len(starts) * len(STAGES))
+    return matrix.reshape(len(starts), len(STAGES))
+
+def _stage_matrix_loop(starts, codes, times, enter_stage, exit_stage, num_stages, lck_man, nano_to_ms):
+    """
+    The stage state machine as a plain loop over the events. Only meant to be compiled with Numba,
+    so every table it uses is passed as an argument.
+    """
+    matrix = np.zeros((len(starts), num_stages))
+    for txn in range(len(starts)):
+        end = starts[txn + 1] if txn + 1 < len(starts) else len(codes)
+        current = -1
+        entered_at = 0
+        for i in range(starts[txn], end):
+            event = codes[i]
+            # Special case for the lock manager: any event exits it
+            if current == lck_man or (current != -1 and exit_stage[event] == current):
+                matrix[txn, current] += (times[i] - entered_at) * nano_to_ms
+                current = -1
+            # Only enter a stage if no other one is active
+            if current == -1 and enter_stage[event] != -1:
+                current = enter_stage[event]
+                entered_at = times[i]
+    return matrix
+
+_stage_matrix_compiled = numba.njit(cache=True, nogil=True)(_stage_matrix_loop) if numba is not None else None
+
+def stage_matrix(starts, codes, times, use_numba=None):
+    """
+    Attributes the time between the events of each txn to the stages it went through.
+
+    :param starts: Offset of the first event of each txn.
+    :param codes: Code of each event (see benchmark_csv.EVENT_DTYPE), sorted by txn and then by time.
+    :param times: Time of each event (ns since epoch), in the same order.
+    :param use_numba: Whether to run the compiled kernel. By default it is used if Numba is installed.
+    :return: A (txns x STAGES) matrix of durations in ms.
+    """
+    if use_numba is None:
+        use_numba = _stage_matrix_compiled is not None
+    if use_numba and _stage_matrix_compiled is None:
+        raise ImportError("Numba is required to compile the stage attribution kernel")
+    starts = np.ascontiguousarray(starts, dtype=np.int64)
+    codes = np.ascontiguousarray(codes, dtype=np.int64)
+    times = np.ascontiguousarray(times, dtype=np.int64)
+    if len(codes) == 0:
+        return np.zeros((len(starts), len(STAGES)))
+    if use_numba:
+        return _stage_matrix_compiled(starts, codes, times, ENTER_STAGE.astype(np.int64), EXIT_STAGE.astype(np.int64),
+                                      len(STAGES), LCK_MAN, NANO_TO_MS)
+    return _stage_matrix_numpy(starts, codes, times)
+
+def stage_durations(events, use_numba=None):
+    """
+    Computes the time spent by each txn in each stage.
+
+    :param events: DataFrame with the 'txn_id', 'event' and 'time' columns of 'txn_events.csv' files.
+    :return: The sorted unique txn ids and a (txns x STAGES) matrix of durations in ms.
+    """
+    txn_ids, codes, times = _sort_events(events)
+    is_start = np.ones(len(txn_ids), dtype=bool)
+    is_start[1:] = txn_ids[1:] != txn_ids[:-1]
+    starts = np.flatnonzero(is_start)
+    return txn_ids[starts], stage_matrix(starts, codes, times, use_numba)
+
+def fold_stages(matrix, system):
+    """
+    Moves the time of the stages listed in STAGE_FOLDS for the system into the stages they are counted in.
+    """
+    matrix = matrix.copy()
+    for src, dst in STAGE_FOLDS.get(system, []):
+        matrix[:, STAGES.index(dst)] += matrix[:, STAGES.index(src)]
+        matrix[:, STAGES.index(src)] = 0.0
+    return matrix
+
+def _round(values, decimals=5):
+    # Python's round is correctly rounded, np.round is not always
+    return np.array([round(value, decimals) for value in values.tolist()], dtype=np.float64)
+
+def latency_breakdown(txns, events, system, use_numba=None):
+    """
+    Splits the latency of each txn into the time spent in each stage.
+
+    :param txns: DataFrame with the 'txn_id', 'regions', 'partitions', 'sent_at' and 'received_at'
+                 columns of 'transactions.csv' files.
+    :param events: DataFrame with the 'txn_id', 'event' and 'time' columns of 'txn_events.csv' files.
+    :param system: Name of the system, used for its special cases.
+    :return: DataFrame with one row per txn, the durations are in ms. Txns without events only have
+             'Other' latency.
+    """
+    event_txn_ids, durations = stage_durations(events, use_numba)
+    txn_ids = txns["txn_id"].to_numpy(dtype=np.int64)
+    matrix = np.zeros((len(txn_ids), len(STAGES)))
+    pos = np.searchsorted(event_txn_ids, txn_ids)
+    has_events = pos < len(event_txn_ids)
+    has_events[has_events] = event_txn_ids[pos[has_events]] == txn_ids[has_events]
+    matrix[has_events] = durations[pos[has_events]]
+    matrix = fold_stages(matrix, system)
+
+    sent_at = txns["sent_at"].to_numpy(dtype=np.int64)
+    received_at = txns["received_at"].to_numpy(dtype=np.int64)
+    duration_ms = (received_at - sent_at) * NANO_TO_MS
+    other = duration_ms.copy()
+    for column in range(len(STAGES)):
+        other -= matrix[:, column]
+    other = _round(np.maximum(other, 0))
+    unattributed = int((other > 100).sum())
+    if unattributed:
+        print(f"Warning: Lots of unattributed latency in {unattributed} txns!")
+
+    breakdown = pd.DataFrame({
+        "Txn_ID": txn_ids,
+        "Is MP": txns["partitions"].fillna("").str.contains(";", regex=False).to_numpy(dtype=bool),
+        "Is MH": txns["regions"].fillna("").str.contains(";", regex=False).to_numpy(dtype=bool),
+        "Start time": sent_at,
+        "End time": received_at,
+        "Duration (ms)": _round(duration_ms),
+    })
+    for column, stage in enumerate(STAGES):
+        breakdown[STAGE_COLUMNS[stage]] = _round(matrix[:, column])
+    breakdown["Other (ms)"] = other
+    return breakdown
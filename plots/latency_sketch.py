@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+
+'''
+Mergeable quantile sketch for latencies. Values are counted in logarithmically spaced buckets
+(similar to DDSketch / HDR histograms), so every estimated quantile is within a fixed relative
+error of the real one, while the memory only depends on the range of the values and not on
+how many of them were added.
+'''
+
+DEFAULT_RELATIVE_ACCURACY = 0.001
+# Values below this one (e.g. 0 ms latencies) all end up in the same bucket
+MIN_TRACKED_VALUE = 1e-6
+
+class LatencySketch:
+    """
+    A quantile sketch that can be updated chunk by chunk and merged with other sketches
+    (e.g. per-client sketches into per-run and per-system ones).
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"The relative accuracy must be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        """
+        Adds an array (or a single chunk) of values to the sketch.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        indices = np.ceil(np.log(np.maximum(values, MIN_TRACKED_VALUE)) / self.log_gamma).astype(np.int64)
+        unique_indices, counts = np.unique(indices, return_counts=True)
+        for index, count in zip(unique_indices.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += int(values.size)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other):
+        """
+        Adds all the values counted by another sketch (with the same accuracy) to this one.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantiles(self, qs):
+        """
+        Estimates the given quantiles (between 0 and 1). Returns NaN for an empty sketch.
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        indices = np.array(sorted(self.bins), dtype=np.int64)
+        cumulative = np.cumsum([self.bins[i] for i in indices])
+        ranks = qs * (self.count - 1)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        estimates = 2 * np.power(self.gamma, indices[positions]) / (self.gamma + 1)
+        return np.clip(estimates, self.min, self.max)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'bins': {str(i): c for i, c in self.bins.items()},
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.bins = {int(i): c for i, c in data['bins'].items()}
+        sketch.count = data['count']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+def merge_sketches(sketches, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    Merges an iterable of sketches into a new one.
+    """
+    merged = LatencySketch(relative_accuracy)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,397 @@
+import os
+import re
+import json
+import calendar
+from datetime import datetime, timezone
+from os.path import join, isdir
+
+import pandas as pd
+
+import benchmark_csv
+from latency_sketch import LatencySketch, merge_sketches
+
+'''
+Columnar loader for the raw experiment results in 'plots/raw_data/<workload>/<scenario>'.
+Instead of keeping a full copy of every client CSV in nested dicts, each loader reads only the
+columns a metric needs and returns one tidy table keyed by (system, x_val, client).
+'''
+
+# Key columns shared by all the tables produced here
+RUN_KEYS = ['system', 'x_val']
+CLIENT_KEYS = RUN_KEYS + ['client']
+
+# Columns needed by the individual metrics
+LATENCY_COLUMNS = ['sent_at', 'received_at']
+ABORT_COLUMNS = ['aborted', 'single_partition', 'multi_partition']
+
+# Lines echoed by the benchmark containers right before and right after running the benchmark, followed by
+# the time in ns since epoch (see 'tools/admin.py')
+START_MARKER = 'BENCHMARK_START '
+END_MARKER = 'BENCHMARK_END '
+# Timestamp of a glog line: 'I0430 10:14:36.795380'
+GLOG_TIMESTAMP_PATTERN = r"[IWEF](\d{2})(\d{2}) (\d{2}):(\d{2}):(\d{2})\.(\d+)"
+
+# Per-second counters logged by the benchmark: 'S: x (n); C: x (n); A: x (n); R: x (n)', i.e. the send, commit,
+# abort and restart rates over the last second (and the totals so far), preceded by the glog timestamp
+TPS_LINE_PATTERN = (r"[IWEF](?P<date>\d{4} \d{2}:\d{2}:\d{2}\.\d+).*"
+                    r"S: (?P<send_tps>\d+) \(\d+\); C: (?P<commit_tps>\d+) \(\d+\); "
+                    r"A: (?P<abort_tps>\d+) \(\d+\); R: (?P<restart_tps>\d+) \(\d+\)")
+TPS_COLUMNS = ['send_tps', 'commit_tps', 'abort_tps', 'restart_tps']
+# Fraction of the typical throughput of a run below which a second counts as warm-up or cool-down
+STEADY_STATE_TOLERANCE = 0.1
+
+def find_runs(base_dir):
+    """
+    Lists all the run directories of a scenario (i.e. '<base_dir>/<system>/<x_val>').
+
+    :param base_dir: Directory of the scenario (e.g. 'plots/raw_data/ycsb/baseline').
+    :return: A DataFrame with the columns 'system', 'x_val' and 'path'.
+    """
+    runs = []
+    for system in sorted(os.listdir(base_dir)):
+        if not isdir(join(base_dir, system)):
+            continue
+        for x_val in sorted(os.listdir(join(base_dir, system))):
+            if isdir(join(base_dir, system, x_val)):
+                runs.append({'system': system, 'x_val': x_val, 'path': join(base_dir, system, x_val)})
+    return pd.DataFrame(runs, columns=['system', 'x_val', 'path'])
+
+def list_clients(run_dir):
+    client_dir = join(run_dir, 'client')
+    if not isdir(client_dir):
+        return []
+    return sorted(obj for obj in os.listdir(client_dir) if isdir(join(client_dir, obj)))
+
+def _as_categories(df, keys):
+    for key in keys:
+        df[key] = df[key].astype('category')
+    return df
+
+def _load_client_csvs(runs, file_name, columns, read_func):
+    frames = []
+    for run in runs.itertuples(index=False):
+        for client in list_clients(run.path):
+            df = read_func(join(run.path, 'client', client, file_name), columns)
+            df['system'] = run.system
+            df['x_val'] = run.x_val
+            df['client'] = client
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=CLIENT_KEYS + list(columns))
+    df = pd.concat(frames, ignore_index=True)
+    return _as_categories(df[CLIENT_KEYS + list(columns)], CLIENT_KEYS)
+
+def load_transactions(runs, columns=LATENCY_COLUMNS):
+    """
+    Loads the projected columns of all 'transactions.csv' files of the given runs into one table.
+    """
+    return _load_client_csvs(runs, 'transactions.csv', columns, benchmark_csv.read_transactions)
+
+def load_summaries(runs, columns=ABORT_COLUMNS):
+    """
+    Loads the projected columns of all 'summary.csv' files of the given runs into one table.
+    Only the first row (generator) of each file is kept, as the rest of the scripts always did.
+    """
+    df = _load_client_csvs(runs, 'summary.csv', columns, benchmark_csv.read_summary)
+    return df.groupby(CLIENT_KEYS, observed=True, sort=False).head(1).reset_index(drop=True)
+
+def extract_timestamp(timestamp_str, now=None):
+    """
+    Converts the glog timestamp of a line into ns since epoch. The containers log in UTC and glog leaves out
+    the year, so the latest year that doesn't put the line in the future is used.
+    """
+    month, day, hour, minute, second, fraction = re.search(GLOG_TIMESTAMP_PATTERN, timestamp_str).groups()
+    now = now or datetime.now(timezone.utc)
+    year = now.year
+    if (int(month), int(day)) > (now.month, now.day):
+        year -= 1
+    seconds = calendar.timegm((year, int(month), int(day), int(hour), int(minute), int(second)))
+    return seconds * 1000000000 + int(fraction.ljust(9, '0')[:9])
+
+def parse_container_log(lines):
+    """
+    Scans the lines of a benchmark container log for its 'Avg. TPS' and the times (ns since epoch) of the
+    start and end of the benchmark (None if missing). The times echoed around the benchmark are used if the
+    log has them, otherwise the timestamps of the lines logged when it starts and stops sending transactions.
+    """
+    avg_tps = 0
+    start_ns = None
+    end_ns = None
+    marked_start_ns = None
+    marked_end_ns = None
+    for line in lines:
+        if 'Avg. TPS: ' in line:
+            avg_tps += int(line.split('Avg. TPS: ')[1])
+        elif line.startswith(START_MARKER):
+            marked_start_ns = int(line.split()[1])
+        elif line.startswith(END_MARKER):
+            marked_end_ns = int(line.split()[1])
+        # Get the timestamp between the actual start and end of the experiment
+        elif 'Start sending transactions with' in line:
+            start_ns = extract_timestamp(line)
+        elif 'Results were written to' in line:
+            end_ns = extract_timestamp(line)
+    if marked_start_ns is not None:
+        start_ns = marked_start_ns
+    if marked_end_ns is not None:
+        end_ns = marked_end_ns
+    return avg_tps, start_ns, end_ns
+
+def _parse_container_log(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_container_log(f)
+
+def container_log_paths(run_dir):
+    # Older runs keep the log in the client directory, newer ones move it to 'raw_logs'
+    logs = []
+    for client in list_clients(run_dir):
+        path = join(run_dir, 'client', client, 'benchmark_container.log')
+        if os.path.exists(path):
+            logs.append((client, path))
+    raw_log_dir = join(run_dir, 'raw_logs')
+    if isdir(raw_log_dir):
+        for file in sorted(os.listdir(raw_log_dir)):
+            if 'benchmark_container_' in file:
+                logs.append((file.split('benchmark_container_')[1].split('.')[0], join(raw_log_dir, file)))
+    return logs
+
+def parse_tps_lines(lines):
+    """
+    Parses the per-second throughput lines of a benchmark container log, skipping all other lines.
+
+    :return: A DataFrame with the 'time' of every line (seconds, only meaningful relative to other lines
+             since the glog timestamps have no year) and the TPS_COLUMNS.
+    """
+    parsed = pd.Series(list(lines), dtype=object).str.extract(TPS_LINE_PATTERN).dropna()
+    # Any leap year works, the times are only compared with each other
+    dates = pd.to_datetime('2000' + parsed['date'], format='%Y%m%d %H:%M:%S.%f')
+    df = parsed[TPS_COLUMNS].astype('int64').reset_index(drop=True)
+    df.insert(0, 'time', (dates - pd.Timestamp(2000, 1, 1)).dt.total_seconds().to_numpy())
+    return df
+
+def tps_series_frame(frames):
+    """
+    Builds the throughput series of the clients out of their parsed lines, given as ((system, x_val, client), df) pairs.
+    Every line reports on the second before it, so the n-th line of a client is its n-th second. The seconds of the
+    clients of a run are aligned on the first line of the earliest client.
+
+    :return: A DataFrame with the CLIENT_KEYS, the 'second' since the start of the run and the TPS_COLUMNS.
+    """
+    frames = [(key, df) for key, df in frames if not df.empty]
+    run_starts = {}
+    for (system, x_val, _), df in frames:
+        run_starts[(system, x_val)] = min(run_starts.get((system, x_val), df['time'].iloc[0]), df['time'].iloc[0])
+    series = []
+    for (system, x_val, client), df in frames:
+        offset = round(df['time'].iloc[0] - run_starts[(system, x_val)])
+        df = df[TPS_COLUMNS].assign(system=system, x_val=x_val, client=client, second=range(offset, offset + len(df)))
+        series.append(df)
+    if not series:
+        return pd.DataFrame(columns=CLIENT_KEYS + ['second'] + TPS_COLUMNS)
+    df = pd.concat(series, ignore_index=True)
+    return _as_categories(df[CLIENT_KEYS + ['second'] + TPS_COLUMNS], CLIENT_KEYS)
+
+def container_logs_frame(rows):
+    df = pd.DataFrame(rows, columns=CLIENT_KEYS + ['avg_tps', 'start_ns', 'end_ns'])
+    df['avg_tps'] = df['avg_tps'].astype('int64')
+    df[['start_ns', 'end_ns']] = df[['start_ns', 'end_ns']].astype('Int64')
+    return _as_categories(df, CLIENT_KEYS)
+
+def load_container_logs(runs):
+    """
+    Scans the benchmark container logs of the given runs line by line.
+
+    :return: A DataFrame keyed by (system, x_val, client) with the 'Avg. TPS' of each container and the
+             times (ns since epoch) of the start and end of its benchmark (NaN if missing).
+    """
+    rows = []
+    for run in runs.itertuples(index=False):
+        for client, path in container_log_paths(run.path):
+            avg_tps, start_ns, end_ns = _parse_container_log(path)
+            rows.append({'system': run.system, 'x_val': run.x_val, 'client': client, 'avg_tps': avg_tps,
+                         'start_ns': start_ns, 'end_ns': end_ns})
+    return container_logs_frame(rows)
+
+def load_throughput_series(runs):
+    """
+    Parses the per-second throughput lines of the benchmark container logs of the given runs.
+
+    :return: See 'tps_series_frame'.
+    """
+    frames = []
+    for run in runs.itertuples(index=False):
+        for client, path in container_log_paths(run.path):
+            with open(path, "r", encoding="utf-8") as f:
+                frames.append(((run.system, run.x_val, client), parse_tps_lines(f)))
+    return tps_series_frame(frames)
+
+def is_raw_log_file(file):
+    """
+    Whether a file of 'raw_logs' is needed to compute the bytes and cost of a run: the benchmark command log,
+    the '.conf' file (for getting all the IPs involved) and the ips file.
+    """
+    return file == 'benchmark_cmd.log' or '.conf' in file or '.json' in file
+
+def parse_raw_logs(files):
+    """
+    Parses the raw log files of a run, given as (file name, content) pairs.
+
+    :return: A dict with the lines of the 'benchmark_cmd' log and of the 'conf_file', and the parsed 'ips_file'.
+    """
+    raw_logs = {}
+    for file, content in files:
+        if file == 'benchmark_cmd.log':
+            raw_logs['benchmark_cmd'] = content.split('\n')
+        if '.conf' in file:
+            raw_logs['conf_file'] = content.split('\n')
+        if '.json' in file:
+            raw_logs['ips_file'] = json.loads(content)
+    return raw_logs
+
+def read_raw_logs(run):
+    """
+    Reads the raw log files of a run (a row of 'find_runs').
+    """
+    raw_log_dir = join(run.path, 'raw_logs')
+    files = []
+    for file in ['benchmark_cmd.log'] + [f for f in os.listdir(raw_log_dir) if f != 'benchmark_cmd.log']:
+        if is_raw_log_file(file):
+            with open(join(raw_log_dir, file), "r", encoding="utf-8") as f:
+                files.append((file, f.read()))
+    return parse_raw_logs(files)
+
+def read_net_traffic(run, ip):
+    """
+    Reads the network traffic log of a server of a run (a row of 'find_runs'), or returns None if it has none.
+    """
+    path = join(run.path, 'raw_logs', f"net_traffic_{ip.replace('.', '_')}.csv")
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path)
+
+def read_egress_traffic(run, ip):
+    """
+    Reads the per-destination traffic log ('tools/egress_monitor.py') of a server of a run (a row of 'find_runs').
+
+    :return: A DataFrame with the 'timestamp_ms', 'dst' and 'bytes_sent' columns, or None if the server has no such log.
+    """
+    path = join(run.path, 'raw_logs', f"egress_traffic_{ip.replace('.', '_')}.csv")
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype={'timestamp_ms': 'int64', 'dst': str, 'bytes_sent': 'int64'})
+
+def latency_percentiles(txns, percentiles=(50, 90, 95, 99)):
+    """
+    Computes the latency percentiles (in ms) of every run.
+
+    :return: A DataFrame indexed by (system, x_val) with one 'p<percentile>' column per percentile.
+    """
+    latency_ms = (txns['received_at'] - txns['sent_at']) / 1000000
+    grouped = latency_ms.groupby([txns['system'], txns['x_val']], observed=True)
+    result = grouped.quantile([p / 100 for p in percentiles]).unstack()
+    result.columns = [f"p{p}" for p in percentiles]
+    return result
+
+def latency_sketches(runs, relative_accuracy, chunksize=benchmark_csv.CHUNK_SIZE):
+    """
+    Streams through all 'transactions.csv' files of the given runs and summarizes the latencies (in ms)
+    of every client in a mergeable sketch, so the memory does not grow with the number of transactions.
+
+    :return: A Series of LatencySketch objects indexed by (system, x_val, client).
+    """
+    sketches = {}
+    for run in runs.itertuples(index=False):
+        for client in list_clients(run.path):
+            sketch = LatencySketch(relative_accuracy)
+            path = join(run.path, 'client', client, 'transactions.csv')
+            for chunk in benchmark_csv.iter_transactions(path, LATENCY_COLUMNS, chunksize=chunksize):
+                sketch.update((chunk['received_at'] - chunk['sent_at']).to_numpy() / 1000000)
+            sketches[(run.system, run.x_val, client)] = sketch
+    index = pd.MultiIndex.from_tuples(list(sketches.keys()), names=CLIENT_KEYS)
+    return pd.Series(list(sketches.values()), index=index, dtype=object)
+
+def sketch_percentiles(sketches, keys=RUN_KEYS, percentiles=(50, 90, 95, 99)):
+    """
+    Merges the per-client sketches by the given keys (e.g. per run or per system) and estimates
+    the latency percentiles (in ms) of every group.
+    """
+    keys = list(keys)
+    groups = {}
+    for group, group_sketches in sketches.groupby(level=keys):
+        merged = merge_sketches(group_sketches, group_sketches.iloc[0].relative_accuracy)
+        groups[group if isinstance(group, tuple) else (group,)] = merged.quantiles([p / 100 for p in percentiles])
+    index = pd.MultiIndex.from_tuples(list(groups.keys()), names=keys)
+    return pd.DataFrame(list(groups.values()), index=index, columns=[f"p{p}" for p in percentiles])
+
+def abort_rates(summaries):
+    """
+    Computes the abort rate (in %) of every run.
+    """
+    totals = summaries.groupby(RUN_KEYS, observed=True)[ABORT_COLUMNS].sum()
+    return 100 * totals['aborted'] / (totals['single_partition'] + totals['multi_partition'])
+
+def throughputs(container_logs):
+    """
+    Computes the throughput of every run by summing up the 'Avg. TPS' of all its clients.
+    """
+    return container_logs.groupby(RUN_KEYS, observed=True)['avg_tps'].sum()
+
+def run_throughput_series(series):
+    """
+    Sums up the per-second throughput of all the clients of every run.
+
+    :return: A DataFrame indexed by (system, x_val, second) with the TPS_COLUMNS.
+    """
+    return series.groupby(RUN_KEYS + ['second'], observed=True)[TPS_COLUMNS].sum()
+
+def steady_state_windows(run_series, tolerance=STEADY_STATE_TOLERANCE):
+    """
+    Finds the steady state of every run in its per-second commit throughput (as returned by 'run_throughput_series').
+    The typical throughput of a run is the median of the middle half of its seconds. The warm-up lasts until the
+    first second within 'tolerance' of it, and the cool-down starts after the last such second.
+
+    :return: A DataFrame indexed by (system, x_val) with the first and last second of the steady state
+             ('steady_start', 'steady_end').
+    """
+    windows = {}
+    for key, commit_tps in run_series['commit_tps'].groupby(level=RUN_KEYS, observed=True):
+        commit_tps = commit_tps.droplevel(RUN_KEYS).sort_index()
+        n = len(commit_tps)
+        typical = commit_tps.iloc[n // 4:max(3 * n // 4, n // 4 + 1)].median()
+        steady = commit_tps.index[commit_tps >= (1 - tolerance) * typical]
+        windows[key] = (steady.min(), steady.max())
+    index = pd.MultiIndex.from_tuples(list(windows.keys()), names=RUN_KEYS)
+    return pd.DataFrame(list(windows.values()), index=index, columns=['steady_start', 'steady_end'])
+
+def mark_steady_state(run_series, windows):
+    """
+    Adds a 'steady' column to the per-second throughput of the runs telling whether a second is in the steady state.
+    """
+    seconds = run_series.index.get_level_values('second')
+    bounds = windows.reindex(run_series.index.droplevel('second'))
+    steady = (seconds >= bounds['steady_start'].to_numpy()) & (seconds <= bounds['steady_end'].to_numpy())
+    return run_series.assign(steady=steady)
+
+def steady_state_throughputs(series, tolerance=STEADY_STATE_TOLERANCE):
+    """
+    Computes the mean and the standard deviation of the per-second commit throughput of every run over its
+    steady state (see 'steady_state_windows').
+
+    :param series: The per-second throughput of the clients, as returned by 'load_throughput_series'.
+    :return: A DataFrame indexed by (system, x_val) with 'steady_throughput', 'throughput_std', 'steady_start'
+             and 'steady_end'.
+    """
+    run_series = run_throughput_series(series)
+    windows = steady_state_windows(run_series, tolerance)
+    run_series = mark_steady_state(run_series, windows)
+    stats = run_series.loc[run_series['steady'], 'commit_tps'].groupby(level=RUN_KEYS, observed=True).agg(['mean', 'std'])
+    stats.columns = ['steady_throughput', 'throughput_std']
+    return stats.join(windows)
+
+def run_timestamps(container_logs):
+    """
+    Picks the start and end times (ns since epoch) of every run: from the first client starting its benchmark
+    to the last one finishing it.
+    """
+    grouped = container_logs.groupby(RUN_KEYS, observed=True)
+    return pd.DataFrame({'start_ns': grouped['start_ns'].min(), 'end_ns': grouped['end_ns'].max()})
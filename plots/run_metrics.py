@@ -0,0 +1,294 @@
+import os
+from os.path import join
+import hashlib
+import json
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import byte_accounting
+import cost_model
+import result_loader
+import run_store
+
+'''
+Extraction of the final metrics of a single run directory ('<scenario>/<system>/<x_val>').
+Every run is independent, so 'extract_runs' can hand them out to a pool of worker processes and
+only the small per-run metric records travel back to the parent.
+The records are also cached in a JSON sidecar inside each run directory, so only new or changed
+runs have to be parsed again. The runs can also be read from a store packed by 'run_store'.
+'''
+
+# 'throughput' sums up the 'Avg. TPS' of the clients, 'steady_throughput' is the mean commit throughput (and
+# 'throughput_std' its standard deviation) over the seconds of the run without the warm-up and cool-down
+METRICS_LIST = ['throughput', 'steady_throughput', 'throughput_std', 'p50', 'p90', 'p95', 'p99', 'aborts', 'bytes', 'cost']
+PERCENTILES = [50, 90, 95, 99]
+
+# Per-run tables kept in the records next to the metrics, as lists of rows
+SERIES_LIST = ['throughput_series', 'cost_inputs']
+THROUGHPUT_COLUMNS = result_loader.RUN_KEYS + ['second'] + result_loader.TPS_COLUMNS + ['steady']
+
+# Name of the per-run cache file. Bump the version whenever the way the metrics are computed changes
+CACHE_FILE = '.metrics_cache.json'
+CACHE_VERSION = 6
+
+# Where the runs are read from: the run directories, or a store packed by 'run_store' (never cached)
+LOADERS = {
+    'directory': result_loader,
+    'store': run_store,
+}
+
+# Line of the benchmark command log ('tools/admin.py') with the command run by a client. Older versions of the
+# tooling logged the launch of a benchmark container or exec with another message
+BENCHMARK_CMD_PATTERN = re.compile(
+    r"(?:Synced config and ran command|Created container with command|Created exec with command): benchmark .*--duration (\d+)"
+)
+
+# The hard-coded byte counts used if we don't have real data for a run
+BYTES_TRANSFERED_MATRICES = {
+    'local': [
+        [0, 1],
+        [1, 0]
+    ],
+    'st': [
+        [0, 1], # 131.180.125.57
+        [1, 0]  # 131.180.125.40
+    ],
+    'aws': [
+        [111,112,113,114,115,116,117,118], # euw1
+        [211,212,213,214,215,216,217,218], # euw2
+        [311,312,313,314,315,316,317,318], # usw1
+        [411,412,413,414,415,416,417,418], # usw2
+        [511,512,513,514,515,516,517,518], # use1
+        [611,612,613,614,615,616,617,618], # use2
+        [711,712,713,714,715,716,717,718], # apne1
+        [811,812,813,814,815,816,817,818]  # apne2
+    ],
+}
+
+def get_server_ips_from_conf(conf_data):
+    ips_used = []
+    for line in conf_data:
+        if '    addresses: ' in line:
+            ips_used.append(line.split('    addresses: "')[1].split('"')[0])
+    ips_used = list(ips_used)
+    return ips_used
+
+def get_ip_regions_from_conf(conf_data):
+    """
+    Maps every server and client address of a '.conf' file to the index of its region. A machine that is a server
+    in one region and a client in another one belongs to the region of its server.
+    """
+    server_regions = {}
+    client_regions = {}
+    region = -1
+    for line in conf_data:
+        if line.startswith('regions: {'):
+            region += 1
+        elif '    addresses: ' in line:
+            server_regions[line.split('    addresses: "')[1].split('"')[0]] = region
+        elif '    client_addresses: ' in line:
+            client_regions[line.split('    client_addresses: "')[1].split('"')[0]] = region
+    return {**client_regions, **server_regions}
+
+def get_servers_per_region_from_conf(conf_data):
+    """
+    Counts the server addresses of every region of a '.conf' file, by region index.
+    """
+    servers = {}
+    region = -1
+    for line in conf_data:
+        if line.startswith('regions: {'):
+            region += 1
+        elif '    addresses: ' in line:
+            servers[region] = servers.get(region, 0) + 1
+    return servers
+
+def run_byte_matrix(run, start_ns, end_ns, loader=result_loader, raw_logs=None):
+    """
+    Computes the (src region x dst region) matrix of the bytes the servers of a run (a row of 'loader.find_runs')
+    sent between start_ns and end_ns, from their traffic logs (see 'byte_accounting'). The regions are numbered
+    in the order of the '.conf' file, which is also the order of the cost matrices.
+
+    :return: A DataFrame with the sources as rows and the destinations as columns, or None if the run has no traffic logs.
+    """
+    raw_logs = raw_logs or loader.read_raw_logs(run)
+    ip_regions = get_ip_regions_from_conf(raw_logs['conf_file'])
+    transfers = []
+    for ip in dict.fromkeys(get_server_ips_from_conf(raw_logs['conf_file'])):
+        # The bytes sent to each destination if the server was monitored per destination, otherwise its total
+        egress_traffic = loader.read_egress_traffic(run, ip)
+        if egress_traffic is not None:
+            transfers.append(byte_accounting.parse_egress_traffic(egress_traffic, ip))
+            continue
+        net_traffic = loader.read_net_traffic(run, ip)
+        if net_traffic is not None:
+            transfers.append(byte_accounting.parse_net_traffic(net_traffic, ip))
+    if not transfers:
+        return None
+    regions = sorted(set(ip_regions.values()))
+    return byte_accounting.byte_matrix(pd.concat(transfers, ignore_index=True), start_ns, end_ns, ip_regions.get, regions)
+
+def cost_inputs(run, env, start_ns, end_ns, loader=result_loader):
+    """
+    Collects what the cost of a run (a row of 'loader.find_runs') depends on, see 'cost_model.hourly_costs'.
+    The runs without traffic logs get the hard-coded byte counts of their environment.
+
+    :return: A DataFrame with the cost_model.INPUT_COLUMNS, one row per (src_region, dst_region).
+    """
+    raw_logs = loader.read_raw_logs(run)
+    duration = None
+    for line in raw_logs['benchmark_cmd']:
+        match = BENCHMARK_CMD_PATTERN.search(line)
+        if match:
+            duration = int(match.group(1))
+    if duration is None:
+        raise ValueError(f"No benchmark command in the benchmark command log of {run.path}")
+    bytes_transfered_df = run_byte_matrix(run, start_ns, end_ns, loader, raw_logs) # Rows are source, Cols are dest
+    measured = bytes_transfered_df is not None
+    if not measured:
+        bytes_transfered_df = pd.DataFrame(BYTES_TRANSFERED_MATRICES[env])
+    servers = get_servers_per_region_from_conf(raw_logs['conf_file'])
+    inputs = bytes_transfered_df.rename_axis(index='src_region', columns='dst_region').stack().rename('bytes').reset_index()
+    inputs['src_servers'] = inputs['src_region'].map(servers).fillna(0).astype(int)
+    return inputs.assign(system=run.system, x_val=run.x_val, duration=duration, measured=measured)[cost_model.INPUT_COLUMNS]
+
+def bytes_and_cost(inputs, env):
+    """
+    Computes the total bytes transferred and the hourly cost of a run out of its 'cost_inputs'.
+    """
+    costs = cost_model.hourly_costs(inputs, env)
+    # The bytes of the intervals at the start and end of the run are prorated
+    return round(costs['bytes'].iloc[0]), costs['cost'].iloc[0]
+
+def extract_run(system, x_val, run_dir, env, latency_accuracy=None, source='directory'):
+    """
+    Extracts all the final metrics of a single run.
+
+    :param run_dir: The run directory, or the store file if the source is 'store'.
+    :param latency_accuracy: If set, the latency percentiles are estimated by streaming the transactions
+                             through a quantile sketch with this relative accuracy instead of loading them all.
+    :param source: One of LOADERS.
+    :return: A dict with the 'system', the 'x_val', one entry per metric in METRICS_LIST and the rows of the
+             'throughput_series' (see 'throughput_over_time') and of the 'cost_inputs' of the run.
+    """
+    loader = LOADERS[source]
+    runs = pd.DataFrame([{'system': system, 'x_val': x_val, 'path': run_dir}])
+    run = next(runs.itertuples(index=False))
+    key = (system, x_val)
+    container_logs = loader.load_container_logs(runs)
+    timestamps = result_loader.run_timestamps(container_logs).loc[key]
+    if latency_accuracy is None:
+        latencies = result_loader.latency_percentiles(loader.load_transactions(runs), PERCENTILES).loc[key]
+    else:
+        sketches = loader.latency_sketches(runs, latency_accuracy)
+        latencies = result_loader.sketch_percentiles(sketches, percentiles=PERCENTILES).loc[key]
+    inputs = cost_inputs(run, env, timestamps['start_ns'], timestamps['end_ns'], loader)
+    total_bytes, total_cost = bytes_and_cost(inputs, env)
+    series = loader.load_throughput_series(runs)
+    steady = result_loader.steady_state_throughputs(series)
+    steady = steady.loc[key] if key in steady.index else {'steady_throughput': float('nan'), 'throughput_std': float('nan')}
+    record = {
+        'system': system,
+        'x_val': x_val,
+        'throughput': result_loader.throughputs(container_logs)[key],
+        'steady_throughput': steady['steady_throughput'],
+        'throughput_std': steady['throughput_std'],
+        'aborts': result_loader.abort_rates(loader.load_summaries(runs))[key],
+        'bytes': total_bytes,
+        'cost': total_cost,
+        'throughput_series': _rows(throughput_over_time(series)),
+        'cost_inputs': _rows(inputs),
+    }
+    for p in PERCENTILES:
+        record[f'p{p}'] = latencies[f'p{p}']
+    return record
+
+def throughput_over_time(series):
+    """
+    Computes the commit throughput of every run over time.
+
+    :param series: The per-second throughput of the clients, as returned by 'load_throughput_series'.
+    :return: A DataFrame with the THROUGHPUT_COLUMNS: the 'system', 'x_val', 'second', the TPS_COLUMNS summed over
+             all the clients and whether the second is part of the 'steady' state of the run.
+    """
+    run_series = result_loader.run_throughput_series(series)
+    windows = result_loader.steady_state_windows(run_series)
+    return result_loader.mark_steady_state(run_series, windows).reset_index()[THROUGHPUT_COLUMNS]
+
+def run_fingerprint(run_dir):
+    """
+    Fingerprints a run directory by the relative path, size and mtime of every file in it.
+    """
+    entries = []
+    for dir_path, dir_names, file_names in os.walk(run_dir):
+        dir_names.sort()
+        for file in sorted(file_names):
+            if file == CACHE_FILE:
+                continue
+            path = join(dir_path, file)
+            stat = os.stat(path)
+            entries.append(f"{os.path.relpath(path, run_dir)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1('\n'.join(entries).encode()).hexdigest()
+
+def _to_builtin(value):
+    # Numpy scalars are not JSON serializable
+    return value.item() if hasattr(value, 'item') else value
+
+def _rows(df):
+    return [{column: _to_builtin(value) for column, value in row.items()} for row in df.to_dict('records')]
+
+def cached_extract_run(system, x_val, run_dir, env, latency_accuracy=None, use_cache=True, source='directory'):
+    """
+    Same as 'extract_run', but reuses the cached record of the run if none of its files changed.
+    """
+    if not use_cache or source != 'directory':
+        return extract_run(system, x_val, run_dir, env, latency_accuracy, source)
+    cache_path = join(run_dir, CACHE_FILE)
+    key = {'version': CACHE_VERSION, 'env': env, 'latency_accuracy': latency_accuracy, 'fingerprint': run_fingerprint(run_dir),
+           'prices': cost_model.prices_fingerprint()}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache['key'] == key:
+            return {'system': system, 'x_val': x_val, **cache['metrics']}
+    except (OSError, ValueError, KeyError):
+        pass
+    record = extract_run(system, x_val, run_dir, env, latency_accuracy)
+    metrics = {metric: _to_builtin(record[metric]) for metric in METRICS_LIST + SERIES_LIST}
+    try:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({'key': key, 'metrics': metrics}, f)
+    except OSError:
+        print(f"Unable to write the metrics cache of run: {run_dir}")
+    return {'system': system, 'x_val': x_val, **metrics}
+
+def _extract_run_star(job):
+    return cached_extract_run(*job)
+
+def extract_runs(runs, env, jobs=1, latency_accuracy=None, use_cache=True, source='directory'):
+    """
+    Extracts the metrics of all the given runs, optionally in 'jobs' worker processes.
+
+    :param runs: A DataFrame as returned by result_loader.find_runs (or run_store.find_runs).
+    :param latency_accuracy: Relative accuracy of the latency sketches (None computes the exact percentiles).
+    :param use_cache: Whether to reuse (and update) the cached metrics of unchanged runs.
+    :param source: One of LOADERS, matching where 'runs' was found.
+    :return: A DataFrame with the metrics of every run, in the same order as 'runs', a DataFrame with the
+             throughput of every run over time (see 'throughput_over_time') and a DataFrame with the inputs of
+             the cost of every run (see 'cost_inputs'), which 'cost_model' can re-price without parsing them again.
+    """
+    run_jobs = [(run.system, run.x_val, run.path, env, latency_accuracy, use_cache, source) for run in runs.itertuples(index=False)]
+    if jobs > 1 and len(run_jobs) > 1:
+        # The extraction scripts run at module level, so prefer 'fork' to avoid the workers re-running them
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=min(jobs, len(run_jobs)), mp_context=multiprocessing.get_context(start_method)) as pool:
+            records = list(pool.map(_extract_run_star, run_jobs))
+    else:
+        records = [_extract_run_star(job) for job in run_jobs]
+    metrics = pd.DataFrame(records, columns=['system', 'x_val'] + METRICS_LIST)
+    throughput = pd.DataFrame([row for record in records for row in record['throughput_series']], columns=THROUGHPUT_COLUMNS)
+    inputs = pd.DataFrame([row for record in records for row in record['cost_inputs']], columns=cost_model.INPUT_COLUMNS)
+    return metrics, throughput, inputs
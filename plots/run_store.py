@@ -0,0 +1,294 @@
+import os
+from os.path import join, isdir
+import argparse
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import benchmark_csv
+import result_loader
+from latency_sketch import LatencySketch
+
+'''
+Single SQLite store for all the raw results of a scenario ('plots/raw_data/<workload>/<scenario>').
+'pack_scenario' walks the run directories once and copies the client CSVs, the throughput lines of the
+benchmark container logs, the network traffic logs and the raw logs needed for the cost into indexed
+tables. The loaders below mirror the ones of 'result_loader' (same arguments and same tables), except
+that the 'path' of the runs is the store file, so the scripts can switch between the two.
+
+Usage: python3 plots/run_store.py -df plots/raw_data/ycsb/baseline
+'''
+
+STORE_FILE = 'runs.sqlite'
+
+SCHEMA = [
+    "CREATE TABLE runs (run_id INTEGER PRIMARY KEY, system TEXT NOT NULL, x_val TEXT NOT NULL, UNIQUE (system, x_val))",
+    "CREATE TABLE event_names (code INTEGER PRIMARY KEY, name TEXT NOT NULL)",
+    "CREATE TABLE transactions (run_id INTEGER NOT NULL, client TEXT NOT NULL, txn_id INTEGER, coordinator INTEGER, "
+    "regions TEXT, partitions TEXT, generator INTEGER, restarts INTEGER, global_log_pos TEXT, sent_at INTEGER, "
+    "received_at INTEGER)",
+    "CREATE TABLE events (run_id INTEGER NOT NULL, client TEXT NOT NULL, txn_id INTEGER, event INTEGER, time INTEGER, "
+    "machine INTEGER, home INTEGER)",
+    "CREATE TABLE summaries (run_id INTEGER NOT NULL, client TEXT NOT NULL, committed INTEGER, aborted INTEGER, "
+    "not_started INTEGER, restarted INTEGER, single_home INTEGER, foreign_single_home INTEGER, multi_home INTEGER, "
+    "single_partition INTEGER, multi_partition INTEGER, remaster INTEGER, elapsed_time INTEGER)",
+    "CREATE TABLE throughput_log (run_id INTEGER NOT NULL, client TEXT NOT NULL, line_no INTEGER, line TEXT)",
+    "CREATE TABLE net_traffic (run_id INTEGER NOT NULL, ip TEXT NOT NULL, timestamp_ms INTEGER, bytes_sent INTEGER)",
+    "CREATE TABLE egress_traffic (run_id INTEGER NOT NULL, ip TEXT NOT NULL, timestamp_ms INTEGER, dst TEXT, bytes_sent INTEGER)",
+    "CREATE TABLE raw_logs (run_id INTEGER NOT NULL, file TEXT NOT NULL, content TEXT)",
+]
+# Created after loading the data, which is faster than maintaining them on every insert
+INDEXES = [
+    "CREATE INDEX transactions_run ON transactions (run_id, client)",
+    "CREATE INDEX events_run_txn ON events (run_id, txn_id)",
+    "CREATE INDEX summaries_run ON summaries (run_id, client)",
+    "CREATE INDEX throughput_log_run ON throughput_log (run_id, client, line_no)",
+    "CREATE INDEX net_traffic_run ON net_traffic (run_id, ip, timestamp_ms)",
+    "CREATE INDEX egress_traffic_run ON egress_traffic (run_id, ip, timestamp_ms)",
+    "CREATE INDEX raw_logs_run ON raw_logs (run_id)",
+]
+
+# Lines of the benchmark container logs kept in 'throughput_log': the per-second counters
+# ('S: x (n); C: ...; A: ...; R: ...'), the 'Avg. TPS' and the start and end of the experiment
+THROUGHPUT_LOG_MARKERS = ['S: ', 'Avg. TPS: ', 'Start sending transactions with', 'Results were written to',
+                          result_loader.START_MARKER, result_loader.END_MARKER]
+
+def find_run_dirs(base_dir):
+    """
+    Lists the run directories of a scenario. Besides the usual '<system>/<x_val>' layout, a '<system>'
+    directory that directly contains the client data (e.g. the latency breakdown) is a run with an empty x_val.
+    """
+    runs = []
+    for run in result_loader.find_runs(base_dir).itertuples(index=False):
+        if run.x_val in ('client', 'raw_logs'):
+            run_dir = join(base_dir, run.system)
+            if not runs or runs[-1]['path'] != run_dir:
+                runs.append({'system': run.system, 'x_val': '', 'path': run_dir})
+        else:
+            runs.append({'system': run.system, 'x_val': run.x_val, 'path': run.path})
+    return runs
+
+def _append(conn, table, df, run_id, client=None):
+    df = df.copy()
+    df.insert(0, 'run_id', run_id)
+    if client is not None:
+        df.insert(1, 'client', client)
+    df.to_sql(table, conn, if_exists='append', index=False)
+
+def _pack_client(conn, run_id, client_dir, client):
+    path = join(client_dir, 'transactions.csv')
+    if os.path.exists(path) or os.path.exists(benchmark_csv.columnar_path(path)):
+        for chunk in benchmark_csv.iter_transactions(path):
+            _append(conn, 'transactions', chunk, run_id, client)
+    path = join(client_dir, 'txn_events.csv')
+    if os.path.exists(path) or os.path.exists(benchmark_csv.columnar_path(path)):
+        for chunk in benchmark_csv.iter_events(path):
+            _append(conn, 'events', chunk.assign(event=chunk['event'].cat.codes), run_id, client)
+    path = join(client_dir, 'summary.csv')
+    if os.path.exists(path) or os.path.exists(benchmark_csv.columnar_path(path)):
+        _append(conn, 'summaries', benchmark_csv.read_summary(path), run_id, client)
+
+def _pack_logs(conn, run_id, run_dir):
+    for client, path in result_loader.container_log_paths(run_dir):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [(i, line.rstrip('\n')) for i, line in enumerate(f) if any(m in line for m in THROUGHPUT_LOG_MARKERS)]
+        _append(conn, 'throughput_log', pd.DataFrame(lines, columns=['line_no', 'line']), run_id, client)
+    raw_log_dir = join(run_dir, 'raw_logs')
+    if not isdir(raw_log_dir):
+        return
+    for file in sorted(os.listdir(raw_log_dir)):
+        path = join(raw_log_dir, file)
+        if file.startswith('net_traffic_') and file.endswith('.csv'):
+            ip = file[len('net_traffic_'):-len('.csv')].replace('_', '.')
+            net_traffic = pd.read_csv(path, usecols=['timestamp_ms', 'bytes_sent'], dtype='int64')
+            _append(conn, 'net_traffic', net_traffic.assign(ip=ip)[['ip', 'timestamp_ms', 'bytes_sent']], run_id)
+        elif file.startswith('egress_traffic_') and file.endswith('.csv'):
+            ip = file[len('egress_traffic_'):-len('.csv')].replace('_', '.')
+            egress_traffic = pd.read_csv(path, dtype={'timestamp_ms': 'int64', 'dst': str, 'bytes_sent': 'int64'})
+            _append(conn, 'egress_traffic', egress_traffic.assign(ip=ip)[['ip', 'timestamp_ms', 'dst', 'bytes_sent']], run_id)
+        elif result_loader.is_raw_log_file(file):
+            with open(path, "r", encoding="utf-8") as f:
+                conn.execute("INSERT INTO raw_logs VALUES (?, ?, ?)", (run_id, file, f.read()))
+
+def pack_scenario(base_dir, store_path=None):
+    """
+    Packs all the runs of a scenario into a single store, replacing any previous one.
+
+    :param base_dir: Directory of the scenario (e.g. 'plots/raw_data/ycsb/baseline').
+    :param store_path: Path of the store (by default 'runs.sqlite' inside 'base_dir').
+    :return: The path of the store.
+    """
+    store_path = store_path or join(base_dir, STORE_FILE)
+    tmp_path = store_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The store is written from scratch and only moved in place once complete, so no journal is needed
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany("INSERT INTO event_names VALUES (?, ?)", enumerate(benchmark_csv.TRANSACTION_EVENTS))
+        for run_id, run in enumerate(find_run_dirs(base_dir)):
+            print(f"Packing run {run['system']}/{run['x_val']}")
+            conn.execute("INSERT INTO runs VALUES (?, ?, ?)", (run_id, run['system'], run['x_val']))
+            for client in result_loader.list_clients(run['path']):
+                _pack_client(conn, run_id, join(run['path'], 'client', client), client)
+            _pack_logs(conn, run_id, run['path'])
+        for statement in INDEXES:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, store_path)
+    return store_path
+
+def connect(store_path):
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"No run store at {store_path}")
+    return sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+
+def _query(store_path, sql, params=()):
+    with closing(connect(store_path)) as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+def _query_chunks(store_path, sql, params=(), chunksize=benchmark_csv.CHUNK_SIZE):
+    with closing(connect(store_path)) as conn:
+        yield from pd.read_sql_query(sql, conn, params=params, chunksize=chunksize)
+
+def find_runs(store_path):
+    """
+    Lists all the runs in a store, like 'result_loader.find_runs'. The 'path' of every run is the store.
+    """
+    runs = _query(store_path, "SELECT system, x_val FROM runs ORDER BY system, x_val")
+    return runs.assign(path=store_path)
+
+def _run_clause(run):
+    return "run_id = (SELECT run_id FROM runs WHERE system = ? AND x_val = ?)", (run.system, run.x_val)
+
+def _load_client_table(runs, table, columns):
+    frames = []
+    for run in runs.itertuples(index=False):
+        where, params = _run_clause(run)
+        # Same order as reading the CSVs of the sorted client directories one after the other
+        sql = f"SELECT client, {', '.join(columns)} FROM {table} WHERE {where} ORDER BY client, rowid"
+        df = _query(run.path, sql, params)
+        df['system'] = run.system
+        df['x_val'] = run.x_val
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=result_loader.CLIENT_KEYS + list(columns))
+    df = pd.concat(frames, ignore_index=True)
+    return result_loader._as_categories(df[result_loader.CLIENT_KEYS + list(columns)], result_loader.CLIENT_KEYS)
+
+def load_transactions(runs, columns=result_loader.LATENCY_COLUMNS):
+    """
+    Loads the projected columns of the transactions of the given runs into one table.
+    """
+    df = _load_client_table(runs, 'transactions', columns)
+    return df.astype({c: benchmark_csv.TXN_DTYPES[c] for c in columns})
+
+def load_events(runs, columns=('txn_id', 'event', 'time')):
+    """
+    Loads the projected columns of the txn events of the given runs into one table.
+    The 'event' column is a categorical of benchmark_csv.TRANSACTION_EVENTS.
+    """
+    columns = list(columns)
+    df = _load_client_table(runs, 'events', columns)
+    df = df.astype({c: benchmark_csv.EVENTS_DTYPES[c] for c in columns if c != 'event'})
+    if 'event' in columns:
+        df['event'] = pd.Categorical.from_codes(df['event'].to_numpy(dtype=np.int64), dtype=benchmark_csv.EVENT_DTYPE)
+    return df
+
+def load_summaries(runs, columns=result_loader.ABORT_COLUMNS):
+    """
+    Loads the projected columns of the summaries of the given runs into one table.
+    Only the first row (generator) of each client is kept, like 'result_loader.load_summaries'.
+    """
+    df = _load_client_table(runs, 'summaries', columns)
+    df = df.astype({c: benchmark_csv.SUMMARY_DTYPES[c] for c in columns})
+    return df.groupby(result_loader.CLIENT_KEYS, observed=True, sort=False).head(1).reset_index(drop=True)
+
+def load_throughput_log(runs):
+    """
+    Loads the throughput lines of the benchmark container logs of the given runs, in log order.
+    """
+    return _load_client_table(runs, 'throughput_log', ['line_no', 'line'])
+
+def load_container_logs(runs):
+    """
+    Same as 'result_loader.load_container_logs', but parsing the throughput lines in the store.
+    """
+    rows = []
+    lines = load_throughput_log(runs)
+    for (system, x_val, client), client_lines in lines.groupby(result_loader.CLIENT_KEYS, observed=True, sort=False):
+        avg_tps, start_ns, end_ns = result_loader.parse_container_log(client_lines['line'])
+        rows.append({'system': system, 'x_val': x_val, 'client': client, 'avg_tps': avg_tps,
+                     'start_ns': start_ns, 'end_ns': end_ns})
+    return result_loader.container_logs_frame(rows)
+
+def load_throughput_series(runs):
+    """
+    Same as 'result_loader.load_throughput_series', but parsing the throughput lines in the store.
+    """
+    lines = load_throughput_log(runs)
+    frames = [(key, result_loader.parse_tps_lines(client_lines['line']))
+              for key, client_lines in lines.groupby(result_loader.CLIENT_KEYS, observed=True, sort=False)]
+    return result_loader.tps_series_frame(frames)
+
+def latency_sketches(runs, relative_accuracy, chunksize=benchmark_csv.CHUNK_SIZE):
+    """
+    Same as 'result_loader.latency_sketches', but streaming the latencies out of the store.
+    """
+    sketches = {}
+    for run in runs.itertuples(index=False):
+        where, params = _run_clause(run)
+        sql = f"SELECT client, received_at - sent_at AS latency FROM transactions WHERE {where} ORDER BY client, rowid"
+        for chunk in _query_chunks(run.path, sql, params, chunksize):
+            for client, latencies in chunk.groupby('client', sort=False):
+                key = (run.system, run.x_val, client)
+                sketches.setdefault(key, LatencySketch(relative_accuracy)).update(latencies['latency'].to_numpy() / 1000000)
+    index = pd.MultiIndex.from_tuples(list(sketches.keys()), names=result_loader.CLIENT_KEYS)
+    return pd.Series(list(sketches.values()), index=index, dtype=object)
+
+def read_raw_logs(run):
+    """
+    Same as 'result_loader.read_raw_logs' for a run of a store.
+    """
+    where, params = _run_clause(run)
+    files = _query(run.path, f"SELECT file, content FROM raw_logs WHERE {where} ORDER BY file = 'benchmark_cmd.log' DESC, rowid", params)
+    if 'benchmark_cmd.log' not in files['file'].values:
+        raise FileNotFoundError(f"No benchmark_cmd.log for run {run.system}/{run.x_val} in {run.path}")
+    return result_loader.parse_raw_logs(files.itertuples(index=False))
+
+def read_net_traffic(run, ip):
+    """
+    Same as 'result_loader.read_net_traffic' for a run of a store.
+    """
+    where, params = _run_clause(run)
+    sql = f"SELECT timestamp_ms, bytes_sent FROM net_traffic WHERE {where} AND ip = ? ORDER BY rowid"
+    net_traffic = _query(run.path, sql, params + (ip,))
+    return None if net_traffic.empty else net_traffic
+
+def read_egress_traffic(run, ip):
+    """
+    Same as 'result_loader.read_egress_traffic' for a run of a store. Only the rows are stored, so a server
+    that sent nothing counts as having no such log.
+    """
+    # Stores packed before the per-destination logs existed don't have the table
+    if _query(run.path, "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'egress_traffic'").empty:
+        return None
+    where, params = _run_clause(run)
+    sql = f"SELECT timestamp_ms, dst, bytes_sent FROM egress_traffic WHERE {where} AND ip = ? ORDER BY rowid"
+    egress_traffic = _query(run.path, sql, params + (ip,))
+    return None if egress_traffic.empty else egress_traffic
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack all the raw results of a scenario into a single SQLite store.")
+    parser.add_argument('-df', '--data_folder', default='plots/raw_data/ycsb/baseline', help='Directory of the scenario to pack')
+    parser.add_argument('-o', '--output', default=None, help=f'Path of the store (default: <data_folder>/{STORE_FILE})')
+    args = parser.parse_args()
+    print(f"Store written to {pack_scenario(args.data_folder, args.output)}")
@@ -0,0 +1,30 @@
+import os
+
+import pandas as pd
+import pytest
+
+import benchmark_csv
+
+pytest.importorskip('pyarrow')
+
+def write_summary(path, committed):
+    row = {column: 0 for column in benchmark_csv.SUMMARY_COLUMNS}
+    pd.DataFrame([{**row, 'committed': committed}]).to_csv(path, index=False)
+
+def test_read_summary_prefers_the_parquet_version(tmp_path):
+    path = str(tmp_path / 'summary.csv')
+    write_summary(path, 10)
+    pd.read_csv(path).to_parquet(benchmark_csv.columnar_path(path), index=False)
+    os.remove(path)
+    assert benchmark_csv.read_summary(path)['committed'].tolist() == [10]
+
+def test_read_summary_ignores_an_outdated_parquet_version(tmp_path):
+    path = str(tmp_path / 'summary.csv')
+    write_summary(path, 10)
+    parquet_path = benchmark_csv.columnar_path(path)
+    pd.read_csv(path).to_parquet(parquet_path, index=False)
+    # The CSV is written again after its conversion, e.g. by a resumed fetch
+    write_summary(path, 20)
+    converted_at = os.path.getmtime(path) - 10
+    os.utime(parquet_path, (converted_at, converted_at))
+    assert benchmark_csv.read_summary(path)['committed'].tolist() == [20]
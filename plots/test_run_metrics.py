@@ -0,0 +1,38 @@
+from collections import namedtuple
+
+import pytest
+
+import run_metrics
+
+Run = namedtuple('Run', ['system', 'x_val', 'path'])
+
+CONF = '''regions: {
+    addresses: "10.0.0.1"
+    client_addresses: "10.0.0.3"
+}
+regions: {
+    addresses: "10.0.0.2"
+    client_addresses: "10.0.0.4"
+}
+'''
+BENCHMARK_CMD = ("benchmark --config /home/wmarcu/data/cluster.conf --region 0 --replica 0 "
+                 "--data-dir /home/wmarcu/data --out-dir /home/wmarcu/data/tag --duration 30 --wl basic ")
+
+def write_run(tmp_path, benchmark_cmd_log):
+    raw_log_dir = tmp_path / 'raw_logs'
+    raw_log_dir.mkdir()
+    (raw_log_dir / 'benchmark_cmd.log').write_text(benchmark_cmd_log)
+    (raw_log_dir / 'cluster.conf').write_text(CONF)
+    return Run('Detock', '0', str(tmp_path))
+
+@pytest.mark.parametrize('message', ['Synced config and ran command', 'Created container with command',
+                                     'Created exec with command'])
+def test_cost_inputs_reads_the_duration_of_every_log_format(tmp_path, message):
+    log = f"2026-10-17 12:00:00,000      admin INFO: 10.0.0.3: {message}: {BENCHMARK_CMD}\n"
+    inputs = run_metrics.cost_inputs(write_run(tmp_path, log), 'aws', 0, 30_000_000_000)
+    assert (inputs['duration'] == 30).all()
+    assert not inputs['measured'].any()
+
+def test_cost_inputs_without_benchmark_command(tmp_path):
+    with pytest.raises(ValueError, match='No benchmark command'):
+        run_metrics.cost_inputs(write_run(tmp_path, 'nothing here\n'), 'aws', 0, 1)
@@ -4,30 +4,34 @@
 This tool is used to control a cluster of SLOG servers. For example,
 starting a cluster, stopping a cluster, getting status, and more.
 """
+import calendar
 import collections
+import csv
 import ipaddress
 import itertools
 import logging
-import os, sys, time, shutil
+import os, re, signal, subprocess, sys, threading, time
 
 import docker
 import google.protobuf.text_format as text_format
 
 from datetime import datetime
-from multiprocessing.dummy import Pool
 from typing import Dict, List, Tuple
 
 from docker.models.containers import Container
 from paramiko.ssh_exception import PasswordRequiredException
 
 from common import Command, initialize_and_run_commands
-from netem import gen_netem_script
+from columnar import convert_all
+from connection_pool import SSH, get_docker_client
+from data_fetch import COMPRESSIONS, MAX_PARALLEL_FETCHES, TAIL_INTERVAL_SEC, fetch_all, tail_all
+from image_distribution import PULL_MODES, distribute_image
+from netem import compile_topology, program_script, read_region_matrix, select_regions, verify_program
+from orchestrator import Orchestrator
 from proto.configuration_pb2 import Configuration, Region
 
 LOG = logging.getLogger("admin")
 
-SSH = 'ssh "-o StrictHostKeyChecking no"'
-
 USER = "wmarcu"
 CONTAINER_DATA_DIR = "/home/wmarcu/data"
 HOST_DATA_DIR = "/home/wmarcu/data"
@@ -37,6 +41,14 @@ SLOG_CONTAINER_NAME = "slog"
 SLOG_CLIENT_CONTAINER_NAME = "slog_client"
 SLOG_BENCHMARK_CONTAINER_NAME = "benchmark"
 SLOG_DATA_MOUNT = docker.types.Mount(target=CONTAINER_DATA_DIR, source=HOST_DATA_DIR, type="bind")
+# Printed by a benchmark container, followed by the epoch time in ns, when it passes the start barrier
+BENCHMARK_START_MARKER = "BENCHMARK_START"
+# Printed by a benchmark container, followed by the epoch time in ns, when the benchmark exits
+BENCHMARK_END_MARKER = "BENCHMARK_END"
+# Output of the benchmark written in its data directory when tailing
+BENCHMARK_LOG_FILE = "benchmark.log"
+# Process group of the benchmark running in a warm container, so that it can be killed as a whole
+BENCHMARK_EXEC_PGID_FILE = "/tmp/benchmark_exec.pgid"
 
 RemoteProcess = collections.namedtuple(
     "RemoteProcess",
@@ -58,6 +70,14 @@ def public_addresses(reg: Region):
 def private_addresses(reg: Region):
     return reg.addresses
 
+def client_machines(config: Configuration):
+    """Client machines and the names of their directories in the collected data"""
+    return [
+        {"address": c, "name": f"{i}-{j}"}
+        for i, r in enumerate(config.regions)
+        for j, c in enumerate(r.client_addresses)
+    ]
+
 def cleanup_container(client: docker.DockerClient, name: str, addr="") -> None:
     """
     Cleans up a container with a given name.
@@ -93,6 +113,141 @@ def wait_for_containers(containers: List[Tuple[Container, str]]) -> None:
         else:
             LOG.error("%s: Finished with non-zero status (%d). " 'Check the logs of the container "%s" for more details', addr, res["StatusCode"], c.name)
 
+def get_warm_container(client: docker.DockerClient, image: str, name: str, addr="") -> Container:
+    """
+    Returns a long-lived idle container of the given image in which benchmarks can be
+    executed, creating it if it does not exist, is stopped, or runs an outdated image.
+    """
+    try:
+        c = client.containers.get(name)
+        if c.status == "running" and c.image.id == client.images.get(image).id:
+            return c
+        c.remove(force=True)
+    except docker.errors.NotFound:
+        pass
+    c = client.containers.run(
+        image,
+        name=name,
+        command=["sleep", "infinity"],
+        mounts=[SLOG_DATA_MOUNT],
+        network_mode="host",
+        detach=True,
+    )
+    LOG.info('%sStarted warm container "%s"', f"{addr}: " if addr else "", name)
+    return c
+
+class BenchmarkExec:
+    """
+    A benchmark run inside a warm container with "docker exec".
+
+    It mimics the parts of Container used by wait_for_containers() and read_start_time().
+    The output of the run is redirected to the main process of the container, so it
+    shows up in "docker logs" like for a regular benchmark container. The logs of the
+    container also hold the output of the previous runs, so only those written since
+    the creation of the exec are read. The run is the leader of a new session, and
+    writes its process group to BENCHMARK_EXEC_PGID_FILE.
+    """
+
+    def __init__(self, container: Container, command: str, environment: Dict[str, str]):
+        self.container = container
+        self.name = container.name
+        self.status = "created"
+        self.since = time.time()
+        self.exec_id = container.client.api.exec_create(
+            container.id,
+            ["setsid", "-w", "/bin/sh", "-c", f"echo $$ > {BENCHMARK_EXEC_PGID_FILE}; ({command}) > /proc/1/fd/1 2> /proc/1/fd/2"],
+            environment=environment,
+        )["Id"]
+
+    def start(self):
+        self.container.client.api.exec_start(self.exec_id, detach=True)
+        self.status = "running"
+
+    def logs(self, **kwargs):
+        return self.container.logs(since=self.since, **kwargs)
+
+    def reload(self):
+        if not self.container.client.api.exec_inspect(self.exec_id)["Running"]:
+            self.status = "exited"
+
+    def wait(self):
+        while True:
+            info = self.container.client.api.exec_inspect(self.exec_id)
+            if not info["Running"]:
+                self.status = "exited"
+                return {"StatusCode": info["ExitCode"]}
+            time.sleep(1)
+
+def read_start_time(container: Container, start_ns: int, timeout: float) -> int:
+    """
+    Polls the output of a benchmark container until it passes the start barrier.
+    Returns the epoch time in ns at which it started, or None if it never did.
+    """
+    deadline = time.time() + timeout
+    while True:
+        for line in container.logs(stdout=True, stderr=False).decode().splitlines():
+            # Guards against the markers of the previous runs of a warm container
+            if line.startswith(BENCHMARK_START_MARKER) and int(line.split()[1]) >= start_ns:
+                return int(line.split()[1])
+        container.reload()
+        if container.status == "exited" or time.time() > deadline:
+            return None
+        time.sleep(0.5)
+
+def report_start_skew(orchestrator: Orchestrator, containers: List[Tuple[Container, str]], start_ns: int, timeout: float) -> None:
+    """
+    Logs how far from the common start time each benchmark container actually started.
+    """
+    delays = [max(start_ns / 1e9 - time.time(), 0)] * len(containers)
+    start_times = orchestrator.run_phase(
+        "start_skew",
+        lambda container_and_addr: read_start_time(container_and_addr[0], start_ns, timeout),
+        containers,
+        host=lambda container_and_addr: container_and_addr[1],
+        delays=delays,
+        raise_errors=False,
+    )
+    skews = []
+    for (_, addr), start_time in zip(containers, start_times):
+        if start_time is None or isinstance(start_time, Exception):
+            LOG.error("%s: Could not determine the start time of the benchmark", addr)
+            continue
+        skew = (start_time - start_ns) / 1e6
+        skews.append(skew)
+        LOG.info("%s: Started %.1f ms after the start time", addr, skew)
+    if skews:
+        LOG.info("Start skew across %d client(s): %.1f ms (max %.1f ms late)", len(skews), max(skews) - min(skews), max(skews))
+        if max(skews) > 1000:
+            LOG.warning("Some clients passed the start barrier late. Consider increasing --start-lead")
+
+# Throughput line logged every second by the benchmark, e.g.
+# "I1017 12:00:01.123456    42 benchmark.cpp:153] S: 100 (1000); C: 98 (950); A: 0 (0); R: 2 (10)"
+TPS_LINE_RE = re.compile(
+    r"^[IWEF](\d{2})(\d{2}) (\d{2}):(\d{2}):(\d{2})\.(\d{6}).*"
+    r"S: (\d+) \((\d+)\); C: (\d+) \((\d+)\); A: (\d+) \((\d+)\); R: (\d+) \((\d+)\)"
+)
+TPS_COLUMNS = ["send_tps", "commit_tps", "abort_tps", "restart_tps", "sent", "committed", "aborted", "restarted"]
+
+def parse_tps_line(line: str, year: int):
+    """
+    Parses a throughput line of the benchmark log.
+    Returns the time of the line in seconds since epoch and a dict of TPS_COLUMNS, or None
+    if the line is not a throughput line. The glog timestamps have no year and are in UTC.
+    """
+    m = TPS_LINE_RE.match(line)
+    if m is None:
+        return None
+    month, day, hour, minute, sec, usec = map(int, m.groups()[:6])
+    timestamp = calendar.timegm((year, month, day, hour, minute, sec)) + usec / 1e6
+    rates = m.groups()[6:]
+    values = {
+        "send_tps": rates[0], "sent": rates[1],
+        "commit_tps": rates[2], "committed": rates[3],
+        "abort_tps": rates[4], "aborted": rates[5],
+        "restart_tps": rates[6], "restarted": rates[7],
+    }
+    return timestamp, {k: int(v) for k, v in values.items()}
+
 def parse_envs(envs: List[str]) -> Dict[str, str]:
     """Parses a list of environment variables
 
@@ -108,48 +263,118 @@ def parse_envs(envs: List[str]) -> Dict[str, str]:
     env_var_tuples = [env.split("=") for env in envs]
     return {env[0]: env[1] for env in env_var_tuples}
 
-def fetch_data(machines, user, tag, out_path):
+# Waits until the common start time of the benchmark containers (in $BENCHMARK_START_NS), then prints the start marker
+BENCHMARK_WAIT_CMD = (
+    'while [ "$(date +%s%N)" -lt "$BENCHMARK_START_NS" ]; do sleep 0.001; done; '
+    f'echo "{BENCHMARK_START_MARKER} $(date +%s%N)"'
+)
+BENCHMARK_END_CMD = f'echo "{BENCHMARK_END_MARKER} $(date +%s%N)"'
+
+def add_workload_arguments(parser, txns_required=True):
+    parser.add_argument("--txns", type=int, default=10, required=txns_required, help="Number of transactions generated per benchmark machine")
+    parser.add_argument("--duration", type=int, default=0, help="How long the benchmark is run in seconds")
+    parser.add_argument("--tag", help="Tag of this benchmark run. Auto-generated if not provided")
+    parser.add_argument("--workload", "-wl", choices=["basic", "cockroach", "remastering", "tpcc", "movr"], default="basic", help="Name of the workload to run benchmark with")
+    parser.add_argument("--params", default="", help="Parameters of the workload")
+    parser.add_argument("--rate", type=int, default=0, help="Maximum number of transactions sent per second")
+    parser.add_argument("--clients", type=int, default=0, help="Number of clients sending synchronized txns")
+    parser.add_argument("--generators", type=int, default=1, help="Number of threads for each benchmark machine")
+    parser.add_argument("--sample", type=int, default=10, help="Percent of sampled transactions to be written to result files")
+    parser.add_argument("--txn-profiles", action="store_true", help="Output the profile of the sampled txns")
+    parser.add_argument("--seed", type=int, default=-1, help="Seed for the randomization in the benchmark. Set to -1 for random seed")
+    parser.add_argument("--start-lead", type=float, default=10.0, help="Seconds between creating the benchmark containers and the common start time. "
+                        "Increase it if clients report a large start skew")
+
+def generate_seed(addr: str, seed: int) -> int:
+    # We need to generate a seed for each client container
+    for c in addr:
+        seed ^= ord(c)
+    return seed
+
+def benchmark_shell_cmd(args, config_path: str, reg: int, rep: int, out_dir: str, addr: str) -> str:
+    """
+    Command running the benchmark of a client with the workload arguments of add_workload_arguments.
+    """
+    return (
+        f"benchmark "
+        f"--config {config_path} "
+        f"--region {reg} "
+        f"--replica {rep} "
+        f"--data-dir {CONTAINER_DATA_DIR} "
+        f"--out-dir {out_dir} "
+        f"--duration {args.duration} "
+        f"--wl {args.workload} "
+        f'--params "{args.params}" '
+        f"--txns {args.txns} "
+        f"--generators {args.generators} "
+        f"--sample {args.sample} "
+        f"--seed {generate_seed(addr, args.seed)} "
+        f"--txn_profiles={args.txn_profiles} "
+        f"--rate {args.rate} "
+        f"--clients {args.clients} "
+    )
+
+def log_benchmark_launch(addr: str, shell_cmd: str) -> None:
+    """
+    Logs the command of a benchmark client. The duration of a run is read back from
+    this line of the output of the benchmark command (see plots/run_metrics.py).
+    """
+    LOG.info("%s: Synced config and ran command: %s", addr, shell_cmd)
+
+def benchmark_processes(config: Configuration) -> List[RemoteProcess]:
+    """
+    Spreads the client machines of every region over its replicas. The docker clients are left unset.
+    """
+    procs = []
+    for reg, reg_info in enumerate(config.regions):
+        num_addresses = len(reg_info.client_addresses)
+        step = max((num_addresses + 1) // reg_info.num_replicas, 1)
+        i = 0
+        for rep in range(reg_info.num_replicas - 1):
+            for j in range(step):
+                if i < num_addresses:
+                    addr = reg_info.client_addresses[i]
+                    procs.append(RemoteProcess(None, addr, None, reg, rep, j))
+                    i += 1
+        j = 0
+        while i < num_addresses:
+            addr = reg_info.client_addresses[i]
+            procs.append(RemoteProcess(None, addr, None, reg, reg_info.num_replicas - 1, j))
+            i += 1
+            j += 1
+    return procs
+
+def fetch_data(machines, user, tag, out_path, orchestrator=None, compression="gzip", resume=False, jobs=MAX_PARALLEL_FETCHES):
     """Fetch data from remote machines
 
-    @param machines list of machine info dicts. Each dict has the following format:
-                    {
-                        'address': address of the machine,
-                        'name': name of directory containing the fetched data for this machine
-                    }
-    @param user      username used to ssh to the machines
-    @param tag       tag of the data to fetch
-    @param output    directory containing the fetched data
+    @param machines     list of machine info dicts. Each dict has the following format:
+                        {
+                            'address': address of the machine,
+                            'name': name of directory containing the fetched data for this machine
+                        }
+    @param user         username used to ssh to the machines
+    @param tag          tag of the data to fetch
+    @param out_path     directory containing the fetched data
+    @param orchestrator orchestrator running the transfers
+    @param compression  compression used on the wire (see data_fetch.COMPRESSIONS)
+    @param resume       keep the data already fetched into out_path and only fetch the rest
+    @param jobs         maximum number of machines fetched from at the same time
     """
-    if os.path.exists(out_path):
-        shutil.rmtree(out_path, ignore_errors=True)
-        LOG.info("Removed existing directory: %s", out_path)
-
-    home_dir = os.getcwd()
-    #os.makedirs(os.path.join(home_dir, out_path))
-    os.makedirs(out_path)
-    LOG.info(f"Created directory: {out_path} withing directory {home_dir}")
-    #LOG.info(f"Currently it contains: {os.listdir(out_path)}")
-
-    commands = []
-    for m in machines:
-        addr = m["address"]
-        data_path = os.path.join(HOST_DATA_DIR, tag)
-        data_tar_file = f'{m["name"]}.tar.gz'
-        data_tar_path = os.path.join(HOST_DATA_DIR, data_tar_file)
-        out_tar_path = os.path.join(out_path, data_tar_file)
-        out_final_path = os.path.join(out_path, m["name"])
-
-        os.makedirs(out_final_path, exist_ok=True)
-        # Use SSH to perform data/metrics logging from other machines
-        cmd = (
-            f'{SSH} {user}@{addr} "tar -czf {data_tar_path} -C {data_path} ." && '
-            f"rsync -vh --inplace {user}@{addr}:{data_tar_path} {out_path} && "
-            f"tar -xzf {out_tar_path} -C {out_final_path}"
-        )
-        commands.append(f"({cmd}) & ")
+    return fetch_all(
+        machines,
+        user,
+        os.path.join(HOST_DATA_DIR, tag),
+        out_path,
+        orchestrator=orchestrator,
+        compression=compression,
+        resume=resume,
+        jobs=jobs,
+    )
 
-    LOG.info("Executing commands:\n%s", "\n".join(commands))
-    os.system("".join(commands) + " wait")
+def add_fetch_arguments(parser):
+    parser.add_argument("--compression", choices=COMPRESSIONS.keys(), default="gzip", help="Compression of the data sent over the wire")
+    parser.add_argument("--resume", action="store_true", help="Keep the data already fetched and only fetch the missing files")
+    parser.add_argument("--fetch-jobs", type=int, default=MAX_PARALLEL_FETCHES, help="Maximum number of machines fetched from at the same time")
 
 class AdminCommand(Command):
     """Base class for a command.
@@ -168,15 +393,19 @@ class AdminCommand(Command):
     def __init__(self):
         self.config = None
         self.config_name = None
+        self.orchestrator = Orchestrator()
 
     def add_arguments(self, parser):
         parser.add_argument("config", nargs="?", default="", metavar="config_file", help="Path to a config file",)
         parser.add_argument("--no-pull", action="store_true", help="Skip image pulling step")
+        parser.add_argument("--pull-mode", choices=PULL_MODES, default="hub", help='How the image is distributed: "hub" pulls it from the registry '
+                            'on every node, "peer" pulls it on one node per region and streams it from node to node')
         parser.add_argument("--image", default=SLOG_IMG, help="Name of the Docker image to use")
         parser.add_argument("--server-container", default=SLOG_CONTAINER_NAME, help="Name of the server container")
         parser.add_argument("--benchmark-container", default=SLOG_BENCHMARK_CONTAINER_NAME, help="Name of the benchmark container")
         parser.add_argument("--client-container", default=SLOG_CLIENT_CONTAINER_NAME, help="Name of the client container")
         parser.add_argument("--user", "-u", default=USER, help="Username of the target machines")
+        parser.add_argument("--timings-out", help="Write the time taken by every phase on every host to this CSV file")
 
     def initialize_and_do_command(self, args):
         # The initialization phase is broken down into smaller methods so
@@ -186,6 +415,8 @@ class AdminCommand(Command):
         self.pull_slog_image(args)
         # Perform the command
         self.do_command(args)
+        if getattr(args, "timings_out", None):
+            self.orchestrator.write_timings(args.timings_out)
 
     def load_config(self, args):
         self.config_name = os.path.basename(args.config)
@@ -233,8 +464,9 @@ class AdminCommand(Command):
 
             return remote_proc._replace(docker_client=client)
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            self.remote_procs = pool.map(init_docker_client, self.remote_procs)
+        self.remote_procs = self.orchestrator.run_phase(
+            "connect", init_docker_client, self.remote_procs, host=lambda proc: proc.public_address
+        )
 
     def pull_slog_image(self, args):
         if len(self.remote_procs) == 0 or args.no_pull:
@@ -242,9 +474,9 @@ class AdminCommand(Command):
             return
         LOG.info('Pulling image "%s" for each node. ' "This might take a while.", args.image)
 
-        clients = {client for client, *_ in self.remote_procs}
-        with Pool(processes=len(clients)) as pool:
-            pool.map(lambda client: client.images.pull(args.image), clients)
+        # Several remote processes may share the same host
+        hosts = {addr: (client, region) for client, addr, _, region, *_ in self.remote_procs if client is not None}
+        distribute_image(hosts, args.image, args.user, self.orchestrator, args.pull_mode)
 
     def do_command(self, args):
         raise NotImplementedError
@@ -254,10 +486,10 @@ class AdminCommand(Command):
     ##############################
     def new_docker_client(self, user, addr):
         """
-        Gets a new Docker client for a given address.
+        Gets a Docker client for a given address. Clients are pooled, so consecutive commands
+        in the same process reuse the connection opened by the first one.
         """
-        LOG.info('Launching Docker client of user %s and address %s', user, addr)
-        return docker.DockerClient(base_url=f"ssh://{user}@{addr}")
+        return get_docker_client(user, addr)
 
 class StartCommand(AdminCommand):
 
@@ -285,8 +517,7 @@ class StartCommand(AdminCommand):
             client, addr, *_ = remote_proc
             cleanup_container(client, args.server_container, addr=addr)
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            pool.map(clean_up, self.remote_procs)
+        self.orchestrator.run_phase("cleanup", clean_up, self.remote_procs, host=lambda proc: proc.public_address, retries=2)
 
         def start_container(remote_proc):
             client, pub_address, priv_address, *_ = remote_proc
@@ -305,8 +536,7 @@ class StartCommand(AdminCommand):
             )
             LOG.info("%s: Synced config and ran command: %s", pub_address, shell_cmd)
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            pool.map(start_container, self.remote_procs)
+        self.orchestrator.run_phase("start", start_container, self.remote_procs, host=lambda proc: proc.public_address)
 
 class StopCommand(AdminCommand):
 
@@ -332,8 +562,7 @@ class StopCommand(AdminCommand):
             except docker.errors.NotFound:
                 pass
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            pool.map(stop_container, self.remote_procs)
+        self.orchestrator.run_phase("stop", stop_container, self.remote_procs, host=lambda proc: proc.public_address, retries=2)
 
 class StatusCommand(AdminCommand):
 
@@ -448,6 +677,109 @@ class LogsCommand(AdminCommand):
         else:
             print(c.logs(tail=args.tail).decode(), end="")
 
+class WatchCommand(AdminCommand):
+
+    NAME = "watch"
+    HELP = "Show the throughput of all benchmark clients in real time"
+
+    # A client whose last throughput line is older than this is not counted in the totals
+    STALE_AFTER_SEC = 3
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--out", default="tps.csv", help="CSV file receiving the throughput reported by every client over time")
+        parser.add_argument("--interval", type=float, default=1, help="Seconds between two refreshes of the display")
+        parser.add_argument("--container", help="Name of the container to follow. Defaults to the benchmark container")
+        parser.add_argument("-n", "--tail", default="all", help='Number of lines at the end of the logs to start from, or "all"')
+
+    def init_remote_processes(self, args):
+        self.remote_procs = [
+            RemoteProcess(None, addr, None, reg, None, j)
+            for reg, reg_info in enumerate(self.config.regions)
+            for j, addr in enumerate(reg_info.client_addresses)
+        ]
+
+        def init_docker_client(proc):
+            return proc._replace(docker_client=self.new_docker_client(args.user, proc.public_address))
+
+        self.remote_procs = self.orchestrator.run_phase(
+            "connect", init_docker_client, self.remote_procs, host=lambda proc: proc.public_address, retries=2
+        )
+
+    def pull_slog_image(self, args):
+        """
+        Override this method to skip the image pulling step.
+        """
+        pass
+
+    def do_command(self, args):
+        container_name = args.container or args.benchmark_container
+        tail = args.tail if args.tail == "all" else int(args.tail)
+        year = datetime.utcnow().year
+        # Last throughput line of each client
+        latest = {}
+        lock = threading.Lock()
+
+        out_file = open(args.out, "w", newline="")
+        writer = csv.writer(out_file)
+        writer.writerow(["time", "region", "client"] + TPS_COLUMNS)
+
+        def follow(proc):
+            client, addr, _, region, _, j = proc
+            # Same name as the directory of the client in the collected data
+            name = f"{region}-{j}"
+            try:
+                container = client.containers.get(container_name)
+            except docker.errors.NotFound:
+                LOG.error('%s: Cannot find container "%s"', addr, container_name)
+                return
+            buffer = ""
+            for chunk in container.logs(stream=True, follow=True, tail=tail):
+                # The chunks are not aligned with the lines
+                buffer += chunk.decode(errors="replace")
+                *lines, buffer = buffer.split("\n")
+                for line in lines:
+                    parsed = parse_tps_line(line, year)
+                    if parsed is None:
+                        continue
+                    timestamp, values = parsed
+                    with lock:
+                        latest[name] = (timestamp, region, values)
+                        writer.writerow([f"{timestamp:.3f}", region, name] + [values[c] for c in TPS_COLUMNS])
+            LOG.info("%s: Container log ended", addr)
+
+        followers = [threading.Thread(target=follow, args=(proc,), daemon=True) for proc in self.remote_procs]
+        for follower in followers:
+            follower.start()
+
+        try:
+            while any(follower.is_alive() for follower in followers):
+                time.sleep(args.interval)
+                with lock:
+                    out_file.flush()
+                    self.__print_totals(latest, time.time())
+        except KeyboardInterrupt:
+            print()
+        finally:
+            with lock:
+                out_file.close()
+            LOG.info("Wrote the throughput over time to %s", args.out)
+
+    def __print_totals(self, latest, now):
+        totals = collections.defaultdict(collections.Counter)
+        for timestamp, region, values in latest.values():
+            if now - timestamp > self.STALE_AFTER_SEC:
+                continue
+            totals["all"].update(values)
+            totals[f"region {region}"].update(values)
+        if not totals:
+            return
+        columns = []
+        for key in ["all"] + sorted(k for k in totals if k != "all"):
+            t = totals[key]
+            columns.append(f"{key}: S {t['send_tps']} C {t['commit_tps']} A {t['abort_tps']} R {t['restart_tps']}")
+        print(datetime.fromtimestamp(now).strftime("%H:%M:%S"), " | ".join(columns), flush=True)
+
 class LocalCommand(AdminCommand):
 
     NAME = "local"
@@ -466,10 +798,25 @@ class LocalCommand(AdminCommand):
     #                benchmark                                      \
     #                   --rate 1 --config /var/tmp/cluster.conf --txns 10 --params mp=100
 
+    # Emulated regions:
+    #
+    # With --rtt-matrix, every container (servers with --start, benchmark clients with --benchmark)
+    # gets the netem program of its address (see netem.compile_topology) on its interface in the
+    # local network, so that the regions of the config are as far from each other as in the matrix.
+    # The program is applied from the host in the network namespace of the container, which needs
+    # passwordless sudo for nsenter. Every destination gets a class of its own, and the byte counters
+    # of these classes give the bytes that each server sends to every other container of the cluster
+    # (see egress_monitor.py), written to <out-dir>/<tag>/raw_logs like those of the remote runs.
+    #
+    #  python3 tools/admin.py local cluster.conf --start --rtt-matrix plots/data/rtt_matrix_regions.csv
+    #  python3 tools/admin.py local cluster.conf --benchmark --rtt-matrix plots/data/rtt_matrix_regions.csv --txns 1000
+
     # Local network
     NETWORK_NAME = "slog_nw"
     SUBNET = "172.28.0.0/16"
     IP_RANGE = "172.28.5.0/24"
+    # Attempts at applying the netem program of a container before giving up on it
+    SHAPE_RETRIES = 2
 
     def add_arguments(self, parser):
         super().add_arguments(parser)
@@ -478,7 +825,16 @@ class LocalCommand(AdminCommand):
         group.add_argument("--stop", action="store_true", help="Stop the local cluster")
         group.add_argument("--remove", action="store_true", help="Remove all containers of the local cluster")
         group.add_argument("--status", action="store_true", help="Get status of the local cluster")
+        group.add_argument("--benchmark", action="store_true", help="Run the benchmark against the local cluster, with one container per client address")
         parser.add_argument("-e", nargs="*", help="Environment variables to pass to the container. For example, use -e GLOG_v=1 to turn on verbose logging at level 1.")
+        parser.add_argument("--rtt-matrix", help="CSV region-to-region matrix of RTTs in ms emulated between the containers of the regions. "
+                            "Give the same matrices to --start and --benchmark")
+        parser.add_argument("--loss-matrix", help="CSV region-to-region matrix of the percentage of packets lost")
+        parser.add_argument("--bandwidth-matrix", help="CSV region-to-region matrix of bandwidths in Mbit/s")
+        parser.add_argument("--matrix-regions", nargs="*", help="Names of the regions of the matrices used for the regions of the config, in order. "
+                            "By default, the first regions of the matrices are used")
+        parser.add_argument("--out-dir", default="data", help="Directory receiving the client data and the byte counters of a benchmark")
+        add_workload_arguments(parser, txns_required=False)
 
     def load_config(self, args):
         super().load_config(args)
@@ -490,6 +846,13 @@ class LocalCommand(AdminCommand):
             for _ in range(num_addresses):
                 ip_address = str(next(address_generator))
                 reg.addresses.append(ip_address.encode())
+        # The clients get the addresses that follow those of the servers, so that both sets are the
+        # same in every invocation
+        for reg in self.config.regions:
+            num_addresses = len(reg.client_addresses)
+            del reg.client_addresses[:]
+            for _ in range(num_addresses):
+                reg.client_addresses.append(str(next(address_generator)).encode())
 
     def init_remote_processes(self, args):
         """
@@ -513,6 +876,8 @@ class LocalCommand(AdminCommand):
 
         if args.start:
             self.__start(args)
+        elif args.benchmark:
+            self.__benchmark(args)
         elif args.stop:
             self.__stop()
         elif args.remove:
@@ -553,6 +918,7 @@ class LocalCommand(AdminCommand):
                 container_name = f"slog_{r}_{p}"
                 cleanup_container(self.client, container_name)
 
+        containers = []
         for r, reg in enumerate(self.config.regions):
             for p, (pub_addr, priv_addr) in enumerate(
                 zip(public_addresses(reg), private_addresses(reg))
@@ -579,9 +945,169 @@ class LocalCommand(AdminCommand):
 
                 # Actually start the container
                 container.start()
+                containers.append((container, priv_addr))
 
                 LOG.info("%s: Synced config and ran command: %s", pub_addr, shell_cmd)
 
+        # The servers only start talking to each other after a while, so the delays are in place
+        # before the first messages
+        self.__shape(args, containers)
+
+    def __network(self):
+        nw_list = self.client.networks.list(names=[self.NETWORK_NAME])
+        if not nw_list:
+            raise RuntimeError(f'Network "{self.NETWORK_NAME}" not found. Start the local cluster first')
+        return nw_list[0]
+
+    def __region_hosts(self):
+        return [
+            [*private_addresses(reg), *reg.client_addresses]
+            for reg in self.config.regions
+        ]
+
+    def __programs(self, args):
+        """
+        Netem programs of all the containers of the cluster, or None without --rtt-matrix. Every
+        container is shaped, so each side of a link gets half of its RTT.
+        """
+        if not args.rtt_matrix:
+            return None
+        matrices = {}
+        for name, path in (("rtt", args.rtt_matrix), ("loss", args.loss_matrix), ("bandwidth", args.bandwidth_matrix)):
+            if path:
+                matrices[name] = select_regions(*read_region_matrix(path), args.matrix_regions)
+        region_hosts = self.__region_hosts()
+        # The interfaces are only known once the containers are running, see __shape
+        devs = {ip: None for hosts in region_hosts for ip in hosts}
+        return compile_topology(
+            region_hosts,
+            matrices["rtt"],
+            devs,
+            loss=matrices.get("loss"),
+            bandwidth=matrices.get("bandwidth"),
+            per_destination=True,
+        )
+
+    def __interface(self, container: Container, addr: str):
+        """
+        Finds the interface of a running container in the local network.
+        :return: The command prefix entering the network namespace of the container and the name of the interface.
+        """
+        container.reload()
+        nsenter = ["sudo", "-n", "nsenter", "-t", str(container.attrs["State"]["Pid"]), "-n"]
+        # The container also has an interface in the default network of docker
+        addr_output = subprocess.run(
+            nsenter + ["ip", "-o", "-4", "addr", "show", "to", addr], check=True, capture_output=True, text=True
+        ).stdout.split()
+        if len(addr_output) < 2:
+            raise RuntimeError(f"No interface with address {addr} in {container.name}")
+        return nsenter, addr_output[1].split("@")[0]
+
+    def __shape(self, args, containers: List[Tuple[Container, str]]):
+        """
+        Applies the netem program of every given container in its network namespace and reads it back.
+        :return: Dict from the address of every shaped container to its program, with the interface set.
+        """
+        programs = self.__programs(args)
+        if programs is None:
+            return {}
+
+        def shape(container_and_addr):
+            container, addr = container_and_addr
+            nsenter, dev = self.__interface(container, addr)
+            program = programs[addr]._replace(dev=dev)
+            result = subprocess.run(nsenter + ["sh", "-s"], input=program_script(program), capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"tc failed with exit code {result.returncode}: {result.stderr.strip()}")
+            qdiscs = subprocess.run(nsenter + ["tc", "qdisc", "show", "dev", program.dev], capture_output=True, text=True)
+            filters = subprocess.run(nsenter + ["tc", "filter", "show", "dev", program.dev], capture_output=True, text=True)
+            problems = verify_program(program, qdiscs.stdout, filters.stdout)
+            if problems:
+                raise RuntimeError("; ".join(problems))
+            return program
+
+        results = self.orchestrator.run_phase(
+            "shape", shape, containers, host=lambda container_and_addr: container_and_addr[1], retries=self.SHAPE_RETRIES
+        )
+        LOG.info("Applied the netem programs of %d containers", len(results))
+        return {addr: program for (_, addr), program in zip(containers, results)}
+
+    def __benchmark(self, args):
+        slog_nw = self.__network()
+        tag = args.tag or datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        config_text = text_format.MessageToString(self.config)
+        config_path = os.path.join(CONTAINER_DATA_DIR, self.config_name)
+        sync_config_cmd = f"echo '{config_text}' > {config_path}"
+        raw_log_dir = os.path.join(args.out_dir, tag, "raw_logs")
+        os.makedirs(raw_log_dir, exist_ok=True)
+
+        # Same start barrier as the benchmark command. The lead also leaves room for shaping the clients
+        start_ns = time.time_ns() + int(args.start_lead * 1e9)
+        environment = {**parse_envs(args.e), "BENCHMARK_START_NS": str(start_ns)}
+        containers = []
+        names = {m["address"]: m["name"] for m in client_machines(self.config)}
+        for proc in benchmark_processes(self.config):
+            _, addr, _, reg, rep, *_ = proc
+            name = names[addr]
+            container_name = f"{args.benchmark_container}_{name}"
+            cleanup_container(self.client, container_name)
+            out_dir = os.path.join(CONTAINER_DATA_DIR, tag, name)
+            shell_cmd = benchmark_shell_cmd(args, config_path, reg, rep, out_dir, addr)
+            command = (
+                f"{sync_config_cmd} && rm -rf {out_dir} && mkdir -p {out_dir} && {BENCHMARK_WAIT_CMD} && "
+                f"{{ {shell_cmd}; benchmark_status=$?; {BENCHMARK_END_CMD}; exit $benchmark_status; }}"
+            )
+            container = self.client.containers.create(
+                args.image,
+                name=container_name,
+                command=["/bin/sh", "-c", command],
+                mounts=[SLOG_DATA_MOUNT],
+                environment=environment,
+            )
+            slog_nw.connect(container, ipv4_address=addr)
+            container.start()
+            containers.append((container, addr))
+            log_benchmark_launch(addr, shell_cmd)
+
+        programs = self.__shape(args, containers)
+        if programs and time.time_ns() > start_ns:
+            LOG.warning("The clients were shaped %.1f s after the start time, so the run began without the emulated network. "
+                        "Consider increasing --start-lead", (time.time_ns() - start_ns) / 1e9)
+
+        # Count the bytes sent by every server with the classes of its program. The monitors run as root, so they
+        # are stopped whatever happens to the run
+        monitors = []
+        try:
+            if programs:
+                peers = ",".join(ip for hosts in self.__region_hosts() for ip in hosts)
+                monitor_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "egress_monitor.py")
+                for r, reg in enumerate(self.config.regions):
+                    for p, addr in enumerate(private_addresses(reg)):
+                        nsenter, dev = self.__interface(self.client.containers.get(f"slog_{r}_{p}"), addr)
+                        out_path = os.path.abspath(os.path.join(raw_log_dir, f"egress_traffic_{addr.replace('.', '_')}.csv"))
+                        monitors.append(subprocess.Popen(
+                            nsenter + [sys.executable, monitor_path, "--backend", "tc", "--dev", dev, "--peers", peers, "--out", out_path]
+                        ))
+
+            report_start_skew(self.orchestrator, containers, start_ns, timeout=args.start_lead + 30)
+            wait_for_containers(containers)
+        finally:
+            for monitor in monitors:
+                monitor.send_signal(signal.SIGTERM)
+            for monitor in monitors:
+                monitor.wait()
+
+        # Lay out the data of the run like that of the collect_client command
+        for container, addr in containers:
+            client_out_dir = os.path.join(args.out_dir, tag, "client", names[addr])
+            os.makedirs(os.path.dirname(client_out_dir), exist_ok=True)
+            subprocess.run(["cp", "-r", os.path.join(HOST_DATA_DIR, tag, names[addr]), client_out_dir], check=True)
+            with open(os.path.join(raw_log_dir, f"benchmark_container_{addr.replace('.', '_')}.log"), "wb") as f:
+                f.write(container.logs())
+        with open(os.path.join(raw_log_dir, self.config_name), "w") as f:
+            f.write(config_text)
+        LOG.info("Tag: %s", tag)
+
     def __stop(self):
         for r, reg in enumerate(self.config.regions):
             for a in range(len(public_addresses(reg))):
@@ -614,41 +1140,20 @@ class BenchmarkCommand(AdminCommand):
 
     def add_arguments(self, parser):
         super().add_arguments(parser)
-        parser.add_argument("--txns", type=int, default=10, required=True, help="Number of transactions generated per benchmark machine")
-        parser.add_argument("--duration", type=int, default=0, help="How long the benchmark is run in seconds")
-        parser.add_argument("--tag", help="Tag of this benchmark run. Auto-generated if not provided")
-        parser.add_argument("--workload", "-wl", choices=["basic", "cockroach", "remastering", "tpcc", "movr"], default="basic", help="Name of the workload to run benchmark with")
+        add_workload_arguments(parser)
         parser.add_argument("-od", "--out_dir", default="", help="Output directory for final results")
         parser.add_argument("-dd", "--data_dir", default="", help="Directory for initial data")
-        parser.add_argument("--params", default="", help="Parameters of the workload")
-        parser.add_argument("--rate", type=int, default=0, help="Maximum number of transactions sent per second")
-        parser.add_argument("--clients", type=int, default=0, help="Number of clients sending synchronized txns")
-        parser.add_argument("--generators", type=int, default=1, help="Number of threads for each benchmark machine")
-        parser.add_argument("--sample", type=int, default=10, help="Percent of sampled transactions to be written to result files")
-        parser.add_argument("--txn-profiles", action="store_true", help="Output the profile of the sampled txns")
         parser.add_argument("-e", nargs="*", help="Environment variables to pass to the container. For example, use -e GLOG_v=1 to turn on verbose logging at level 1.")
-        parser.add_argument("--seed", type=int, default=-1, help="Seed for the randomization in the benchmark. Set to -1 for random seed")
         parser.add_argument("--cleanup", action="store_true", help="Clean up all running benchmarks then exit")
+        parser.add_argument("--reuse-container", action="store_true", help="Run the benchmark with exec in a long-lived container kept between runs "
+                            "instead of creating a new container every time")
+        parser.add_argument("--tail-to", help="Directory to put the client data, fetched incrementally while the benchmark is running. "
+                            'Run "collect_client" with "--resume" afterwards to fetch only the rest')
+        parser.add_argument("--tail-interval", type=float, default=TAIL_INTERVAL_SEC, help="Seconds between two fetches with --tail-to")
 
     def init_remote_processes(self, args):
-        self.remote_procs = []
         # Create a docker client for each node
-        for reg, reg_info in enumerate(self.config.regions):
-            num_addresses = len(reg_info.client_addresses)
-            step = max((num_addresses + 1) // reg_info.num_replicas, 1)
-            i = 0
-            for rep in range(reg_info.num_replicas - 1):
-                for j in range(step):
-                    if i < num_addresses:
-                        addr = reg_info.client_addresses[i]
-                        self.remote_procs.append(RemoteProcess(None, addr, None, reg, rep, j))
-                        i += 1
-            j = 0
-            while i < num_addresses:
-                addr = reg_info.client_addresses[i]
-                self.remote_procs.append(RemoteProcess(None, addr, None, reg, reg_info.num_replicas - 1, j))
-                i += 1
-                j += 1
+        self.remote_procs = benchmark_processes(self.config)
 
         LOG.info('Benchmark: Spawned remote processes: "%s"', len(self.remote_procs))
 
@@ -667,8 +1172,9 @@ class BenchmarkCommand(AdminCommand):
                 LOG.exception(e)
             return proc._replace(docker_client=client)
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            self.remote_procs = pool.map(init_docker_client, self.remote_procs)
+        self.remote_procs = self.orchestrator.run_phase(
+            "connect", init_docker_client, self.remote_procs, host=lambda proc: proc.public_address
+        )
 
     def do_command(self, args):
         # Prepare a command to update the config file
@@ -687,82 +1193,108 @@ class BenchmarkCommand(AdminCommand):
             out_dir = os.path.join(CONTAINER_DATA_DIR, tag)
 
         # Clean up everything
+        warm_container_name = f"{args.benchmark_container}_warm"
+
         def clean_up(remote_proc):
             client, addr, *_ = remote_proc
             cleanup_container(client, args.benchmark_container, addr=addr)
-            cleanup_container(client, "benchmark_test", addr=addr)
-            # Test for benchmark starting delay
-            start_time = time.time()
-            client.containers.run(
-                args.image,
-                name="benchmark_test",
-                command=["/bin/sh", "-c", "echo"],
-                remove=True,
-                detach=True,
-            )
-            elapsed_time = time.time() - start_time
+            if args.reuse_container:
+                # Stop any benchmark still running in the warm container, and pre-warm it if needed
+                container = get_warm_container(client, args.image, warm_container_name, addr=addr)
+                # This includes a run still waiting for its start time, which has no benchmark process yet
+                container.exec_run(["/bin/sh", "-c", f"[ -f {BENCHMARK_EXEC_PGID_FILE} ] && kill -9 -- -$(cat {BENCHMARK_EXEC_PGID_FILE}); rm -f {BENCHMARK_EXEC_PGID_FILE}"])
+            else:
+                cleanup_container(client, warm_container_name, addr=addr)
             LOG.info("%s: Removed old data directory", addr)
-            return elapsed_time
-
-        with Pool(processes=len(self.remote_procs)) as pool:
-            delays = pool.map(clean_up, self.remote_procs)
 
-        LOG.info("Delay per client: %s",{self.remote_procs[i].public_address: f"{delays[i]:.2f}"
-                for i in range(len(self.remote_procs))})
+        self.orchestrator.run_phase("cleanup", clean_up, self.remote_procs, host=lambda proc: proc.public_address, retries=2)
 
         if args.cleanup:
             return
 
-        # We need to generate a seed for each client container
-        def generate_seed(addr: str, seed: int) -> int:
-            for c in addr:
-                seed ^= ord(c)
-            return seed
+        # All containers are created and started ahead of a common start time, then every one of
+        # them waits in a shell loop until that time before running the benchmark. This assumes
+        # that the clocks of the machines are synchronized (e.g. with NTP)
+        start_ns = time.time_ns() + int(args.start_lead * 1e9)
+        LOG.info("Benchmark starts at %s", datetime.fromtimestamp(start_ns / 1e9).strftime("%H:%M:%S.%f"))
+        environment = {**parse_envs(args.e), "BENCHMARK_START_NS": str(start_ns)}
+        wait_cmd = BENCHMARK_WAIT_CMD
+        end_cmd = BENCHMARK_END_CMD
 
-        def benchmark_runner(enumerated_proc):
+        def benchmark_creator(enumerated_proc):
             i, proc = enumerated_proc
             client, addr, _, reg, rep, *_ = proc
             rmdir_cmd = f"rm -rf {out_dir}"
             mkdir_cmd = f"mkdir -p {out_dir}"
-            shell_cmd = (
-                f"benchmark "
-                f"--config {config_path} "
-                f"--region {reg} "
-                f"--replica {rep} "
-                f"--data-dir {CONTAINER_DATA_DIR} "
-                f"--out-dir {out_dir} "
-                f"--duration {args.duration} "
-                f"--wl {args.workload} "
-                f'--params "{args.params}" '
-                f"--txns {args.txns} "
-                f"--generators {args.generators} "
-                f"--sample {args.sample} "
-                f"--seed {generate_seed(addr, args.seed)} "
-                f"--txn_profiles={args.txn_profiles} "
-                f"--rate {args.rate} "
-                f"--clients {args.clients} "
+            shell_cmd = benchmark_shell_cmd(args, config_path, reg, rep, out_dir, addr)
+            command = (
+                f"{sync_config_cmd} && {rmdir_cmd} && {mkdir_cmd} && {wait_cmd} && "
+                f"{{ {shell_cmd}; benchmark_status=$?; {end_cmd}; exit $benchmark_status; }}"
             )
-            delay = max(delays) - delays[i]
-            LOG.info("%s: Delay for %f seconds before running the benchmark", addr, delay)
-            time.sleep(delay)
-            container = client.containers.run(
+            if args.tail_to:
+                # Also write the output of the benchmark into the data directory so that it can be
+                # tailed. The exit status of a pipe is that of tee, so the status of the benchmark is
+                # kept aside
+                status_file = "/tmp/benchmark_status"
+                command = (
+                    f"rm -f {status_file} && {sync_config_cmd} && {rmdir_cmd} && {mkdir_cmd} && {wait_cmd} && "
+                    f"{{ {shell_cmd} 2>&1; echo $? > {status_file}; {end_cmd}; }} | tee {os.path.join(out_dir, BENCHMARK_LOG_FILE)}; "
+                    f"exit $(cat {status_file} 2>/dev/null || echo 1)"
+                )
+            if args.reuse_container:
+                container = BenchmarkExec(client.containers.get(warm_container_name), command, environment)
+                log_benchmark_launch(addr, shell_cmd)
+                return container, addr
+            container = client.containers.create(
                 args.image,
                 name=f"{args.benchmark_container}",
-                command=["/bin/sh", "-c", f"{sync_config_cmd} && {rmdir_cmd} && {mkdir_cmd} && {shell_cmd}"],
+                command=["/bin/sh", "-c", command],
                 # Mount a directory on the host into the container
                 mounts=[SLOG_DATA_MOUNT],
                 # Expose all ports from container to host
                 network_mode="host",
-                detach=True,
-                environment=parse_envs(args.e),
+                environment=environment,
             )
-            LOG.info("%s: Synced config and ran command: %s", addr, shell_cmd)
+            log_benchmark_launch(addr, shell_cmd)
             return container, addr
 
-        with Pool(processes=len(self.remote_procs)) as pool:
-            containers = pool.map(benchmark_runner, enumerate(self.remote_procs))
+        containers = self.orchestrator.run_phase(
+            "create",
+            benchmark_creator,
+            list(enumerate(self.remote_procs)),
+            host=lambda enumerated_proc: enumerated_proc[1].public_address,
+        )
+
+        self.orchestrator.run_phase(
+            "start",
+            lambda container_and_addr: container_and_addr[0].start(),
+            containers,
+            host=lambda container_and_addr: container_and_addr[1],
+        )
+        report_start_skew(self.orchestrator, containers, start_ns, timeout=args.start_lead + 30)
+
+        if args.tail_to:
+            stop_tailing = threading.Event()
+            tail_out_dir = os.path.join(args.tail_to, tag, "client")
+            tailer = threading.Thread(
+                target=tail_all,
+                args=(
+                    client_machines(self.config),
+                    args.user,
+                    os.path.join(HOST_DATA_DIR, os.path.relpath(out_dir, CONTAINER_DATA_DIR)),
+                    tail_out_dir,
+                    stop_tailing,
+                    args.tail_interval,
+                ),
+                daemon=True,
+            )
+            tailer.start()
+            LOG.info("Tailing the client data into %s", tail_out_dir)
 
         wait_for_containers(containers)
+        if args.tail_to:
+            stop_tailing.set()
+            tailer.join()
         LOG.info("Tag: %s", tag)
 
 class CollectClientCommand(AdminCommand):
@@ -775,6 +1307,9 @@ class CollectClientCommand(AdminCommand):
         parser.add_argument("--tag", help="Tag of the benchmark data")
         parser.add_argument("--out-dir", default="", help="Directory to put the collected data")
         parser.add_argument("--user", "-u", default=USER, help="Username of the target machines")
+        parser.add_argument("--columnar", action="store_true", help="Also convert the collected CSVs into Parquet files")
+        parser.add_argument("--drop-csv", action="store_true", help="Remove the CSVs once converted (with --columnar)")
+        add_fetch_arguments(parser)
 
     def init_remote_processes(self, _):
         pass
@@ -784,13 +1319,11 @@ class CollectClientCommand(AdminCommand):
 
     def do_command(self, args):
         client_out_dir = os.path.join(args.out_dir, args.tag, "client")
-        machines = [
-            {"address": c, "name": f"{i}-{j}"}
-            for i, r in enumerate(self.config.regions)
-            for j, c in enumerate(r.client_addresses)
-        ]
+        machines = client_machines(self.config)
         LOG.info("%s: Fetching client data from machines", machines)
-        fetch_data(machines, args.user, args.tag, client_out_dir)
+        fetch_data(machines, args.user, args.tag, client_out_dir, self.orchestrator, args.compression, args.resume, args.fetch_jobs)
+        if args.columnar:
+            convert_all(client_out_dir, args.drop_csv, jobs=len(machines))
 
 class CollectServerCommand(AdminCommand):
 
@@ -801,6 +1334,7 @@ class CollectServerCommand(AdminCommand):
         super().add_arguments(parser)
         parser.add_argument("--tag", default="test", help="Tag of the metrics data")
         parser.add_argument("--out-dir", default="", help="Directory to put the collected data")
+        add_fetch_arguments(parser)
         group = parser.add_mutually_exclusive_group()
         group.add_argument("--flush-only", action="store_true", help="Only trigger flushing metrics to disk")
         group.add_argument("--download-only", action="store_true", help="Only download the data files")
@@ -844,8 +1378,13 @@ class CollectServerCommand(AdminCommand):
                 docker_client.containers.run(args.image, name=f"{args.client_container}_{i}", command=run_cmd, remove=True)
                 LOG.info("%s: Triggered flushing metrics to disk", address)
 
-            with Pool(processes=len(addresses)) as pool:
-                pool.map(trigger_flushing_metrics, enumerate(addresses))
+            self.orchestrator.run_phase(
+                "flush_metrics",
+                trigger_flushing_metrics,
+                list(enumerate(addresses)),
+                host=lambda enumerated_address: enumerated_address[1],
+                retries=2,
+            )
 
         if args.flush_only:
             return
@@ -857,7 +1396,7 @@ class CollectServerCommand(AdminCommand):
             for p, a in enumerate(public_addresses(reg))
         ]
         LOG.info("%s: Fetching server data from machines", machines)
-        fetch_data(machines, args.user, args.tag, server_out_dir)
+        fetch_data(machines, args.user, args.tag, server_out_dir, self.orchestrator, args.compression, args.resume, args.fetch_jobs)
 
 class GenNetEmCommand(AdminCommand):
 
@@ -896,31 +1435,20 @@ class GenNetEmCommand(AdminCommand):
 
         assert len(regions_pub) == len(regions_priv)
 
-        latency = []
-        with open(args.latency, "r") as f:
-            for line in f:
-                arr = list(map(float, line.split(",")))
-                assert len(arr) == len(regions_pub), "Number of regions must match config"
-                latency.append(arr)
-
+        _, latency = read_region_matrix(args.latency)
         assert len(latency) == len(regions_pub), "Number of regions must match config"
 
+        # The matrix holds one-way latencies and every server delays its own egress, i.e. half of an RTT
+        rtt = [[2 * l for l in row] for row in latency]
+        devs = {ip: args.dev for r_to in regions_priv for ip in r_to}
+        programs = compile_topology(regions_priv, rtt, devs, offset_ms=args.offset, jitter_ms=args.jitter, same_region=False)
+
         commands = []
         preview = []
-        for i, r_from in enumerate(regions_pub):
-            netems = []
-            filters = []
-            for j, r_to in enumerate(regions_priv):
-                if i == j:
-                    continue
-
-                netems.append(f"delay {latency[i][j] + args.offset}ms {args.jitter}ms")
-                filters.append([ip for ip in r_to])
-
-            script = gen_netem_script(netems, args.dev, filters)
-
-            preview.append((i, script))
-            for ip in r_from:
+        for i, (r_from, r_priv) in enumerate(zip(regions_pub, regions_priv)):
+            scripts = [program_script(programs[ip]) for ip in r_priv]
+            preview.append((i, scripts[0]))
+            for ip, script in zip(r_from, scripts):
                 commands.append(f'({SSH} {args.user}@{ip} "echo \\"{script}\\" > {args.out} && chmod +x {args.out}") & ')
 
         for r, script in preview:
@@ -946,6 +1474,7 @@ def main(args):
             StopCommand,
             StatusCommand,
             LogsCommand,
+            WatchCommand,
             LocalCommand,
             GenNetEmCommand,
         ],
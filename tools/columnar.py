@@ -0,0 +1,108 @@
+"""Columnar export of the benchmark results
+
+Converts the CSV files written by the benchmark for each client (transactions.csv,
+txn_events.csv and summary.csv) into compressed Parquet files next to them. Event names
+are dictionary-encoded using the TransactionEvent enum and all times are stored as int64.
+The scripts under plots/ read these files instead of the CSVs when they are present.
+
+Example usage:
+
+> python3 tools/columnar.py plots/raw_data/ycsb/baseline --jobs 8
+"""
+import argparse
+import logging
+import os
+
+from multiprocessing import Pool
+
+import pandas as pd
+
+from proto.transaction_pb2 import TransactionEvent
+
+LOG = logging.getLogger("columnar")
+
+CLIENT_FILES = ["transactions.csv", "txn_events.csv", "summary.csv"]
+COLUMNAR_SUFFIX = ".parquet"
+COMPRESSION = "zstd"
+
+# Columns that hold ';'-separated lists. All the other columns are integers
+STRING_COLUMNS = ["regions", "partitions", "global_log_pos"]
+# Category codes are the same as the values of the TransactionEvent enum
+EVENT_DTYPE = pd.CategoricalDtype(TransactionEvent.keys())
+
+
+def columnar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + COLUMNAR_SUFFIX
+
+
+def convert_csv(csv_path, drop_csv=False):
+    """Converts one CSV file of a client into a Parquet file next to it
+
+    @param csv_path  path to the CSV file
+    @param drop_csv  remove the CSV file once it is converted
+    @return          path to the Parquet file
+    """
+    out_path = columnar_path(csv_path)
+    df = pd.read_csv(csv_path, dtype={c: "string" for c in STRING_COLUMNS})
+    if "event" in df.columns:
+        events = df["event"].astype(EVENT_DTYPE)
+        unknown = df["event"].notna() & events.isna()
+        if unknown.any():
+            raise ValueError(f"Unknown transaction event(s) in {csv_path}: {sorted(df['event'][unknown].unique())}")
+        df["event"] = events
+    # Write to a temporary file first so that a partial file is never picked up by the readers
+    tmp_path = out_path + ".tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", compression=COMPRESSION, index=False)
+    os.replace(tmp_path, out_path)
+    if drop_csv:
+        os.remove(csv_path)
+    return out_path
+
+
+def convert_client_dir(client_dir, drop_csv=False):
+    """Converts all the result files of a client directory
+
+    @return  number of converted files
+    """
+    converted = 0
+    for file_name in CLIENT_FILES:
+        csv_path = os.path.join(client_dir, file_name)
+        if os.path.isfile(csv_path):
+            convert_csv(csv_path, drop_csv)
+            converted += 1
+    return converted
+
+
+def find_client_dirs(root):
+    """Finds all directories under root containing the result files of a client"""
+    return sorted(
+        dir_path
+        for dir_path, _, file_names in os.walk(root)
+        if any(file_name in file_names for file_name in CLIENT_FILES)
+    )
+
+
+def convert_all(root, drop_csv=False, jobs=1):
+    """Converts the results of all the clients found under root
+
+    @param root      a client output directory or any directory above it
+                     (e.g. a whole scenario under plots/raw_data)
+    @param drop_csv  remove the CSV files once they are converted
+    @param jobs      number of directories converted in parallel
+    """
+    client_dirs = find_client_dirs(root)
+    LOG.info("Converting the results of %d clients under %s", len(client_dirs), root)
+    with Pool(processes=max(1, jobs)) as pool:
+        converted = pool.starmap(convert_client_dir, [(d, drop_csv) for d in client_dirs])
+    LOG.info("Converted %d files", sum(converted))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the benchmark CSVs of the clients into Parquet files")
+    parser.add_argument("root", help="Directory containing the collected client data")
+    parser.add_argument("--drop-csv", action="store_true", help="Remove the CSV files once they are converted")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of client directories converted in parallel")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)10s %(levelname)s: %(message)s")
+    convert_all(args.root, args.drop_csv, args.jobs)
@@ -0,0 +1,106 @@
+"""Connection pool for the remote machines
+
+Opening a Docker client over SSH costs a full SSH handshake. The clients are therefore kept open
+and reused by all the admin commands run in the same Python process (e.g. the consecutive
+admin.main calls of run_experiment.py or run_config.py), instead of connecting again in every
+command. The shell commands going over ssh/rsync share multiplexed SSH master connections instead.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+import docker
+
+LOG = logging.getLogger("connection_pool")
+
+# Options making consecutive ssh/rsync invocations to the same host reuse one master connection
+SSH_MULTIPLEX_OPTIONS = "-o ControlMaster=auto -o ControlPath=/tmp/ssh-slog-%C -o ControlPersist=10m"
+SSH = f'ssh "-o StrictHostKeyChecking no" {SSH_MULTIPLEX_OPTIONS}'
+
+# A client that has been idle for longer than this is pinged before being handed out again
+CHECK_AFTER_IDLE_SEC = 5
+
+
+class DockerClientPool:
+    """Long-lived Docker clients, one per (user, address)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._last_used = {}
+        # Clients inherited from the parent after a fork. They are kept referenced but never used,
+        # so that their sockets are not torn down from the child
+        self._inherited = []
+
+    def get(self, user, addr):
+        """Returns an open client to the Docker daemon of addr, connecting only if needed"""
+        key = (user, addr)
+        with self._lock:
+            client = self._clients.get(key)
+            last_used = self._last_used.get(key, 0)
+        if client is not None:
+            if time.time() - last_used < CHECK_AFTER_IDLE_SEC or self._is_alive(client, addr):
+                self._touch(key)
+                return client
+            self.discard(user, addr)
+
+        LOG.info('Launching Docker client of user %s and address %s', user, addr)
+        client = docker.DockerClient(base_url=f"ssh://{user}@{addr}")
+        with self._lock:
+            # Another thread may have connected to the same address in the meantime
+            pooled = self._clients.setdefault(key, client)
+            self._last_used[key] = time.time()
+        if pooled is not client:
+            client.close()
+        return pooled
+
+    def discard(self, user, addr):
+        """Closes and forgets the client of an address (e.g. after a connection error)"""
+        with self._lock:
+            client = self._clients.pop((user, addr), None)
+            self._last_used.pop((user, addr), None)
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._last_used.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def _touch(self, key):
+        with self._lock:
+            self._last_used[key] = time.time()
+
+    def _is_alive(self, client, addr):
+        try:
+            return client.ping()
+        except Exception:
+            LOG.info("Connection to %s was lost, reconnecting", addr)
+            return False
+
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()
+        self._inherited.extend(self._clients.values())
+        self._clients = {}
+        self._last_used = {}
+
+
+POOL = DockerClientPool()
+atexit.register(POOL.close_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=POOL._after_fork_in_child)
+
+
+def get_docker_client(user, addr):
+    return POOL.get(user, addr)
@@ -0,0 +1,295 @@
+"""Parallel fetching of the result data from the remote machines
+
+The data directory of each machine is streamed with tar over SSH straight into a local tar
+extracting it, without writing a tarball on either side. The transfers run in parallel with a
+bound on their number and failed transfers are retried. A directory can also be synced
+incrementally: only the bytes appended to the remote files since the last sync are fetched,
+which is used to tail the data of the clients while a benchmark is running. The number of
+bytes sent over the wire and the time taken are recorded for each machine.
+"""
+import collections
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from connection_pool import SSH
+from orchestrator import Orchestrator
+
+LOG = logging.getLogger("data_fetch")
+
+# Maximum number of machines fetched from at the same time
+MAX_PARALLEL_FETCHES = 16
+CHUNK_SIZE = 1 << 20
+# Seconds between two syncs when tailing
+TAIL_INTERVAL_SEC = 10
+
+# Command piped after the remote command, arguments of the local tar to undo it, and command to
+# undo it outside of tar. zstd and pigz must be installed on both sides
+COMPRESSIONS = {
+    "none": ("", [], None),
+    "gzip": ("gzip -c", ["-z"], ["gzip", "-dc"]),
+    "zstd": ("zstd -T0 -q -c", ["--zstd"], ["zstd", "-dcq"]),
+    "pigz": ("pigz -c", ["-I", "pigz"], ["pigz", "-dc"]),
+}
+
+FetchStats = collections.namedtuple(
+    "FetchStats",
+    [
+        "name",
+        "address",
+        "files",
+        "bytes",
+        "elapsed",
+    ],
+)
+
+
+def _ssh(user, addr, remote_cmd):
+    return shlex.split(SSH) + [f"{user}@{addr}", remote_cmd]
+
+
+def remote_manifest(user, addr, data_path):
+    """Returns the size of every file under data_path on a remote machine, keyed by relative path"""
+    remote_cmd = f"cd {shlex.quote(data_path)} && find . -type f -printf '%s %P\\n'"
+    out = subprocess.run(_ssh(user, addr, remote_cmd), check=True, capture_output=True, text=True).stdout
+    manifest = {}
+    for line in out.splitlines():
+        size, path = line.split(" ", 1)
+        manifest[path] = int(size)
+    return manifest
+
+
+def local_manifest(path):
+    manifest = {}
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            manifest[os.path.relpath(file_path, path)] = os.path.getsize(file_path)
+    return manifest
+
+
+def _copy(ssh, dst):
+    """Copies the output of ssh into dst, killing ssh if dst is closed early
+
+    The stream is copied through here rather than with a shell pipe to count the bytes received
+    """
+    num_bytes = 0
+    try:
+        while True:
+            chunk = ssh.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            num_bytes += len(chunk)
+            dst.write(chunk)
+    except BrokenPipeError:
+        # The local process exited early. Its error is reported by the caller
+        ssh.kill()
+    finally:
+        dst.close()
+    return num_bytes
+
+
+def _check(addr, data_path, *procs):
+    errors = "".join(proc.stderr.read().decode() for proc in procs)
+    if any(proc.wait() != 0 for proc in procs):
+        raise RuntimeError(f"Failed to fetch {data_path} from {addr}: {errors.strip()}")
+
+
+def fetch_machine(user, addr, data_path, out_path, compression="gzip", resume=False):
+    """Streams the content of data_path on a remote machine into out_path
+
+    @param user         username used to ssh to the machine
+    @param addr         address of the machine
+    @param data_path    remote directory to fetch
+    @param out_path     local directory receiving the content of data_path
+    @param compression  one of COMPRESSIONS
+    @param resume       only fetch what is missing locally (see sync_machine)
+    @return             number of files fetched and number of bytes received
+    """
+    if resume:
+        return sync_machine(user, addr, data_path, out_path, compression)
+    os.makedirs(out_path, exist_ok=True)
+
+    compress_cmd, extract_args, _ = COMPRESSIONS[compression]
+    # Change to the directory first: the exit status of a pipe is that of its last command, so a
+    # missing directory would otherwise go unnoticed
+    remote_cmd = f"cd {shlex.quote(data_path)} && tar -cf - ."
+    if compress_cmd:
+        remote_cmd += f" | {compress_cmd}"
+
+    ssh = subprocess.Popen(
+        _ssh(user, addr, remote_cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    tar = subprocess.Popen(
+        ["tar", "-xf", "-", *extract_args, "-C", out_path],
+        stdin=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    num_bytes = _copy(ssh, tar.stdin)
+    _check(addr, data_path, ssh, tar)
+    return len(local_manifest(out_path)), num_bytes
+
+
+def sync_machine(user, addr, data_path, out_path, compression="none"):
+    """Appends to the files in out_path the bytes added to their remote copy since the last sync
+
+    The files are assumed to only grow, as it is the case for the results and the logs being
+    written during a benchmark. New files are fetched entirely, and a file that became smaller
+    than its local copy is fetched again from the beginning.
+
+    @return  number of files updated and number of bytes received
+    """
+    os.makedirs(out_path, exist_ok=True)
+    local = local_manifest(out_path)
+    # (path, offset, length) of the bytes to fetch for each file
+    parts = []
+    for path, size in sorted(remote_manifest(user, addr, data_path).items()):
+        offset = local.get(path)
+        if offset is None or offset > size:
+            # New file, or rewritten since the last sync
+            parts.append((path, 0, size))
+        elif size > offset:
+            parts.append((path, offset, size - offset))
+    if not parts:
+        return 0, 0
+
+    compress_cmd, _, decompress_cmd = COMPRESSIONS[compression]
+    # The files may keep growing while being read, so read exactly the length found above
+    reads = "; ".join(f"tail -c +{offset + 1} {shlex.quote(path)} | head -c {length}" for path, offset, length in parts)
+    remote_cmd = f"cd {shlex.quote(data_path)} && {{ {reads}; }}"
+    if compress_cmd:
+        remote_cmd += f" | {compress_cmd}"
+
+    ssh = subprocess.Popen(
+        _ssh(user, addr, remote_cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    procs = [ssh]
+    stream = ssh.stdout
+    if decompress_cmd:
+        decompress = subprocess.Popen(
+            decompress_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        procs.append(decompress)
+        stream = decompress.stdout
+        received = []
+        copier = threading.Thread(target=lambda: received.append(_copy(ssh, decompress.stdin)))
+        copier.start()
+
+    num_bytes = 0
+    try:
+        for path, offset, length in parts:
+            local_path = os.path.join(out_path, path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "r+b" if offset > 0 else "wb") as f:
+                f.seek(offset)
+                f.truncate()
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise RuntimeError(f"{addr}: {path} in {data_path} is shorter than expected")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            num_bytes += length
+    finally:
+        if decompress_cmd:
+            stream.close()
+            copier.join()
+            num_bytes = received[0] if received else 0
+    _check(addr, data_path, *procs)
+    return len(parts), num_bytes
+
+
+def fetch_all(machines, user, data_path, out_path, orchestrator=None, compression="gzip", resume=False,
+              jobs=MAX_PARALLEL_FETCHES, retries=2):
+    """Fetches data_path from all machines in parallel
+
+    @param machines     list of dicts with the 'address' of a machine and the 'name' of the
+                        directory, under out_path, receiving its data
+    @param user         username used to ssh to the machines
+    @param data_path    remote directory to fetch from each machine
+    @param out_path     local directory containing the fetched data
+    @param orchestrator Orchestrator running the transfers. A new one is used if not given
+    @param compression  one of COMPRESSIONS
+    @param resume       keep the data already in out_path and only fetch the missing files
+    @param jobs         maximum number of machines fetched from at the same time
+    @param retries      number of times a failed transfer is retried (resuming from the files
+                        already fetched)
+    @return             list of FetchStats, one per machine, or None for the failed machines
+    """
+    if not resume and os.path.exists(out_path):
+        shutil.rmtree(out_path, ignore_errors=True)
+        LOG.info("Removed existing directory: %s", out_path)
+    os.makedirs(out_path, exist_ok=True)
+
+    attempted = set()
+
+    def fetch(machine):
+        start = time.time()
+        # A retry resumes from the data fetched by the failed attempt instead of starting over
+        retrying = machine["name"] in attempted
+        attempted.add(machine["name"])
+        files, num_bytes = fetch_machine(
+            user,
+            machine["address"],
+            data_path,
+            os.path.join(out_path, machine["name"]),
+            compression=compression,
+            resume=resume or retrying,
+        )
+        stats = FetchStats(machine["name"], machine["address"], files, num_bytes, time.time() - start)
+        LOG.info("%s: Fetched %d files, %.1f MB in %.1fs", machine["address"], files, num_bytes / 1e6, stats.elapsed)
+        return stats
+
+    orchestrator = orchestrator or Orchestrator()
+    results = orchestrator.run_phase(
+        "fetch",
+        fetch,
+        machines,
+        host=lambda machine: machine["address"],
+        retries=retries,
+        raise_errors=False,
+        limit=jobs,
+    )
+    stats = [None if isinstance(r, Exception) else r for r in results]
+    fetched = [s for s in stats if s is not None]
+    total_bytes = sum(s.bytes for s in fetched)
+    elapsed = max((s.elapsed for s in fetched), default=0)
+    LOG.info(
+        "Fetched %.1f MB from %d/%d machine(s) into %s (slowest machine: %.1fs)",
+        total_bytes / 1e6,
+        len(fetched),
+        len(machines),
+        out_path,
+        elapsed,
+    )
+    return stats
+
+
+def tail_all(machines, user, data_path, out_path, stop, interval=TAIL_INTERVAL_SEC, compression="none",
+             jobs=MAX_PARALLEL_FETCHES):
+    """Syncs data_path from all machines into out_path every interval seconds until stop is set
+
+    @param machines  same as in fetch_all
+    @param stop      threading.Event set to stop tailing
+    """
+    orchestrator = Orchestrator()
+
+    def sync(machine):
+        return sync_machine(user, machine["address"], data_path, os.path.join(out_path, machine["name"]), compression)
+
+    while not stop.wait(interval):
+        results = orchestrator.run_phase(
+            "tail",
+            sync,
+            machines,
+            host=lambda machine: machine["address"],
+            raise_errors=False,
+            limit=jobs,
+        )
+        received = sum(r[1] for r in results if not isinstance(r, Exception))
+        LOG.info("Tailed %.1f MB into %s", received / 1e6, out_path)
@@ -0,0 +1,199 @@
+"""Per-destination egress accounting on a server
+
+Run on every server during an experiment (see run_config_on_remote.py). It installs one firewall
+rule per peer address of the cluster, matching the packets sent to that address, plus a last rule
+matching everything else, and reads their byte counters every interval. The bytes sent to each
+destination during the interval are appended to a CSV:
+
+    timestamp_ms,dst,bytes_sent
+
+where dst is a peer address or "other". Destinations that received nothing in an interval are
+left out. The rules are removed when the monitor is stopped (SIGTERM or SIGINT).
+
+With the "tc" backend, no rule is installed: the counters are the byte counts of the htb classes
+of the netem program of an interface (see netem.py), attributed to the destination of their
+filters. The emulated local clusters (admin.py local) have one class per destination.
+
+Only the standard library is used, so the script can be copied to the servers as is. The firewall
+commands are run with "sudo -n", which requires passwordless sudo for iptables, nft or tc.
+"""
+import argparse
+import csv
+import ipaddress
+import json
+import logging
+import re
+import signal
+import subprocess
+import time
+
+LOG = logging.getLogger("egress_monitor")
+
+OTHER = "other"
+CHAIN = "DETOCK_EGRESS"
+NFT_TABLE = "detock_egress"
+
+
+def _run(cmd, check=True):
+    return subprocess.run(["sudo", "-n"] + cmd, check=check, capture_output=True, text=True).stdout
+
+
+class IptablesCounters:
+    """Counters in a chain of the filter table, jumped to from OUTPUT"""
+
+    RULE_RE = re.compile(r"^-A \S+(?: -d (?P<dst>\S+?)(?:/32)?)? -c (?P<packets>\d+) (?P<bytes>\d+)")
+
+    def setup(self, peers):
+        self.teardown()
+        _run(["iptables", "-w", "-N", CHAIN])
+        for peer in peers:
+            _run(["iptables", "-w", "-A", CHAIN, "-d", peer, "-j", "RETURN"])
+        _run(["iptables", "-w", "-A", CHAIN, "-j", "RETURN"])
+        _run(["iptables", "-w", "-I", "OUTPUT", "-j", CHAIN])
+
+    def read(self):
+        counters = {}
+        for line in _run(["iptables", "-w", "-v", "-S", CHAIN]).splitlines():
+            match = self.RULE_RE.match(line)
+            if match:
+                dst = match["dst"] or OTHER
+                counters[dst] = counters.get(dst, 0) + int(match["bytes"])
+        return counters
+
+    def teardown(self):
+        _run(["iptables", "-w", "-D", "OUTPUT", "-j", CHAIN], check=False)
+        _run(["iptables", "-w", "-F", CHAIN], check=False)
+        _run(["iptables", "-w", "-X", CHAIN], check=False)
+
+
+class NftablesCounters:
+    """Counters in a table of their own, hooked on output"""
+
+    def setup(self, peers):
+        self.teardown()
+        rules = [f"table inet {NFT_TABLE} {{", "  chain output {", "    type filter hook output priority 0; policy accept;"]
+        for peer in peers:
+            rules.append(f'    ip daddr {peer} counter return comment "{peer}"')
+        rules.append(f'    counter comment "{OTHER}"')
+        rules += ["  }", "}"]
+        subprocess.run(["sudo", "-n", "nft", "-f", "-"], input="\n".join(rules), check=True, capture_output=True, text=True)
+
+    def read(self):
+        counters = {}
+        listing = json.loads(_run(["nft", "-j", "list", "chain", "inet", NFT_TABLE, "output"]))
+        for item in listing["nftables"]:
+            rule = item.get("rule")
+            if rule is None:
+                continue
+            for expr in rule["expr"]:
+                if "counter" in expr:
+                    dst = rule.get("comment", OTHER)
+                    counters[dst] = counters.get(dst, 0) + expr["counter"]["bytes"]
+        return counters
+
+    def teardown(self):
+        _run(["nft", "delete", "table", "inet", NFT_TABLE], check=False)
+
+
+class TcClassCounters:
+    """Counters of the htb classes of the netem program of an interface"""
+
+    FLOWID_RE = re.compile(r"flowid 1:(?P<classid>\d+)")
+    MATCH_RE = re.compile(r"match (?P<ip>[0-9a-f]{8})/ffffffff at 16")
+    CLASS_RE = re.compile(r"^class htb 1:(?P<classid>\d+) ")
+    SENT_RE = re.compile(r"^\s*Sent (?P<bytes>\d+) bytes")
+
+    def __init__(self, dev):
+        self.dev = dev
+
+    def setup(self, peers):
+        # The classes belong to the netem program in place, only their destinations are read. The bytes
+        # of a class with several destinations (all in the same region) are attributed to the first one
+        self.destinations = {}
+        classid = None
+        for line in _run(["tc", "filter", "show", "dev", self.dev]).splitlines():
+            flowid = self.FLOWID_RE.search(line)
+            if flowid:
+                classid = flowid["classid"]
+            match = self.MATCH_RE.search(line)
+            if match and classid is not None and classid not in self.destinations:
+                dst = str(ipaddress.IPv4Address(int(match["ip"], 16)))
+                self.destinations[classid] = dst if dst in peers else OTHER
+
+    def read(self):
+        counters = {}
+        classid = None
+        for line in _run(["tc", "-s", "class", "show", "dev", self.dev]).splitlines():
+            match = self.CLASS_RE.match(line)
+            if match:
+                classid = match["classid"]
+                continue
+            sent = self.SENT_RE.match(line)
+            if sent and classid in self.destinations:
+                dst = self.destinations[classid]
+                counters[dst] = counters.get(dst, 0) + int(sent["bytes"])
+            classid = None if sent else classid
+        return counters
+
+    def teardown(self):
+        pass
+
+
+BACKENDS = {
+    "iptables": IptablesCounters,
+    "nftables": NftablesCounters,
+    "tc": TcClassCounters,
+}
+
+
+def monitor(peers, out_path, backend="iptables", interval=1.0, dev=None):
+    """Writes the bytes sent to every peer during each interval to out_path until stopped
+
+    dev is the interface whose classes are read by the "tc" backend.
+    """
+    # A peer given twice would get a second rule that never matches
+    peers = list(dict.fromkeys(peers))
+    counters = BACKENDS[backend](dev) if backend == "tc" else BACKENDS[backend]()
+    counters.setup(peers)
+    LOG.info("Counting the bytes sent to %d peer(s) with %s", len(peers), backend)
+
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+
+    try:
+        with open(out_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp_ms", "dst", "bytes_sent"])
+            prev = counters.read()
+            next_sample = time.monotonic() + interval
+            while not stopping:
+                time.sleep(max(0.0, next_sample - time.monotonic()))
+                next_sample += interval
+                timestamp_ms = int(time.time() * 1000)
+                curr = counters.read()
+                for dst, num_bytes in curr.items():
+                    # A counter smaller than before has been reset in between
+                    delta = num_bytes - prev.get(dst, 0) if num_bytes >= prev.get(dst, 0) else num_bytes
+                    if delta > 0:
+                        writer.writerow([timestamp_ms, dst, delta])
+                f.flush()
+                prev = curr
+    finally:
+        counters.teardown()
+        LOG.info("Removed the counters")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Count the bytes sent by this machine to each peer")
+    parser.add_argument("--peers", required=True, help="Comma-separated addresses of the other machines of the cluster")
+    parser.add_argument("--out", default="egress_traffic.csv", help="CSV receiving the bytes sent per destination")
+    parser.add_argument("--backend", choices=BACKENDS.keys(), default="iptables", help="Firewall providing the counters")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between two samples")
+    parser.add_argument("--dev", help="Interface with the netem program whose classes are read (tc backend)")
+    args = parser.parse_args()
+    if args.backend == "tc" and not args.dev:
+        parser.error("--dev is required with the tc backend")
+
+    monitor([p for p in args.peers.split(",") if p], args.out, args.backend, args.interval, args.dev)
@@ -0,0 +1,106 @@
+"""Distribution of the Docker image to the remote machines
+
+In "hub" mode every machine whose image is outdated pulls it from the registry. In "peer" mode
+only one machine per region pulls it from the registry, then every machine holding the image
+streams it with `docker save | docker load` to a machine of the same region that does not,
+doubling the number of holders at each round. In both modes, machines whose image already
+matches the one in the registry are skipped.
+"""
+import collections
+import logging
+import shlex
+import subprocess
+
+import docker
+
+from connection_pool import SSH
+
+LOG = logging.getLogger("image_distribution")
+
+PULL_MODES = ["hub", "peer"]
+
+# Used on a machine to reach another one. The agent of the local machine is forwarded to it
+PEER_SSH = "ssh -o StrictHostKeyChecking=no -o BatchMode=yes"
+
+
+def registry_digest(client, image):
+    """Digest of the image in the registry, or None if the registry cannot be reached"""
+    try:
+        return client.images.get_registry_data(image).id
+    except docker.errors.APIError as e:
+        LOG.warning('Cannot get the digest of "%s" from the registry: %s', image, e)
+        return None
+
+
+def local_image(client, image):
+    try:
+        return client.images.get(image)
+    except docker.errors.ImageNotFound:
+        return None
+
+
+def has_digest(img, digest):
+    return any(d.endswith(f"@{digest}") for d in img.attrs.get("RepoDigests") or [])
+
+
+def push_image(user, image, src, dst):
+    """Streams the image from the machine src to the machine dst"""
+    remote_cmd = f"docker save {shlex.quote(image)} | {PEER_SSH} {user}@{dst} docker load"
+    subprocess.run(shlex.split(SSH) + ["-A", f"{user}@{src}", remote_cmd], check=True, capture_output=True)
+    LOG.info("%s: Received image from %s", dst, src)
+
+
+def distribute_image(hosts, image, user, orchestrator, mode="hub"):
+    """Makes sure that all hosts have the latest version of the image
+
+    @param hosts         dict from the address of a host to a tuple of its Docker client and its region
+    @param image         name of the image
+    @param user          username used to ssh to the hosts
+    @param orchestrator  Orchestrator running the remote operations
+    @param mode          one of PULL_MODES
+    """
+    addrs = list(hosts)
+    if not addrs:
+        return
+    images = dict(zip(addrs, orchestrator.run_phase(
+        "inspect_image", lambda addr: local_image(hosts[addr][0], image), addrs, host=str
+    )))
+    digest = registry_digest(hosts[addrs[0]][0], image)
+    have = {addr for addr in addrs if digest and images[addr] is not None and has_digest(images[addr], digest)}
+    if have:
+        LOG.info('%d/%d host(s) already have the latest "%s"', len(have), len(addrs), image)
+
+    def pull(addr):
+        hosts[addr][0].images.pull(image)
+        LOG.info('%s: Pulled "%s"', addr, image)
+
+    if mode == "hub":
+        orchestrator.run_phase("pull", pull, [a for a in addrs if a not in have], host=str, retries=2)
+        return
+
+    by_region = collections.defaultdict(list)
+    for addr in addrs:
+        by_region[hosts[addr][1]].append(addr)
+
+    # Seed the regions without an up-to-date host from the registry
+    seeds = [region_addrs[0] for region_addrs in by_region.values() if not have.intersection(region_addrs)]
+    orchestrator.run_phase("pull", pull, seeds, host=str, retries=2)
+    have.update(seeds)
+
+    # Hosts holding the same image without its registry digest (e.g. received from a peer
+    # in an earlier run) are up to date too
+    reference_id = local_image(hosts[next(iter(have))][0], image).id
+    have.update(addr for addr in addrs if images[addr] is not None and images[addr].id == reference_id)
+
+    while True:
+        pairs = []
+        for region_addrs in by_region.values():
+            sources = [a for a in region_addrs if a in have]
+            targets = [a for a in region_addrs if a not in have]
+            pairs.extend(zip(sources, targets))
+        if not pairs:
+            break
+        orchestrator.run_phase(
+            "push", lambda pair: push_image(user, image, *pair), pairs, host=lambda pair: pair[1], retries=1
+        )
+        have.update(dst for _, dst in pairs)
@@ -1,17 +1,47 @@
+"""Generation of tc netem scripts
+
+A script puts an htb qdisc at the root of a network interface, with one class and netem qdisc per
+group of destinations, and u32 filters sending the packets of each destination address to its class.
+
+compile_topology turns a region-to-region matrix of RTTs (and optionally of packet losses and
+bandwidths), e.g. plots/data/rtt_matrix_regions.csv, into such a program for every host, so that
+a cluster on a single LAN behaves as if it was spread over the regions. The delays are added on the
+egress of the hosts: a link between two shaped hosts gets half of the RTT on each side, while the
+traffic to a host without a program (e.g. a client) gets the whole RTT on the side of the sender.
+"""
 import argparse
+import collections
+import csv
+import ipaddress
+import re
+
+# Rate of the htb class of a link without a bandwidth limit
+DEFAULT_RATE = "1gbit"
 
+NetemProgram = collections.namedtuple(
+    "NetemProgram",
+    [
+        "dev",      # network interface of the host
+        "netems",   # arguments of the netem qdisc of every class
+        "filters",  # destination addresses of every class
+        "rates",    # htb rate of every class
+    ],
+)
 
-def gen_netem_script(netems, dev, filters):
+
+def gen_netem_script(netems, dev, filters, rates=None):
     """Generates a tc netem script
 
     netems  a list of arguments for netem qdiscs
     dev     dev argument of 'tc'
     filters a list with the same size as 'netems'. Each element is a list of
             IP addresses that will be filtered and queued to the corresponding qdisc
+    rates   an optional list with the same size as 'netems' of htb rates (default: DEFAULT_RATE)
     """
     assert len(netems) == len(
         filters
     ), "Number of filter groups must match number of netem argument groups"
+    rates = rates or [DEFAULT_RATE] * len(netems)
 
     script = [
         "# Generated by netem.py",
@@ -23,7 +53,7 @@ def gen_netem_script(netems, dev, filters):
 
     for i, netem in enumerate(netems):
         script += [
-            f"tc class add dev {dev} parent 1: classid 1:{i+1} htb rate 1gbit",
+            f"tc class add dev {dev} parent 1: classid 1:{i+1} htb rate {rates[i]}",
             f"tc qdisc add dev {dev} parent 1:{i+1} handle {(i+1)*10}: netem {netem}",
         ]
     for i, filter in enumerate(filters):
@@ -47,6 +77,175 @@ def gen_netem_script(netems, dev, filters):
     return "\n".join(script)
 
 
+def program_script(program):
+    """Generates the tc netem script of a NetemProgram"""
+    return gen_netem_script(program.netems, program.dev, program.filters, program.rates)
+
+
+def read_region_matrix(path):
+    """Reads a square matrix of a CSV file
+
+    The file either has the names of the regions as its first row and column (as in
+    plots/data/rtt_matrix_regions.csv) or only holds the numbers.
+
+    @return  the names of the regions (None without a header) and the matrix as a list of rows
+    """
+    with open(path, "r", newline="") as f:
+        rows = [row for row in csv.reader(f) if row]
+    names = None
+    try:
+        float(rows[0][0])
+    except ValueError:
+        names = rows[0][1:]
+        rows = [row[1:] for row in rows[1:]]
+    except IndexError:
+        pass
+    matrix = [[float(value) for value in row] for row in rows]
+    assert all(len(row) == len(matrix) for row in matrix), f"The matrix of {path} is not square"
+    return names, matrix
+
+
+def select_regions(names, matrix, regions=None):
+    """Restricts a matrix read by read_region_matrix to the given regions, in order
+
+    Without regions, the first regions of the matrix are used as they are.
+    """
+    if regions is None:
+        return matrix
+    if names is None:
+        raise ValueError("The regions of a matrix without a header cannot be selected by name")
+    indices = [names.index(region) for region in regions]
+    return [[matrix[i][j] for j in indices] for i in indices]
+
+
+def _format_number(value):
+    return f"{round(value, 3):g}"
+
+
+def netem_args(delay_ms, jitter_ms=0, loss_pct=0):
+    """Arguments of a netem qdisc"""
+    args = f"delay {_format_number(delay_ms)}ms"
+    if jitter_ms > 0:
+        args += f" {_format_number(jitter_ms)}ms"
+    if loss_pct > 0:
+        args += f" loss {_format_number(loss_pct)}%"
+    return args
+
+
+def compile_topology(region_hosts, rtt, devs, loss=None, bandwidth=None, offset_ms=0, jitter_ms=0, extra_loss_pct=0,
+                     same_region=True, per_destination=False):
+    """Compiles the netem program of every host of a cluster spread over regions
+
+    @param region_hosts    list with the addresses of the hosts of every region, in the order of the matrices
+    @param rtt             region-to-region matrix of round-trip times in ms
+    @param devs            dict from the address of a host to its network interface. Only these
+                           hosts get a program, the others are only destinations
+    @param loss            optional region-to-region matrix of the percentage of packets lost from
+                           the row to the column
+    @param bandwidth       optional region-to-region matrix of the bandwidth from the row to the
+                           column in Mbit/s
+    @param offset_ms       delay added to every link in each direction
+    @param jitter_ms       jitter of the delay of every link
+    @param extra_loss_pct  percentage of packets lost on every link in each direction, on top of the loss matrix
+    @param same_region     whether the links between the hosts of a same region are shaped too
+    @param per_destination whether every destination gets a class of its own, so that the byte
+                           counters of the classes are per destination, instead of one class per
+                           region (and kind of destination)
+    @return                dict from the address of a host to its NetemProgram
+    """
+    num_regions = len(region_hosts)
+    for name, matrix in (("rtt", rtt), ("loss", loss), ("bandwidth", bandwidth)):
+        if matrix is not None and len(matrix) < num_regions:
+            raise ValueError(f"The {name} matrix has {len(matrix)} regions but the cluster has {num_regions}")
+
+    def one_way_loss(i, j):
+        lost = loss[i][j] / 100 if loss is not None else 0
+        return 1 - (1 - lost) * (1 - extra_loss_pct / 100)
+
+    programs = {}
+    for i, hosts in enumerate(region_hosts):
+        for host in hosts:
+            if host not in devs:
+                continue
+            netems, filters, rates = [], [], []
+            for j, others in enumerate(region_hosts):
+                if i == j and not same_region:
+                    continue
+                if per_destination:
+                    groups = [([ip], ip in devs) for ip in others if ip != host]
+                else:
+                    shaped = [ip for ip in others if ip in devs and ip != host]
+                    unshaped = [ip for ip in others if ip not in devs and ip != host]
+                    groups = [(shaped, True), (unshaped, False)]
+                for dsts, both_sides in groups:
+                    if not dsts:
+                        continue
+                    if both_sides:
+                        delay = rtt[i][j] / 2 + offset_ms
+                        lost = one_way_loss(i, j)
+                    else:
+                        # The other side doesn't delay nor drop anything, so both directions are added here
+                        delay = rtt[i][j] + 2 * offset_ms
+                        lost = 1 - (1 - one_way_loss(i, j)) * (1 - one_way_loss(j, i))
+                    rate = f"{_format_number(bandwidth[i][j])}mbit" if bandwidth is not None else DEFAULT_RATE
+                    # A link left as is needs no class, unless its bytes are counted
+                    if delay <= 0 and lost <= 0 and rate == DEFAULT_RATE and not per_destination:
+                        continue
+                    netems.append(netem_args(max(delay, 0), jitter_ms, lost * 100))
+                    filters.append(dsts)
+                    rates.append(rate)
+            programs[host] = NetemProgram(devs[host], netems, filters, rates)
+    return programs
+
+
+_TIME_UNITS = {"s": 1000.0, "ms": 1.0, "us": 0.001, "ns": 0.000001}
+_NETEM_RE = re.compile(r"qdisc netem (?P<handle>\d+): parent 1:(?P<classid>\d+) .*?delay (?P<delay>[\d.]+)(?P<unit>[mun]?s)"
+                       r"(?:\s+(?P<jitter>[\d.]+)[mun]?s)?(?:.*?loss (?P<loss>[\d.]+)%)?")
+_FLOWID_RE = re.compile(r"flowid 1:(?P<classid>\d+)")
+_MATCH_RE = re.compile(r"match (?P<ip>[0-9a-f]{8})/ffffffff at 16")
+
+
+def verify_program(program, qdisc_output, filter_output):
+    """Checks the output of 'tc qdisc show' and 'tc filter show' on a host against its program
+
+    tc rounds the delays it prints, so they are compared with a tolerance.
+
+    @return  list of the differences found, empty if the program is in place
+    """
+    problems = []
+    netems = {}
+    for match in _NETEM_RE.finditer(qdisc_output):
+        netems[int(match["classid"])] = match
+    filters = collections.defaultdict(set)
+    classid = None
+    for line in filter_output.splitlines():
+        flowid = _FLOWID_RE.search(line)
+        if flowid:
+            classid = int(flowid["classid"])
+        match = _MATCH_RE.search(line)
+        if match and classid is not None:
+            filters[classid].add(str(ipaddress.IPv4Address(int(match["ip"], 16))))
+
+    for i, (args, dsts) in enumerate(zip(program.netems, program.filters)):
+        classid = i + 1
+        if classid not in netems:
+            problems.append(f"no netem qdisc in class 1:{classid}")
+            continue
+        expected = dict(re.findall(r"(delay|loss) ([\d.]+)", args))
+        found = netems[classid]
+        delay = float(found["delay"]) * _TIME_UNITS[found["unit"]]
+        expected_delay = float(expected["delay"])
+        tolerance = max(0.05, expected_delay * 0.01, 50 if expected_delay >= 1000 else 0)
+        if abs(delay - expected_delay) > tolerance:
+            problems.append(f"class 1:{classid} has a delay of {delay:g}ms instead of {expected_delay:g}ms")
+        loss = float(found["loss"] or 0)
+        if abs(loss - float(expected.get("loss", 0))) > max(0.01, float(expected.get("loss", 0)) * 0.01):
+            problems.append(f"class 1:{classid} loses {loss:g}% of the packets instead of {expected.get('loss', 0)}%")
+        if filters[classid] != set(dsts):
+            problems.append(f"class 1:{classid} filters {sorted(filters[classid])} instead of {sorted(dsts)}")
+    return problems
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate netem script")
     parser.add_argument("netem", help="Netem commands")
@@ -0,0 +1,173 @@
+"""Asyncio orchestration of the remote operations of admin.py
+
+Every phase of a command (connecting, pulling the image, cleaning up, starting the containers, ...)
+is run as one awaitable task per host. The blocking Docker/SSH calls of the tasks are executed on a
+thread pool of fixed size shared by all phases, so the number of threads does not grow with the
+size of the cluster. Each task can be limited per host, bounded by a timeout and retried, and the
+time it took is recorded so that slow hosts can be spotted.
+"""
+import asyncio
+import collections
+import csv
+import logging
+import statistics
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger("orchestrator")
+
+# Total number of threads running blocking remote calls, across all phases and commands
+MAX_WORKERS = 64
+# Number of tasks of a phase running at the same time on the same host
+PER_HOST_LIMIT = 4
+
+TaskTiming = collections.namedtuple(
+    "TaskTiming",
+    [
+        "phase",
+        "host",
+        "attempts",
+        "elapsed",
+        "ok",
+        "error",
+    ],
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="orchestrator")
+        return _executor
+
+
+class PhaseError(Exception):
+    """Raised when some tasks of a phase failed after all their retries"""
+
+    def __init__(self, phase, errors):
+        self.phase = phase
+        self.errors = errors
+        hosts = ", ".join(f"{host} ({error!r})" for host, error in errors)
+        super().__init__(f'Phase "{phase}" failed on {len(errors)} host(s): {hosts}')
+
+
+class Orchestrator:
+    """Runs the phases of a command and keeps the timings of all their tasks"""
+
+    def __init__(self, per_host_limit=PER_HOST_LIMIT):
+        self.per_host_limit = per_host_limit
+        self.timings = []
+
+    def run_phase(
+        self,
+        phase,
+        func,
+        items,
+        host=str,
+        timeout=None,
+        retries=0,
+        retry_delay=1.0,
+        delays=None,
+        raise_errors=True,
+        limit=None,
+    ):
+        """Runs func on every item, concurrently, and returns the results in the order of the items
+
+        @param phase        name of the phase, used in the logs and the timings
+        @param func         blocking function called with each item
+        @param items        list of items (e.g. RemoteProcess tuples)
+        @param host         function giving the host of an item
+        @param timeout      seconds after which an attempt is given up. The blocking call cannot be
+                            interrupted, so only use it together with retries for idempotent tasks
+        @param retries      number of times a failed (or timed out) attempt is retried
+        @param retry_delay  seconds to wait before the first retry, doubled for each subsequent one
+        @param delays       optional list of seconds to wait before starting each item. Waiting does
+                            not hold a thread
+        @param raise_errors raise a PhaseError if any task failed. Otherwise the result of a failed
+                            task is its exception
+        @param limit        maximum number of tasks of the phase running at the same time, across all
+                            hosts
+        """
+        items = list(items)
+        if not items:
+            return []
+        start = time.time()
+        results = asyncio.run(self._run_phase(phase, func, items, host, timeout, retries, retry_delay, delays, limit))
+        self._log_phase(phase, time.time() - start)
+        errors = [(host(item), r) for item, r in zip(items, results) if isinstance(r, BaseException)]
+        if errors and raise_errors:
+            raise PhaseError(phase, errors)
+        return results
+
+    async def _run_phase(self, phase, func, items, host, timeout, retries, retry_delay, delays, limit):
+        semaphores = collections.defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
+        phase_semaphore = asyncio.Semaphore(limit or len(items))
+        tasks = [
+            self._run_task(phase, func, item, host(item), semaphores[host(item)], phase_semaphore, timeout, retries,
+                           retry_delay, delays[i] if delays is not None else 0)
+            for i, item in enumerate(items)
+        ]
+        return await asyncio.gather(*tasks)
+
+    async def _run_task(self, phase, func, item, host, semaphore, phase_semaphore, timeout, retries, retry_delay, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        async with semaphore, phase_semaphore:
+            start = time.time()
+            error = None
+            for attempt in range(retries + 1):
+                if attempt > 0:
+                    LOG.warning('%s: Retrying "%s" (attempt %d) after: %r', host, phase, attempt + 1, error)
+                    await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+                try:
+                    result = await asyncio.wait_for(loop.run_in_executor(_get_executor(), func, item), timeout)
+                    self.timings.append(TaskTiming(phase, host, attempt + 1, time.time() - start, True, ""))
+                    return result
+                except asyncio.TimeoutError:
+                    error = TimeoutError(f'"{phase}" took longer than {timeout}s')
+                except Exception as e:
+                    error = e
+            LOG.error('%s: "%s" failed: %r', host, phase, error)
+            self.timings.append(TaskTiming(phase, host, retries + 1, time.time() - start, False, repr(error)))
+            return error
+
+    def _log_phase(self, phase, elapsed):
+        timings = [t for t in self.timings if t.phase == phase]
+        if not timings:
+            return
+        slowest = max(timings, key=lambda t: t.elapsed)
+        failed = sum(not t.ok for t in timings)
+        LOG.info(
+            'Phase "%s": %d task(s) in %.2fs (median %.2fs, slowest %s %.2fs, %d failed)',
+            phase,
+            len(timings),
+            elapsed,
+            statistics.median(t.elapsed for t in timings),
+            slowest.host,
+            slowest.elapsed,
+            failed,
+        )
+
+    def summary(self):
+        """Per phase and per host: number of tasks, total time and failures"""
+        rows = collections.OrderedDict()
+        for t in self.timings:
+            row = rows.setdefault((t.phase, t.host), {"phase": t.phase, "host": t.host, "tasks": 0, "elapsed": 0.0, "failed": 0})
+            row["tasks"] += 1
+            row["elapsed"] += t.elapsed
+            row["failed"] += 0 if t.ok else 1
+        return list(rows.values())
+
+    def write_timings(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(TaskTiming._fields)
+            writer.writerows(self.timings)
+        LOG.info("Wrote the timings of %d task(s) to %s", len(self.timings), path)
@@ -27,6 +27,7 @@ parser.add_argument('-u',  '--user', default='omraz', help='Username when loggin
 parser.add_argument('-m',  '--machine', default='st5', help='The machine from which this script is (used to write out the scp command for collecting the results.)')
 parser.add_argument('-b',  '--benchmark_container', default='benchmark', help='The name of the benchmark container (so your experiment doesn\'t interfere with others)')
 parser.add_argument('-sc', '--server_container', default='slog', help='The name of the server container')
+parser.add_argument('-rm', '--rtt_matrix', default=None, help='CSV with the RTTs (ms) between regions to emulate on the servers (see run_config_on_remote.py)')
 
 args = parser.parse_args()
 scenario = args.scenario
@@ -67,6 +68,8 @@ def stop_database(conf_file):
 
 def run_database_experiment(conf_file, system):
     run_db_exp_command = f"python3 tools/run_config_on_remote.py -i {image} -m st5 -s {scenario} -w {workload} -c {conf_file} -u {user} -db {system}"
+    if args.rtt_matrix:
+        run_db_exp_command += f" -rm {args.rtt_matrix}"
     result = run_subprocess(run_db_exp_command)
     if hasattr(result, "returncode") and result.returncode != 0:
         print(f"Running {system} database experiment command failed with exit code {result.returncode}!")
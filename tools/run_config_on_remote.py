@@ -5,6 +5,7 @@ import subprocess as sp
 import shutil
 import argparse
 
+import netem
 import simulate_network
 
 VALID_SCENARIOS = ['baseline', 'skew', 'scalability', 'network', 'packet_loss', 'sunflower', 'lat_breakdown', 'vary_hw']
@@ -21,8 +22,13 @@ parser.add_argument('-dr', '--dry_run', default=False, help='Whether to run this
 parser.add_argument('-u',  '--user', default="omraz", help='Username when logging into a remote machine')
 parser.add_argument('-m',  '--machine', default="st5", help='The machine from which this script is (used to write out the scp command for collecting the results.)')
 parser.add_argument('-b',  '--benchmark_container', default="benchmark", help='The name of the benchmark container (so your experiment doesn\'t interfere with others)')
+parser.add_argument('-rc', '--reuse_container', action='store_true', help='Run every benchmark in a long-lived warm benchmark container (see the --reuse-container option of \'admin.py benchmark\')')
 parser.add_argument('-sc', '--server_container', default="slog", help='The name of the server container')
 parser.add_argument('-db', '--database', default='Detock', choices=VALID_DATABASES, help='The database to test')
+parser.add_argument('-rm', '--rtt_matrix', default=None, help='CSV with the RTTs (ms) between regions (e.g. plots/data/rtt_matrix_regions.csv) to emulate on the servers, on top of the network and packet_loss scenarios')
+parser.add_argument('-lm', '--loss_matrix', default=None, help='CSV with the percentage of packets lost from one region (row) to another (column), used with --rtt_matrix')
+parser.add_argument('-bm', '--bandwidth_matrix', default=None, help='CSV with the bandwidth (Mbit/s) from one region (row) to another (column), used with --rtt_matrix')
+parser.add_argument('-mr', '--matrix_regions', default=None, help='The regions of the matrices that the regions of the .conf file emulate, separated by \';\' (default: the first regions of the matrices)')
 
 args = parser.parse_args()
 scenario = args.scenario
@@ -34,12 +40,16 @@ dry_run = args.dry_run
 user = args.user
 machine = args.machine
 benchmark_container = args.benchmark_container
+reuse_container = args.reuse_container
 server_container = args.server_container
 database = args.database
+rtt_matrix = args.rtt_matrix
 
 print(f"Running scenario: '{scenario}' and workload: '{workload}'")
 
 BASIC_IFTOP_CMD = 'iftop 2>&1'
+EGRESS_MONITOR = 'egress_monitor.py'
+EGRESS_TRAFFIC_FILE = 'egress_traffic.csv'
 
 interfaces = {}
 
@@ -148,9 +158,9 @@ else:
     elif scenario == 'sunflower':
         raise Exception("The sunflower scenario is not yet implemented")
 
-single_ycsb_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl basic --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
-single_tpcc_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl tpcc --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
-single_movr_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl movr --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
+single_ycsb_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} {container_args} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl basic --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
+single_tpcc_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} {container_args} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl tpcc --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
+single_movr_benchmark_cmd = "python3 tools/admin.py benchmark --image {image} {conf} -u {user} {container_args} --txns 2000000 --seed 1 --clients {clients} --duration {duration} -wl movr --param {benchmark_params} 2>&1 | tee {short_benchmark_log}"
 
 if workload == 'ycsb':
     single_benchmark_cmd = single_ycsb_benchmark_cmd
@@ -158,6 +168,8 @@ elif workload == 'tpcc':
     single_benchmark_cmd = single_tpcc_benchmark_cmd
 elif workload == 'movr':
     single_benchmark_cmd = single_movr_benchmark_cmd
+# Name the benchmark containers so that their logs are collected from the containers that actually ran
+container_args = f"--benchmark-container {benchmark_container}" + (" --reuse-container" if reuse_container else "")
 
 collect_client_cmd = "python3 tools/admin.py collect_client --config {conf} --out-dir data --tag {tag}"
 
@@ -188,6 +200,31 @@ def get_client_ips_from_conf(conf_path):
     ips_used = list(ips_used)
     return ips_used
 
+def get_region_ips_from_conf(conf_path):
+    with open(conf_path, "r") as f:
+        conf_data = f.readlines()
+    region_ips = []
+    for line in conf_data:
+        if line.startswith('regions: {'):
+            region_ips.append([])
+        elif '    addresses: ' in line:
+            region_ips[-1].append(line.split('    addresses: "')[1].split('"')[0])
+        elif '    client_addresses: ' in line:
+            region_ips[-1].append(line.split('    client_addresses: "')[1].split('"')[0])
+    return [list(dict.fromkeys(ips)) for ips in region_ips]
+
+def load_netem_matrices():
+    # Returns the RTT, loss and bandwidth matrices (None if not given) of the regions of the '.conf' file
+    regions = args.matrix_regions.split(';') if args.matrix_regions else None
+    matrices = []
+    for path in (args.rtt_matrix, args.loss_matrix, args.bandwidth_matrix):
+        if path is None:
+            matrices.append(None)
+            continue
+        names, matrix = netem.read_region_matrix(path)
+        matrices.append(netem.select_regions(names, matrix, regions))
+    return matrices
+
 def get_network_interfaces(ips_used):
     interface = run_subprocess(BASIC_IFTOP_CMD).stdout.split('\n')[0].split('interface: ')[1]
     print(f"This machine uses the network interface: {interface}")
@@ -202,30 +239,29 @@ def get_network_interfaces(ips_used):
         except:
             print(f"Unable to find interface for IP: {ip}")
 
-def start_net_monitor(user, interfaces):
-    for ip, iface in interfaces.items():  # assuming interfaces is a dict {ip: interface}
-        cmd = (
-            f"ssh {user}@{ip} '"
-            f"echo \"timestamp_ms,bytes_sent\" > net_traffic.csv; "
-            f"prev=$(awk '\\''$1 ~ \"{iface}:\" {{print $10}}'\\'' /proc/net/dev); "
-            f"while true; do "
-            f"sleep 1; "
-            f"now=$(date +%s%3N); "
-            f"curr=$(awk '\\''$1 ~ \"{iface}:\" {{print $10}}'\\'' /proc/net/dev); "
-            f"delta=$((curr - prev)); "
-            f"echo \"$now,$delta\" >> net_traffic.csv; "
-            f"prev=$curr; "
-            f"done' > /dev/null 2>&1 &"
-        )
-        result = sp.run(cmd, shell=True)
-        if hasattr(result, "returncode") and result.returncode != 0:
+def stop_net_monitor(user, ips):
+    # The brackets keep pkill from matching the shell running it
+    for ip in ips:
+        sp.run(f"ssh {user}@{ip} 'pkill -f [e]gress_monitor.py; while pgrep -f [e]gress_monitor.py > /dev/null; do sleep 0.1; done'", shell=True)
+
+def start_net_monitor(user, interfaces, peers):
+    # Counts the bytes each server sends to every other machine of the cluster (see 'tools/egress_monitor.py')
+    # Note: this requires passwordless sudo for iptables, e.g. 'omraz ALL=(ALL) NOPASSWD: /usr/sbin/iptables'
+    for ip in interfaces.keys():
+        # A machine can be a server in one region and a client in another one
+        other_ips = ",".join(peer for peer in dict.fromkeys(peers) if peer != ip)
+        result = sp.run(f"scp tools/{EGRESS_MONITOR} {user}@{ip}:{EGRESS_MONITOR}", shell=True)
+        if result.returncode == 0:
+            cmd = f"ssh {user}@{ip} 'nohup python3 {EGRESS_MONITOR} --peers {other_ips} --out {EGRESS_TRAFFIC_FILE} > egress_monitor.log 2>&1 &'"
+            result = sp.run(cmd, shell=True)
+        if result.returncode != 0:
             print(f"Launch network monitoring command in ip '{ip}' failed with exit code {result.returncode}!")
     print("Started network monitoring on all server ips")
 
 def stop_and_collect_monitor(user, interfaces, cur_log_dir):
+    stop_net_monitor(user, interfaces.keys())
     for ip in interfaces.keys():
-        sp.run(f"ssh {user}@{ip} pkill -f net_traffic.csv", shell=True)
-        result = sp.run(f"scp {user}@{ip}:net_traffic.csv {cur_log_dir}/net_traffic_{ip.replace('.', '_')}.csv", shell=True)
+        result = sp.run(f"scp {user}@{ip}:{EGRESS_TRAFFIC_FILE} {cur_log_dir}/egress_traffic_{ip.replace('.', '_')}.csv", shell=True)
         if hasattr(result, "returncode") and result.returncode != 0:
             print(f"Collecting network monitoring command failed with exit code {result.returncode}!")
             break
@@ -268,6 +304,10 @@ ips_used = get_server_ips_from_conf(conf_path=conf)
 client_ips_used = get_client_ips_from_conf(conf_path=conf)
 print(f"The IPs used in this experiment are: {ips_used}")
 get_network_interfaces(ips_used=ips_used)
+if rtt_matrix:
+    region_ips = get_region_ips_from_conf(conf_path=conf)
+    netem_rtt, netem_loss, netem_bandwidth = load_netem_matrices()
+    print(f"Emulating the RTTs of {rtt_matrix} between the {len(region_ips)} regions")
 
 # Check that all network emulation settings are switched off
 print("-------------------------------------------------------------------")
@@ -297,7 +337,7 @@ for system in systems_to_test:
         tag = None
         cur_benchmark_params = benchmark_params.format(x_val, x_val) # Works for: baseline, skew, scalability, network, packet_loss
         cur_clients = clients if clients is not None else x_val
-        cur_benchmark_cmd = single_benchmark_cmd.format(image=image, conf=conf, user=user, clients=cur_clients, duration=duration, benchmark_params=cur_benchmark_params, short_benchmark_log=short_benchmark_log)
+        cur_benchmark_cmd = single_benchmark_cmd.format(image=image, conf=conf, user=user, container_args=container_args, clients=cur_clients, duration=duration, benchmark_params=cur_benchmark_params, short_benchmark_log=short_benchmark_log)
         print(f"\n>>> Running: {cur_benchmark_cmd}")
         if scenario == 'network':
             # Emulate the network conditions first
@@ -310,14 +350,25 @@ for system in systems_to_test:
             loss = f"{x_val}%"
         # Note: the netem command may require allowing passwordless sudo for tc commands
         # I.e., add something like 'omraz ALL=(ALL) NOPASSWD: /usr/sbin/tc' to 'sudo visudo'
-        if scenario == 'network' or scenario == 'packet_loss':
+        if rtt_matrix:
+            # The servers get one netem class per destination region instead of a single delay for all destinations
+            offset_ms = x_val if scenario == 'network' else 0
+            jitter_ms = int(x_val / 10) if scenario == 'network' else 0
+            extra_loss_pct = x_val if scenario == 'packet_loss' else 0
+            programs = netem.compile_topology(region_ips, netem_rtt, interfaces, netem_loss, netem_bandwidth, offset_ms, jitter_ms, extra_loss_pct)
+            failures = simulate_network.apply_topology(programs, user=user)
+            if failures and not dry_run:
+                print(f"Unable to emulate the network on {list(failures)}, stopping!")
+                break
+            print(f"All servers emulating the regions of {rtt_matrix} with an additional delay of {offset_ms}ms, jitter of {jitter_ms}ms, and packet loss of {extra_loss_pct}%")
+        elif scenario == 'network' or scenario == 'packet_loss':
             simulate_network.apply_netem(delay=delay, jitter=jitter, loss=loss, ips=interfaces, user=user)
             print(f"All servers simulating an additional delay of {delay}, jitter of {jitter}, and packet loss of {loss}")
         # End any leftover monitoring, and start a new monitoring of the outbound traffic on remote machines
-        for ip in interfaces.keys():
-            sp.run(f"ssh {user}@{ip} pkill -f net_traffic.csv", shell=True)
-        start_net_monitor(user=user, interfaces=interfaces)
+        stop_net_monitor(user=user, ips=interfaces.keys())
+        start_net_monitor(user=user, interfaces=interfaces, peers=list(dict.fromkeys(ips_used + client_ips_used)))
         # THE ACTUAL EXPERIMENT RUN
+        run_start = time.time()
         result = run_subprocess(cur_benchmark_cmd, dry_run) #sp.run(cur_benchmark_cmd, shell=True, capture_output=True, text=True)
         # Print and collect output
         benchmark_cmd_log = ['']
@@ -345,7 +396,7 @@ for system in systems_to_test:
             for line in benchmark_cmd_log:
                 f.write(f"{line}\n")
         # Remove any network restrictions
-        if scenario == 'network' or scenario == 'packet_loss':
+        if rtt_matrix or scenario == 'network' or scenario == 'packet_loss':
             # Remove emulated network conditions first
             simulate_network.remove_netem(ips=interfaces, user=user)
             print(f"Network settings on all servers back to normal!")
@@ -354,7 +405,9 @@ for system in systems_to_test:
         if hasattr(result, "returncode") and result.returncode != 0:
             print(f"collect_client command failed with exit code {result.returncode}!")
             break
-        collect_benchmark_container_cmd = f"docker container logs {benchmark_container} 2>&1"
+        # A warm container keeps the output of all the runs, so only the part written during this one is collected
+        collect_benchmark_container_cmd = (f"docker container logs --since {run_start:.3f} {benchmark_container}_warm 2>&1" if reuse_container
+                                           else f"docker container logs {benchmark_container} 2>&1")
         # Collect logs from all the benchmark container (for throughput)
         client_count = 0
         for client in client_ips_used:
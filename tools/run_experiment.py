@@ -18,11 +18,12 @@ from pprint import pprint
 import google.protobuf.text_format as text_format
 
 import admin
+from sweep_scheduler import DEFAULT_CLIENTS_PER_POINT, plan_jobs, run_packed
 from proto.configuration_pb2 import Configuration, Region
 
 LOG = logging.getLogger("experiment")
 
-def generate_config(settings: dict, template_path: str, orig_num_partitions: int, num_log_mangers: int):
+def generate_config(settings: dict, template_path: str, orig_num_partitions: int, num_log_mangers: int, config_suffix: str = ""):
     config = Configuration()
     with open(template_path, "r") as f:
         text_format.Parse(f.read(), config)
@@ -90,56 +91,72 @@ def generate_config(settings: dict, template_path: str, orig_num_partitions: int
     config_filename, config_ext = os.path.splitext(os.path.basename(template_path))
     if orig_num_partitions is not None:
         config_filename += f"-{orig_num_partitions}"
+    # Configs generated for concurrent jobs must not overwrite each other
+    config_filename += config_suffix
     config_path = os.path.join(gettempdir(), f"{config_filename}{config_ext}")
     with open(config_path, "w") as f:
         text_format.PrintMessage(config, f)
 
     return config_path
 
-def cleanup(username: str, config_path: str, image: str):
+def cleanup(username: str, config_path: str, image: str, reuse_container: bool = False, pull: bool = True):
     LOG.info("STOP ANY RUNNING EXPERIMENT")
     # fmt: off
-    admin.main(
-        [
-            "benchmark",
-            config_path,
-            "--user", username,
-            "--image", image,
-            "--cleanup",
-            "--clients", "1",
-            "--txns", "0",
-        ]
-    )
+    cleanup_cmd = [
+        "benchmark",
+        config_path,
+        "--user", username,
+        "--image", image,
+        "--cleanup",
+        "--clients", "1",
+        "--txns", "0",
+    ]
     # fmt: on
-
-def start_server(username: str, config_path: str, image: str, binary="slog"):
+    if reuse_container:
+        # Keeps (or creates) the warm benchmark containers, only stopping what runs in them
+        cleanup_cmd.append("--reuse-container")
+    if not pull:
+        cleanup_cmd.append("--no-pull")
+    admin.main(cleanup_cmd)
+
+def start_server(username: str, config_path: str, image: str, binary="slog", client_container: str = None):
     start_server_cmd = ["start", config_path, "--user", username, "--image", image, "--bin", binary]
     LOG.info("START SERVERS with command %s", start_server_cmd)
     admin.main(start_server_cmd)
 
     wait_for_servers_up_cmd = ["collect_server", config_path, "--user", username, "--image", image, "--flush-only", "--no-pull"]
+    if client_container is not None:
+        # The local client containers of concurrent jobs must have different names
+        wait_for_servers_up_cmd += ["--client-container", client_container]
     LOG.info("WAIT FOR ALL SERVERS TO BE ONLINE with command %s", wait_for_servers_up_cmd)
     admin.main(wait_for_servers_up_cmd)
 
-def collect_client_data(username: str, config_path: str, out_dir: str, tag: str):
+def collect_client_data(username: str, config_path: str, out_dir: str, tag: str, columnar: bool = False, resume: bool = False):
     collect_client_cmd = ["collect_client", config_path, tag, "--user", username, "--out-dir", out_dir]
+    if columnar:
+        collect_client_cmd.append("--columnar")
+    if resume:
+        # Only fetch what has not been tailed during the benchmark
+        collect_client_cmd.append("--resume")
     LOG.info("Collecting server data with command %s", collect_client_cmd)
     admin.main(collect_client_cmd)
 
-def collect_server_data(username: str, config_path: str, image: str, out_dir: str, tag: str):
+def collect_server_data(username: str, config_path: str, image: str, out_dir: str, tag: str, client_container: str = None):
     # fmt: off
     # The image has already been pulled when starting the servers, so use "--no-pull"
     collect_server_cmd = ["collect_server", config_path, "--tag", tag, "--user", username, "--image", image,"--out-dir", out_dir, "--no-pull"]
+    if client_container is not None:
+        collect_server_cmd += ["--client-container", client_container]
     LOG.info("Collecting server data with command %s", collect_server_cmd)
     admin.main(collect_server_cmd)
     # fmt: on
 
-def collect_data(username: str, config_path: str, image: str, out_dir: str, tag: str, no_client_data: bool, no_server_data: bool):
+def collect_data(username: str, config_path: str, image: str, out_dir: str, tag: str, no_client_data: bool, no_server_data: bool, columnar: bool = False, resume_client_data: bool = False, client_container: str = None):
     collectors = []
     if not no_client_data:
-        collectors.append(Process(target=collect_client_data, args=(username, config_path, out_dir, tag)))
+        collectors.append(Process(target=collect_client_data, args=(username, config_path, out_dir, tag, columnar, resume_client_data)))
     if not no_server_data:
-        collectors.append(Process(target=collect_server_data, args=(username, config_path, image, out_dir, tag)))
+        collectors.append(Process(target=collect_server_data, args=(username, config_path, image, out_dir, tag, client_container)))
     for p in collectors:
         p.start()
     for p in collectors:
@@ -224,6 +241,7 @@ class Experiment:
         <experiment name>: {
             "servers": [ { "config": string, "image": string } ], // A list of objects containing path to a config file and the Docker image used
             "workload": string,                                   // Name of the workload to use in this experiment
+            "clients_per_point": int,                             // With --pack, number of client machines per region used by each point (default 1)
 
             // Parameters of the experiment. All possible combinations of the parameters 
             // will be generated and possibly modified by "exclude" and "include". This is
@@ -245,6 +263,9 @@ class Experiment:
     """
 
     NAME = ""
+    # Whether the points can run concurrently on disjoint subsets of the machines (--pack). Not
+    # the case when the hooks act on all the machines at once
+    PACKABLE = True
     # Parameters of the workload
     WORKLOAD_PARAMS = []
     # Parameters of the benchmark tool and the environment other than the 'params' argument
@@ -300,6 +321,11 @@ class Experiment:
         num_log_managers = workload_settings.get("num_log_managers", None)
 
         LOG.info('Will run the following DB configs: %s', workload_settings["servers"])
+        if args.pack:
+            cls._run_packed(args, settings, settings_dir, num_parts_to_values, num_log_managers)
+            return
+
+        pulled_images = set()
         for server in workload_settings["servers"]:
             template_path = os.path.join(settings_dir, server["config"])
             # Special config that contains all server ip addresses
@@ -309,7 +335,15 @@ class Experiment:
                 config_path = generate_config(settings, template_path, num_partitions, num_log_managers)
                 cls.post_config_gen_hook(settings, config_path, args.dry_run)
                 LOG.info('============ GENERATED CONFIG "%s" ============', config_path)
-                cleanup(settings["username"], cleanup_config_path, server["image"])
+                # The image only needs to be checked once per run on the clients
+                cleanup(
+                    settings["username"],
+                    cleanup_config_path,
+                    server["image"],
+                    reuse_container=args.reuse_containers,
+                    pull=server["image"] not in pulled_images,
+                )
+                pulled_images.add(server["image"])
 
                 if not args.skip_starting_server:
                     start_server(settings["username"], config_path, server["image"], server.get("binary", "slog"))
@@ -323,21 +357,65 @@ class Experiment:
                 cls._run_benchmark(args, server["image"], settings, config_path, config_name, values)
 
     @classmethod
-    def _run_benchmark(cls, args, image, settings, config_path, config_name, values):
+    def _run_packed(cls, args, settings, settings_dir, num_parts_to_values, num_log_managers):
+        """Runs the points of each server concurrently on disjoint subsets of the machines"""
+        if not cls.PACKABLE:
+            raise RuntimeError(f'Experiment "{cls.NAME}" cannot run with --pack')
+
+        workload_settings = settings[cls.NAME]
+        clients_per_point = workload_settings.get("clients_per_point", DEFAULT_CLIENTS_PER_POINT)
+        jobs = plan_jobs(num_parts_to_values, settings, clients_per_point)
+        # The tags must be the same as when the points are run one after the other
+        tag_keys = {
+            num_partitions: cls._tag_keys(args, values) for num_partitions, values in num_parts_to_values.items()
+        }
+        LOG.info("Packed %d point(s) into %d job(s)", sum(len(job.values) for job in jobs), len(jobs))
+
+        for server in workload_settings["servers"]:
+            template_path = os.path.join(settings_dir, server["config"])
+            cleanup_config_path = generate_config(settings, template_path, None, num_log_managers)
+            cleanup(settings["username"], cleanup_config_path, server["image"], reuse_container=args.reuse_containers)
+
+            def run_job(job, job_settings):
+                config_path = generate_config(job_settings, template_path, job.num_partitions, num_log_managers, f"-job{job.id}")
+                cls.post_config_gen_hook(job_settings, config_path, args.dry_run)
+                LOG.info('============ GENERATED CONFIG "%s" FOR JOB %d ============', config_path, job.id)
+                client_container = f"{admin.SLOG_CLIENT_CONTAINER_NAME}_job{job.id}"
+                if not args.skip_starting_server:
+                    start_server(settings["username"], config_path, server["image"], server.get("binary", "slog"), client_container)
+
+                config_name = os.path.splitext(os.path.basename(server["config"]))[0]
+                if job.num_partitions is not None:
+                    config_name += f"-sz{job.num_partitions}"
+
+                cls._run_benchmark(args, server["image"], job_settings, config_path, config_name, job.values,
+                                   tag_keys[job.num_partitions], client_container)
+
+            failed = run_packed(jobs, settings, run_job)
+            if failed:
+                raise RuntimeError(f'{len(failed)} job(s) failed for "{server["config"]}": {[job.values for job in failed]}')
+
+    @classmethod
+    def _tag_keys(cls, args, values):
+        if args.tag_keys is not None:
+            return args.tag_keys
+        # Only use keys that have varying values
+        params = cls.OTHER_PARAMS + cls.WORKLOAD_PARAMS
+        return [
+            k for k in params if
+            any([v[k] != values[0][k] for v in values])
+        ]
+
+    @classmethod
+    def _run_benchmark(cls, args, image, settings, config_path, config_name, values, tag_keys=None, client_container=None):
         LOG.info('Running benchmark!')
         out_dir = os.path.join(args.out_dir, cls.NAME if args.name is None else args.name)
         sample = settings.get("sample", 10)
         trials = settings.get("trials", 1)
         workload_settings = settings[cls.NAME]
-        params = cls.OTHER_PARAMS + cls.WORKLOAD_PARAMS
 
-        tag_keys = args.tag_keys
         if tag_keys is None:
-            # Only use keys that have varying values
-            tag_keys = [
-                k for k in params if
-                any([v[k] != values[0][k] for v in values])
-            ]
+            tag_keys = cls._tag_keys(args, values)
 
         for val in values:
             cls.pre_run_per_val_hook(val, args.dry_run)
@@ -372,12 +450,18 @@ class Experiment:
                     # The image has already been pulled in the cleanup step
                     "--no-pull",
                 ]
+                if args.reuse_containers:
+                    benchmark_args.append("--reuse-container")
+                tail_client_data = args.tail_client_data and not args.no_client_data
+                if tail_client_data:
+                    benchmark_args += ["--tail-to", out_dir]
                 LOG.info("RUN BENCHMARK with config %s", benchmark_args)
                 # fmt: on
                 admin.main(benchmark_args)
 
                 LOG.info("COLLECT DATA")
-                collect_data(settings["username"], config_path, image, out_dir, tag, args.no_client_data, args.no_server_data)
+                collect_data(settings["username"], config_path, image, out_dir, tag, args.no_client_data, args.no_server_data, args.columnar, tail_client_data,
+                             client_container)
 
         if args.dry_run:
             pprint([{ k:v for k, v in p.items() if k in tag_keys} for p in values])
@@ -431,6 +515,8 @@ class YCSBLatencyExperiment(Experiment):
 
 class YCSBNetworkExperiment(Experiment):
     ec2_region = ""
+    # The netem scripts are run on all servers
+    PACKABLE = False
 
     DELAY = [
         [0.1, 6, 33, 38, 74, 87, 106, 99],
@@ -635,6 +721,12 @@ if __name__ == "__main__":
     parser.add_argument("-sk", "--skip-starting-server", action="store_true", help="Skip starting server step")
     parser.add_argument("-nc", "--no-client-data", action="store_true", help="Don't collect client data")
     parser.add_argument("-ns", "--no-server-data", action="store_true", help="Don't collect server data")
+    parser.add_argument("-co", "--columnar", action="store_true", help="Convert the collected client data into Parquet files")
+    parser.add_argument("-rc", "--reuse-containers", action="store_true", help="Run all benchmarks in long-lived containers on the clients "
+                        "instead of creating a container per run")
+    parser.add_argument("-tc", "--tail-client-data", action="store_true", help="Fetch the client data while the benchmarks are running")
+    parser.add_argument("-pk", "--pack", action="store_true", help="Run the points that need only part of the cluster concurrently "
+                        "on disjoint subsets of the machines")
     parser.add_argument("-se", "--seed", default=1, help="Seed for the random engine")
     args = parser.parse_args()
 
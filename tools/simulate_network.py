@@ -1,6 +1,24 @@
 import subprocess as sp
 import time
 
+import netem
+from orchestrator import Orchestrator
+
+# Attempts at applying the program of a host before giving up on it
+APPLY_RETRIES = 2
+
+def _ssh_target(ip, user):
+    return f"{user}@{ip}" if user else ip
+
+def _run_on_hosts(phase, ips, run):
+    """
+    Runs 'run' on every ip concurrently.
+    :return: Dict from every ip to the result of 'run', or to its exception if it raised one.
+    """
+    ips = list(ips)
+    results = Orchestrator().run_phase(phase, run, ips, raise_errors=False)
+    return dict(zip(ips, results))
+
 def apply_netem(delay="100ms", jitter="10ms", loss="0%", ips=None, user=None):
     """
     Applies network emulation (netem) settings on the given interface, locally or over SSH.
@@ -12,13 +30,12 @@ def apply_netem(delay="100ms", jitter="10ms", loss="0%", ips=None, user=None):
     """
     if ips:
         print("Applying netem on remote machines.")
-        for ip in list(ips.keys()):
+        def apply(ip):
             netem_cmd = f"sudo tc qdisc add dev {ips[ip]} root netem delay {delay} {jitter} loss {loss}"
-            ssh_target = f"{user}@{ip}" if user else ip
-            print(f"Applying netem to {ssh_target} with command: {netem_cmd}")
-            ssh_cmd = f"ssh {ssh_target} '{netem_cmd}'"
-            result = sp.run(ssh_cmd, shell=True)
-            if result.returncode != 0:
+            print(f"Applying netem to {_ssh_target(ip, user)} with command: {netem_cmd}")
+            return sp.run(f"ssh {_ssh_target(ip, user)} '{netem_cmd}'", shell=True)
+        for ip, result in _run_on_hosts("apply_netem", ips.keys(), apply).items():
+            if isinstance(result, BaseException) or result.returncode != 0:
                 print(f"⚠️ Failed to apply netem on {ip}")
             else:
                 print(f"✅ Netem applied on {ip}")
@@ -32,6 +49,40 @@ def apply_netem(delay="100ms", jitter="10ms", loss="0%", ips=None, user=None):
         sp.run(netem_cmd, check=True)
         print(f"✅ Netem applied locally with delay={delay}, jitter={jitter}, loss={loss}")
 
+def apply_topology(programs, user=None, verify=True):
+    """
+    Applies the netem program of every host (see 'netem.compile_topology') over SSH, concurrently, and checks
+    that the qdiscs and filters in place are those of the program. A host is retried APPLY_RETRIES times.
+    :param programs: Dict from the IP address of a host to its netem.NetemProgram.
+    :param user: SSH username to use for remote access.
+    :param verify: Whether to read back the tc configuration of every host.
+    :return: Dict from the IP address of every host whose program could not be applied to the reason.
+    """
+    def apply(ip):
+        program = programs[ip]
+        # The script removes the previous root qdisc itself, so it can be applied again
+        result = sp.run(f"ssh {_ssh_target(ip, user)} 'sudo sh -s'", shell=True, input=netem.program_script(program),
+                        capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"tc failed with exit code {result.returncode}: {result.stderr.strip()}")
+        if verify:
+            qdiscs = sp.run(f"ssh {_ssh_target(ip, user)} 'tc qdisc show dev {program.dev}'", shell=True, capture_output=True, text=True)
+            filters = sp.run(f"ssh {_ssh_target(ip, user)} 'tc filter show dev {program.dev}'", shell=True, capture_output=True, text=True)
+            problems = netem.verify_program(program, qdiscs.stdout, filters.stdout)
+            if problems:
+                raise RuntimeError("; ".join(problems))
+
+    print(f"Applying the netem programs of {len(programs)} machines.")
+    results = Orchestrator().run_phase("apply_topology", apply, list(programs), retries=APPLY_RETRIES, raise_errors=False)
+    failures = {}
+    for ip, result in zip(programs, results):
+        if isinstance(result, BaseException):
+            print(f"⚠️ Failed to apply the netem program on {ip}: {result}")
+            failures[ip] = str(result)
+        else:
+            print(f"✅ Netem program with {len(programs[ip].netems)} link(s) applied on {ip}")
+    return failures
+
 def remove_netem(ips=None, user=None):
     """
     Removes netem settings from the given network interface, locally or via SSH.
@@ -40,13 +91,11 @@ def remove_netem(ips=None, user=None):
     """
     if ips:
         print("Removing netem on remote machines.")
-        for ip in ips:
-            netem_cmd = f"sudo tc qdisc del dev {ips[ip]} root"
-            ssh_target = f"{user}@{ip}" if user else ip
-            print(f"Removing netem from {ssh_target}...")
-            ssh_cmd = f"ssh {ssh_target} '{netem_cmd}'"
-            result = sp.run(ssh_cmd, shell=True)
-            if result.returncode != 0:
+        def remove(ip):
+            print(f"Removing netem from {_ssh_target(ip, user)}...")
+            return sp.run(f"ssh {_ssh_target(ip, user)} 'sudo tc qdisc del dev {ips[ip]} root'", shell=True)
+        for ip, result in _run_on_hosts("remove_netem", ips.keys(), remove).items():
+            if isinstance(result, BaseException) or result.returncode != 0:
                 print(f"⚠️ Failed to remove netem on {ip}")
             else:
                 print(f"✅ Netem removed from {ip}")
@@ -69,13 +118,12 @@ def netem_status(ips=None, user=None):
     status_outputs = []
     if ips:
         print("Checking current netem status on remote machines...")
-        for ip in list(ips.keys()):
-            netem_cmd = f"tc qdisc show dev {ips[ip]}"
-            ssh_target = f"{user}@{ip}" if user else ip
-            ssh_cmd = f"ssh {ssh_target} '{netem_cmd}'"
-            result = sp.run(ssh_cmd, shell=True, capture_output=True, text=True)
-            print(f"Netem status at {ip}: {result.stdout}")
-            status_outputs.append(result.stdout)
+        def status(ip):
+            return sp.run(f"ssh {_ssh_target(ip, user)} 'tc qdisc show dev {ips[ip]}'", shell=True, capture_output=True, text=True)
+        for ip, result in _run_on_hosts("netem_status", ips.keys(), status).items():
+            output = "" if isinstance(result, BaseException) else result.stdout
+            print(f"Netem status at {ip}: {output}")
+            status_outputs.append(output)
     else:
         interface = sp.run('iftop 2>&1', shell=True, capture_output=True, text=True).stdout.split('\n')[0].split('interface: ')[1]
         print(f"Checking current netem status on local machine {interface}...")
@@ -0,0 +1,135 @@
+"""Packing of the points of an experiment sweep onto disjoint subsets of the machines
+
+A point that only needs a few partitions per region leaves most of the cluster idle. The points
+of a sweep are grouped into jobs, each needing a number of server slots and of client machines
+per region, and the jobs run concurrently as long as the machines they need are free. A slot
+is the same index in the server lists of every region, so a job of p partitions gets the same
+p indices in all regions. As soon as a job finishes, its machines go to the next pending jobs
+that fit, largest first.
+"""
+import collections
+import copy
+import logging
+import multiprocessing
+import multiprocessing.connection
+
+LOG = logging.getLogger("sweep_scheduler")
+
+# Number of client machines per region used by a point, unless set in the settings
+DEFAULT_CLIENTS_PER_POINT = 1
+
+SweepJob = collections.namedtuple(
+    "SweepJob",
+    [
+        "id",
+        "num_partitions",  # None to use the whole cluster
+        "values",          # points of the sweep run one after the other by the job
+        "num_servers",     # server slots needed in every region
+        "num_clients",     # client machines needed in every region
+    ],
+)
+
+
+def capacity(settings):
+    """Number of server slots and of client machines available in every region"""
+    regions = settings["regions"]
+    num_servers = min(
+        min(len(settings["servers_public"][r]), len(settings["servers_private"][r])) for r in regions
+    )
+    num_clients = min(len(settings["clients"][r]) for r in regions)
+    return num_servers, num_clients
+
+
+def plan_jobs(num_parts_to_values, settings, clients_per_point=DEFAULT_CLIENTS_PER_POINT):
+    """Splits the points of a sweep into jobs
+
+    The points of a number of partitions are spread over as many jobs as there is room for in the
+    cluster, so that they can run side by side. Points using the whole cluster form a single job.
+
+    @param num_parts_to_values  dict from a number of partitions (or None) to its points
+    @param settings             content of settings.json
+    @param clients_per_point    number of client machines per region used by a point
+    @return                     list of SweepJob, largest first
+    """
+    num_servers, num_clients = capacity(settings)
+    jobs = []
+    for num_partitions, values in num_parts_to_values.items():
+        if num_partitions is None:
+            jobs.append(SweepJob(len(jobs), None, values, num_servers, num_clients))
+            continue
+        if num_partitions > num_servers:
+            raise RuntimeError(f"Not enough servers per region for {num_partitions} partitions ({num_servers} < {num_partitions})")
+        if clients_per_point > num_clients:
+            raise RuntimeError(f"Not enough clients per region ({num_clients} < {clients_per_point})")
+        num_jobs = min(len(values), num_servers // num_partitions, num_clients // clients_per_point)
+        for i in range(num_jobs):
+            jobs.append(SweepJob(len(jobs), num_partitions, values[i::num_jobs], num_partitions, clients_per_point))
+    jobs.sort(key=lambda job: (job.num_servers, job.num_clients), reverse=True)
+    return jobs
+
+
+def subset_settings(settings, server_slots, client_slots):
+    """Copy of settings restricted to the given server slots and client machines"""
+    subset = copy.deepcopy(settings)
+    for r in settings["regions"]:
+        subset["servers_public"][r] = [settings["servers_public"][r][i] for i in server_slots]
+        subset["servers_private"][r] = [settings["servers_private"][r][i] for i in server_slots]
+        subset["clients"][r] = [settings["clients"][r][i] for i in client_slots]
+    return subset
+
+
+def run_packed(jobs, settings, run_job):
+    """Runs the jobs concurrently on disjoint subsets of the machines
+
+    @param jobs      list of SweepJob, started in this order when they fit
+    @param settings  content of settings.json
+    @param run_job   function called in a new process with a job and the settings of its machines.
+                     The processes are forked, so it does not have to be picklable (e.g. a closure)
+    @return          list of the jobs that failed
+    """
+    # The other start methods would pickle run_job, and the default one depends on the platform and
+    # the version of Python
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("Packing the sweep points requires the 'fork' start method, which this platform does not have")
+    context = multiprocessing.get_context("fork")
+    num_servers, num_clients = capacity(settings)
+    free_servers = list(range(num_servers))
+    free_clients = list(range(num_clients))
+    pending = list(jobs)
+    # Sentinel of the process of a job to the job, its process and its machines
+    running = {}
+    failed = []
+
+    while pending or running:
+        for job in list(pending):
+            if job.num_servers > len(free_servers) or job.num_clients > len(free_clients):
+                continue
+            server_slots, free_servers = free_servers[:job.num_servers], free_servers[job.num_servers:]
+            client_slots, free_clients = free_clients[:job.num_clients], free_clients[job.num_clients:]
+            LOG.info(
+                "Starting job %d (%s partitions, %d point(s)) on server slots %s and client machines %s",
+                job.id, job.num_partitions, len(job.values), server_slots, client_slots,
+            )
+            process = context.Process(
+                target=run_job, args=(job, subset_settings(settings, server_slots, client_slots)), name=f"job-{job.id}"
+            )
+            process.start()
+            running[process.sentinel] = (job, process, server_slots, client_slots)
+            pending.remove(job)
+
+        if not running:
+            # Only possible if a job needs more than the whole cluster, which plan_jobs rules out
+            raise RuntimeError(f"{len(pending)} job(s) do not fit in the cluster")
+
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            job, process, server_slots, client_slots = running.pop(sentinel)
+            process.join()
+            if process.exitcode != 0:
+                LOG.error("Job %d failed with exit code %d", job.id, process.exitcode)
+                failed.append(job)
+            else:
+                LOG.info("Job %d done", job.id)
+            free_servers = sorted(free_servers + server_slots)
+            free_clients = sorted(free_clients + client_slots)
+
+    return failed
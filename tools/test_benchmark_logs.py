@@ -0,0 +1,86 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("docker")
+pytest.importorskip("google.protobuf")
+pytest.importorskip("paramiko")
+
+import admin
+from common import LOG_FORMAT
+from orchestrator import Orchestrator
+
+# The metrics of the runs are computed by the scripts of 'plots'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plots"))
+import result_loader
+import run_metrics
+
+CLIENT = "10.0.0.3"
+CONF = """regions: {
+    addresses: "10.0.0.1"
+    client_addresses: "10.0.0.3"
+}
+regions: {
+    addresses: "10.0.0.2"
+}
+"""
+
+
+class FinishedContainer:
+    """The parts of a benchmark Container read by report_start_skew()"""
+
+    name = "benchmark"
+    status = "exited"
+
+    def __init__(self, output):
+        self.output = output
+
+    def logs(self, **kwargs):
+        return self.output.encode()
+
+    def reload(self):
+        pass
+
+
+def test_benchmark_logs_feed_the_skew_report_and_the_cost(tmp_path, caplog):
+    start_ns = time.time_ns() - 40_000_000_000
+    container_output = (
+        f"{admin.BENCHMARK_START_MARKER} {start_ns + 5_000_000}\n"
+        "I1017 12:00:01.123456    42 benchmark.cpp:153] S: 100 (100); C: 98 (98); A: 0 (0); R: 2 (2)\n"
+        f"{admin.BENCHMARK_END_MARKER} {start_ns + 30_000_000_000}\n"
+    )
+    raw_log_dir = tmp_path / "raw_logs"
+    raw_log_dir.mkdir()
+    (raw_log_dir / f"benchmark_container_{CLIENT.replace('.', '_')}.log").write_text(container_output)
+    (raw_log_dir / "cluster.conf").write_text(CONF)
+
+    # The skew report reads the start marker of the container
+    with caplog.at_level(logging.INFO, logger="admin"):
+        admin.report_start_skew(Orchestrator(), [(FinishedContainer(container_output), CLIENT)], start_ns, timeout=1)
+    assert f"{CLIENT}: Started 5.0 ms after the start time" in caplog.text
+
+    # The output of the benchmark command, as captured in 'benchmark_cmd.log' by run_config_on_remote.py
+    parser = argparse.ArgumentParser()
+    admin.add_workload_arguments(parser)
+    args = parser.parse_args(["--txns", "1000", "--duration", "30"])
+    caplog.set_level(logging.INFO, logger="admin")
+    handler = logging.FileHandler(raw_log_dir / "benchmark_cmd.log")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    admin.LOG.addHandler(handler)
+    try:
+        admin.log_benchmark_launch(CLIENT, admin.benchmark_shell_cmd(args, "/data/cluster.conf", 0, 0, "/data/tag", CLIENT))
+    finally:
+        admin.LOG.removeHandler(handler)
+        handler.close()
+
+    runs = pd.DataFrame([{"system": "Detock", "x_val": "0", "path": str(tmp_path)}])
+    timestamps = result_loader.run_timestamps(result_loader.load_container_logs(runs)).loc[("Detock", "0")]
+    assert timestamps["start_ns"] == start_ns + 5_000_000
+    run = next(runs.itertuples(index=False))
+    inputs = run_metrics.cost_inputs(run, "aws", timestamps["start_ns"], timestamps["end_ns"])
+    assert (inputs["duration"] == 30).all()